@@ -111,6 +111,11 @@ export default function ConsistencyVault() {
                             updateProject(currentProject.id, updatedProject);
                             console.log("Asset generated successfully (async)");
 
+                            if (removeGeneratingTask) {
+                                removeGeneratingTask(assetId, generationType);
+                            }
+                        } else if (status.status === "cancelled") {
+                            clearInterval(pollInterval);
                             if (removeGeneratingTask) {
                                 removeGeneratingTask(assetId, generationType);
                             }
@@ -261,6 +266,11 @@ export default function ConsistencyVault() {
                                 removeGeneratingTask(assetId, generationType);
                             }
                             console.log(`[Video Polling] ${generationType} generated successfully`);
+                        } else if (status.status === "cancelled") {
+                            clearInterval(pollInterval);
+                            if (removeGeneratingTask) {
+                                removeGeneratingTask(assetId, generationType);
+                            }
                         } else if (status.status === "failed") {
                             clearInterval(pollInterval);
                             alert(`视频生成失败: ${status.error || '生成失败，请稍后重试'}`);
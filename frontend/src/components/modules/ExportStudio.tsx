@@ -9,6 +9,7 @@ export default function ExportStudio() {
 
     const [isExporting, setIsExporting] = useState(false);
     const [exportUrl, setExportUrl] = useState<string | null>(null);
+    const [subtitlesUrl, setSubtitlesUrl] = useState<string | null>(null);
     const [progress, setProgress] = useState(0);
 
     // Config State
@@ -20,6 +21,7 @@ export default function ExportStudio() {
         if (!currentProject) return;
         setIsExporting(true);
         setExportUrl(null);
+        setSubtitlesUrl(null);
         setProgress(0);
 
         // Simulate progress
@@ -32,6 +34,7 @@ export default function ExportStudio() {
             clearInterval(interval);
             setProgress(100);
             setExportUrl(result.url);
+            setSubtitlesUrl(result.subtitles_url || null);
         } catch (error) {
             console.error("Export failed:", error);
             clearInterval(interval);
@@ -159,6 +162,15 @@ export default function ExportStudio() {
                             >
                                 <Download size={20} /> Download Video
                             </a>
+                            {subtitlesUrl && (
+                                <a
+                                    href={getAssetUrl(subtitlesUrl)}
+                                    target="_blank"
+                                    className="block mt-4 text-sm text-gray-400 hover:text-white underline"
+                                >
+                                    Download .SRT
+                                </a>
+                            )}
                         </div>
                     ) : (
                         <div className="opacity-50">
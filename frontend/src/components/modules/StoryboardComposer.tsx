@@ -50,13 +50,22 @@ export default function StoryboardComposer() {
         }
 
         setIsAnalyzing(true);
+        const projectId = currentProject.id;
+        const previousFrames = currentProject.frames || [];
         try {
-            const updatedProject = await api.analyzeToStoryboard(currentProject.id, text);
-            updateProject(currentProject.id, updatedProject);
+            // Frames appear one by one; the backend swaps them in once the stream completes
+            const updatedProject = await api.analyzeToStoryboardStream(projectId, text, (frame, index) => {
+                const latest = useProjectStore.getState().projects.find((p) => p.id === projectId);
+                const frames = index === 0 ? [] : (latest?.frames || []);
+                updateProject(projectId, { frames: [...frames, frame] });
+            });
+            updateProject(projectId, updatedProject);
             alert(`成功生成 ${updatedProject.frames?.length || 0} 个分镜帧！`);
         } catch (error) {
             console.error("Analyze to storyboard failed:", error);
-            alert("分镜生成失败，请查看控制台了解详情。");
+            // The backend kept the previous storyboard; drop the partial preview
+            updateProject(projectId, { frames: previousFrames });
+            alert("分镜生成失败，已保留原有分镜。请查看控制台了解详情。");
         } finally {
             setIsAnalyzing(false);
         }
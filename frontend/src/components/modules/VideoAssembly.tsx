@@ -2,7 +2,7 @@
 
 import { useState, useEffect, useMemo } from "react";
 import { motion, AnimatePresence } from "framer-motion";
-import { Play, Check, ChevronRight, Loader2, Film, AlertTriangle, Layout, Clock, FileText } from "lucide-react";
+import { Play, Check, ChevronRight, Loader2, Film, AlertTriangle, Layout, Clock, FileText, Eye, X } from "lucide-react";
 import { useProjectStore } from "@/store/projectStore";
 import { api, API_URL } from "@/lib/api";
 import { getAssetUrl } from "@/lib/utils";
@@ -14,6 +14,10 @@ export default function VideoAssembly() {
     const [selectedFrameId, setSelectedFrameId] = useState<string | null>(null);
     const [isMerging, setIsMerging] = useState(false);
     const [mergeError, setMergeError] = useState<string | null>(null);
+    const [mergeTaskId, setMergeTaskId] = useState<string | null>(null);
+    const [mergeProgress, setMergeProgress] = useState<{ percent: number, stage?: string, speed?: number } | null>(null);
+    const [isPreviewing, setIsPreviewing] = useState(false);
+    const [previewUrl, setPreviewUrl] = useState<string | null>(null);
 
     // Group videos by frame
     const videosByFrame = useMemo(() => {
@@ -45,11 +49,36 @@ export default function VideoAssembly() {
         if (!currentProject) return;
         setIsMerging(true);
         setMergeError(null);  // Clear previous errors
+        setMergeProgress({ percent: 0 });
+
+        const reportError = (errorDetail: string) => {
+            setMergeError(errorDetail);
+            // Also show alert for immediate feedback
+            alert(`Failed to merge videos:\n\n${errorDetail}`);
+        };
 
         try {
-            const updatedProject = await api.mergeVideos(currentProject.id);
-            updateProject(currentProject.id, updatedProject);
-            // Success - error will be null, merged video will show below
+            const { task_id: taskId } = await api.mergeVideos(currentProject.id, true);
+            setMergeTaskId(taskId);
+
+            // Poll the background merge until it finishes
+            while (true) {
+                await new Promise((resolve) => setTimeout(resolve, 1000));
+                const status = await api.getTaskStatus(taskId);
+                setMergeProgress({ percent: status.progress || 0, stage: status.stage, speed: status.speed });
+
+                if (status.status === "completed") {
+                    const updatedProject = await api.getProject(currentProject.id);
+                    updateProject(currentProject.id, updatedProject);
+                    // Success - error will be null, merged video will show below
+                    break;
+                } else if (status.status === "failed") {
+                    reportError(status.error || "Unknown error occurred during video merge");
+                    break;
+                } else if (status.status === "cancelled") {
+                    break;
+                }
+            }
         } catch (error: any) {
             console.error("Failed to merge videos:", error);
 
@@ -59,15 +88,45 @@ export default function VideoAssembly() {
                 error.message ||
                 "Unknown error occurred during video merge";
 
-            setMergeError(errorDetail);
-
-            // Also show alert for immediate feedback
-            alert(`Failed to merge videos:\n\n${errorDetail}`);
+            reportError(errorDetail);
         } finally {
             setIsMerging(false);
+            setMergeTaskId(null);
+            setMergeProgress(null);
         }
     };
 
+    const handlePreview = async () => {
+        if (!currentProject) return;
+        setIsPreviewing(true);
+        try {
+            const result = await api.buildPreview(currentProject.id);
+            setPreviewUrl(result.url);
+        } catch (error: any) {
+            console.error("Failed to build preview:", error);
+            alert(`Failed to build preview:\n\n${error.response?.data?.detail || error.message}`);
+        } finally {
+            setIsPreviewing(false);
+        }
+    };
+
+    const handleCancelMerge = async () => {
+        if (!mergeTaskId) return;
+        try {
+            await api.cancelTask(mergeTaskId);
+        } catch (error) {
+            console.error("Failed to cancel merge:", error);
+        }
+    };
+
+
+    // Native HLS (Safari, recent Chrome) starts instantly and seeks by segment; otherwise play the MP4
+    const mergedPlaybackUrl = useMemo(() => {
+        if (!currentProject?.merged_video_url) return null;
+        const canPlayHls = typeof document !== "undefined" &&
+            document.createElement("video").canPlayType("application/vnd.apple.mpegurl") !== "";
+        return getAssetUrl(canPlayHls && currentProject.merged_hls_url ? currentProject.merged_hls_url : currentProject.merged_video_url);
+    }, [currentProject?.merged_video_url, currentProject?.merged_hls_url]);
 
     const selectedFrame = useMemo(() => {
         return currentProject?.frames?.find((f: any) => f.id === selectedFrameId);
@@ -186,7 +245,32 @@ export default function VideoAssembly() {
                     </div>
 
                     {/* Bottom Action Bar */}
-                    <div className="h-20 border-t border-white/10 bg-black/40 backdrop-blur flex items-center justify-end px-8">
+                    <div className="h-20 border-t border-white/10 bg-black/40 backdrop-blur flex items-center justify-end gap-4 px-8">
+                        {isMerging && mergeProgress && (
+                            <div className="flex items-center gap-3 text-xs text-gray-400">
+                                <div className="w-40 h-1.5 bg-white/10 rounded-full overflow-hidden">
+                                    <div className="h-full bg-primary transition-all" style={{ width: `${mergeProgress.percent}%` }} />
+                                </div>
+                                <span className="font-mono">
+                                    {Math.round(mergeProgress.percent)}%
+                                    {mergeProgress.stage ? ` · ${mergeProgress.stage}` : ""}
+                                    {mergeProgress.speed ? ` · ${mergeProgress.speed.toFixed(1)}x` : ""}
+                                </span>
+                                {mergeTaskId && (
+                                    <button onClick={handleCancelMerge} className="text-gray-400 hover:text-white underline">
+                                        Cancel
+                                    </button>
+                                )}
+                            </div>
+                        )}
+                        <button
+                            onClick={handlePreview}
+                            disabled={isPreviewing}
+                            className="bg-white/10 hover:bg-white/20 text-white px-6 py-3 rounded-xl font-bold flex items-center gap-2 disabled:opacity-50 disabled:cursor-not-allowed"
+                        >
+                            {isPreviewing ? <Loader2 className="animate-spin" /> : <Eye />}
+                            Quick Preview
+                        </button>
                         <button
                             onClick={handleMerge}
                             disabled={isMerging}
@@ -311,6 +395,36 @@ export default function VideoAssembly() {
                 </div>
             </div>
 
+            {/* Quick Preview (360p proxies) */}
+            <AnimatePresence>
+                {previewUrl && (
+                    <motion.div
+                        initial={{ opacity: 0 }}
+                        animate={{ opacity: 1 }}
+                        exit={{ opacity: 0 }}
+                        className="fixed inset-0 z-50 bg-black/80 flex items-center justify-center p-8"
+                        onClick={() => setPreviewUrl(null)}
+                    >
+                        <div className="relative w-full max-w-4xl" onClick={(e) => e.stopPropagation()}>
+                            <button
+                                onClick={() => setPreviewUrl(null)}
+                                className="absolute -top-10 right-0 text-gray-400 hover:text-white"
+                            >
+                                <X />
+                            </button>
+                            <video
+                                key={previewUrl}
+                                src={getAssetUrl(previewUrl)}
+                                className="w-full max-h-[80vh] bg-black rounded-xl border border-white/10"
+                                controls
+                                autoPlay
+                            />
+                            <p className="text-xs text-gray-500 mt-2">Low-resolution preview. Use Merge & Proceed for the full-quality video.</p>
+                        </div>
+                    </motion.div>
+                )}
+            </AnimatePresence>
+
             {/* Bottom Section: Merged Video Preview */}
             <AnimatePresence>
                 {currentProject?.merged_video_url && (
@@ -324,7 +438,7 @@ export default function VideoAssembly() {
                             {/* Video Player */}
                             <div className="w-1/3 aspect-video bg-black rounded-xl overflow-hidden border border-white/10 shadow-lg relative group">
                                 <video
-                                    src={getAssetUrl(currentProject.merged_video_url)}
+                                    src={mergedPlaybackUrl || undefined}
                                     className="w-full h-full object-contain"
                                     controls
                                     autoPlay
@@ -30,10 +30,11 @@ export interface VideoTask {
     project_id: string;
     image_url: string;
     prompt: string;
-    status: "pending" | "processing" | "completed" | "failed";
+    status: "pending" | "processing" | "completed" | "failed" | "cancelled";
     video_url?: string;
     duration: number;
     seed?: number;
+    bypass_cache?: boolean;
     resolution: string;
     generate_audio: boolean;
     audio_url?: string;
@@ -100,7 +101,8 @@ export const api = {
         frameId?: string,
         shotType: string = "single",  // 'single' or 'multi' (only for wan2.6-i2v)
         generationMode: string = "i2v",  // 'i2v' or 'r2v'
-        referenceVideoUrls: string[] = []  // Reference videos for R2V (max 3)
+        referenceVideoUrls: string[] = [],  // Reference videos for R2V (max 3)
+        bypassCache: boolean = false  // Always call the API, even for a cached seeded request
     ) => {
         const res = await axios.post(`${API_URL}/projects/${id}/video_tasks`, {
             image_url,
@@ -117,7 +119,8 @@ export const api = {
             frame_id: frameId,
             shot_type: shotType,
             generation_mode: generationMode,
-            reference_video_urls: referenceVideoUrls
+            reference_video_urls: referenceVideoUrls,
+            bypass_cache: bypassCache
         });
         return res.data;
     },
@@ -194,6 +197,22 @@ export const api = {
         return res.data;
     },
 
+    getMediaInfo: async (url: string) => {
+        // Indexed duration/codec/resolution/size of a local media file
+        const res = await axios.get(`${API_URL}/media/info`, { params: { url } });
+        return res.data;
+    },
+
+    cancelTask: async (taskId: string) => {
+        const res = await axios.post(`${API_URL}/tasks/${taskId}/cancel`);
+        return res.data;
+    },
+
+    cancelProjectTasks: async (scriptId: string, data: { task_ids?: string[], frame_id?: string, asset_id?: string } = {}) => {
+        const res = await axios.post(`${API_URL}/projects/${scriptId}/tasks/cancel`, data);
+        return res.data;
+    },
+
     generateAssetVideo: async (scriptId: string, assetType: string, assetId: string, data: { prompt?: string, duration?: number, aspect_ratio?: string }) => {
         const res = await axios.post(`${API_URL}/projects/${scriptId}/assets/${assetType}/${assetId}/generate_video`, data);
         return res.data;
@@ -304,8 +323,16 @@ export const api = {
         return res.data;
     },
 
-    mergeVideos: async (scriptId: string) => {
-        const res = await axios.post(`${API_URL}/projects/${scriptId}/merge`);
+    mergeVideos: async (scriptId: string, hls?: boolean) => {
+        // Starts a background merge; returns { task_id, status } for polling via getTaskStatus.
+        // hls=true also packages the result as HLS (merged_hls_url) for progressive playback.
+        const res = await axios.post(`${API_URL}/projects/${scriptId}/merge`, null, { params: { hls } });
+        return res.data;
+    },
+
+    buildPreview: async (scriptId: string) => {
+        // Low-res preview assembled from clip proxies; returns { url, clips, created, cached, elapsed }
+        const res = await axios.post(`${API_URL}/projects/${scriptId}/preview`);
         return res.data;
     },
 
@@ -417,6 +444,48 @@ export const api = {
         return res.data;
     },
 
+    /**
+     * Streaming variant of analyzeToStoryboard: calls onFrame for each frame as soon as
+     * the backend has it (NDJSON stream), and resolves with the updated project.
+     * The backend only replaces the storyboard when the stream completes; if it fails,
+     * the project keeps its previous frames.
+     */
+    analyzeToStoryboardStream: async (
+        scriptId: string,
+        text: string,
+        onFrame: (frame: any, index: number) => void
+    ) => {
+        const response = await fetch(`${API_URL}/projects/${scriptId}/storyboard/analyze/stream`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ text }),
+        });
+        if (!response.ok || !response.body) throw new Error("Failed to analyze storyboard");
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let project: any = null;
+        const handleLine = (line: string) => {
+            if (!line.trim()) return;
+            const event = JSON.parse(line);
+            if (event.type === "frame") onFrame(event.frame, event.index);
+            else if (event.type === "done") project = event.script;
+            else if (event.type === "error") throw new Error(event.detail || "Storyboard analysis failed");
+        };
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split("\n");
+            buffer = lines.pop() || "";
+            lines.forEach(handleLine);
+        }
+        handleLine(buffer + decoder.decode());
+        if (!project) throw new Error("Storyboard stream ended unexpectedly");
+        return project;
+    },
+
     /**
      * Refines a raw prompt into bilingual (CN/EN) prompts using AI.
      * Returns { prompt_cn, prompt_en, frame_updated }.
@@ -184,6 +184,7 @@ export interface Project {
     art_direction?: ArtDirection;
     model_settings?: ModelSettings;
     merged_video_url?: string;
+    merged_hls_url?: string;
 }
 
 interface ProjectStore {
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark storyboard merging: legacy single-pass re-encode vs. parallel
+per-clip normalization followed by a stream-copy concat.
+
+Synthetic clips are generated with mixed resolutions so that every run has
+real normalization work. Each run uses an empty segment cache.
+
+Usage:
+    python scripts/benchmark_merge.py [--clips 8] [--duration 5] [--workers 4]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.apps.comic_gen.merge import SegmentCache, VideoMerger, default_ffmpeg_workers
+from src.utils.system_check import get_ffmpeg_path
+
+# Mostly 16:9 720p (the "model output" profile) with a few odd ones out
+SIZES = ["1280x720", "1280x720", "960x540", "1280x720", "720x1280", "1280x720", "1024x576", "1280x720"]
+
+
+def make_clips(ffmpeg_path, work_dir, count, duration):
+    paths = []
+    for i in range(count):
+        size = SIZES[i % len(SIZES)]
+        path = os.path.join(work_dir, f"clip_{i:02d}.mp4")
+        subprocess.run([
+            ffmpeg_path, "-y", "-v", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=24:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency={220 + 40 * i}:sample_rate=44100:duration={duration}",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-shortest", path
+        ], check=True)
+        paths.append(path)
+    return paths
+
+
+def timed(label, fn):
+    start = time.time()
+    fn()
+    elapsed = time.time() - start
+    print(f"{label:<40} {elapsed:8.2f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=default_ffmpeg_workers())
+    parser.add_argument("--aspect-ratio", default="16:9")
+    args = parser.parse_args()
+
+    ffmpeg_path = get_ffmpeg_path()
+    if not ffmpeg_path:
+        print("FFmpeg not found")
+        sys.exit(1)
+
+    work_dir = tempfile.mkdtemp(prefix="lumenx_merge_bench_")
+    try:
+        print(f"Generating {args.clips} clips of {args.duration}s in {work_dir} ...")
+        clips = make_clips(ffmpeg_path, work_dir, args.clips, args.duration)
+        print(f"CPU count: {os.cpu_count()}\n")
+
+        def run_merge(workers):
+            cache_dir = tempfile.mkdtemp(dir=work_dir)
+            merger = VideoMerger(ffmpeg_path, work_dir=work_dir, segment_cache=SegmentCache(cache_dir),
+                                 workers=workers)
+            return merger.merge(clips, os.path.join(work_dir, f"out_w{workers}.mp4"),
+                                aspect_ratio=args.aspect_ratio)
+
+        legacy = VideoMerger(ffmpeg_path, work_dir=work_dir)
+        baseline = timed("legacy single-pass re-encode", lambda: legacy._concat_reencode(
+            clips, os.path.join(work_dir, "out_legacy.mp4"), os.path.join(work_dir, "legacy.txt")))
+        serial = timed("normalize + concat (1 worker)", lambda: run_merge(1))
+        parallel = timed(f"normalize + concat ({args.workers} workers)", lambda: run_merge(args.workers))
+
+        print(f"\nSpeed-up vs legacy: {baseline / parallel:.2f}x  (vs 1 worker: {serial / parallel:.2f}x)")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
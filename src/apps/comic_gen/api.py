@@ -2,12 +2,12 @@ from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, R
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from functools import partial
+import hashlib
+import json
 import os
-import shutil
+import threading
 import uuid
 import logging
 import traceback
@@ -15,8 +15,13 @@ from .pipeline import ComicGenPipeline
 from .models import Script, VideoTask
 from .llm import ScriptProcessor
 from ...utils.oss_utils import OSSImageUploader, sign_oss_urls_in_data
+from ...utils.media_store import get_media_store, media_gc_enabled
+from ...utils.hashing import remember_file_sha256
+from ...utils.executors import FFMPEG, IMAGE, IO, LLM, VIDEO, LoopLagMonitor, run_in, shutdown_executors
+from .media_index import get_media_index, is_time_based
+from .hls import PLAYLIST_NAME, hls_dir_for
 from ...utils import setup_logging
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv, set_key
 
 app = FastAPI(title="AI Comic Gen API")
@@ -72,6 +77,28 @@ app.mount("/files", StaticFiles(directory="output"), name="files")
 # Initialize pipeline
 pipeline = ComicGenPipeline()
 
+# Watches for endpoints that still block the event loop (logs a warning per stall)
+loop_lag_monitor = LoopLagMonitor()
+
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    loop_lag_monitor.start()
+
+
+@app.on_event("startup")
+async def start_media_store_gc():
+    # Drop media blobs no longer referenced by any file (deleted variants/videos)
+    if media_gc_enabled():
+        threading.Thread(target=get_media_store().gc, name="media-store-gc", daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def stop_executors():
+    loop_lag_monitor.stop()
+    shutdown_executors()
+
+
 @app.get("/debug/config")
 async def debug_config():
     """Diagnostic endpoint to check OSS and path configuration."""
@@ -83,6 +110,7 @@ async def debug_config():
         "output_dir_exists": os.path.exists("output"),
         "output_contents": os.listdir("output") if os.path.exists("output") else [],
         "cwd": os.getcwd(),
+        "event_loop": loop_lag_monitor.stats(),
         "env_vars_present": {
             "OSS_ENDPOINT": bool(os.getenv("OSS_ENDPOINT")),
             "OSS_BUCKET_NAME": bool(os.getenv("OSS_BUCKET_NAME")),
@@ -90,15 +118,11 @@ async def debug_config():
         }
     }
 
-def signed_response(data):
-    """Helper to sign OSS URLs in data before returning to frontend.
-    
-    Handles Pydantic models, lists of models, and dicts.
-    Returns a JSONResponse with signed URLs.
-    """
+def signed_content(data):
+    """Converts Pydantic models (or lists of them) to plain data with OSS URLs signed."""
     if data is None:
-        return JSONResponse(content=None)
-    
+        return None
+
     # Convert Pydantic models to dict
     if hasattr(data, "model_dump"):
         processed_data = data.model_dump()
@@ -112,9 +136,17 @@ def signed_response(data):
     if uploader.is_configured:
         # OSS mode: sign URLs in the data
         processed_data = sign_oss_urls_in_data(processed_data, uploader)
+    return processed_data
+
+
+def signed_response(data):
+    """Helper to sign OSS URLs in data before returning to frontend.
     
+    Handles Pydantic models, lists of models, and dicts.
+    Returns a JSONResponse with signed URLs.
+    """
     # Return JSONResponse directly to avoid Pydantic re-validation stripping fields
-    return JSONResponse(content=processed_data)
+    return JSONResponse(content=signed_content(data))
 
 
 @app.get("/system/check")
@@ -127,24 +159,57 @@ async def check_system():
 
 
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _store_upload(src, original_filename: str) -> Tuple[str, str, Optional[str]]:
+    """
+    Saves an uploaded file under output/uploads and pushes it to OSS.
+
+    The body is copied in chunks and hashed while it streams, so media store
+    de-duplication and the OSS content-hash index reuse that digest instead of
+    re-reading the file. OSS uploads of a known hash are skipped; large files
+    go through resumable multipart. Blocking - run it off the event loop.
+    Returns (local url, content hash, object key or None).
+    """
+    filename = f"{uuid.uuid4()}{os.path.splitext(original_filename or '')[1]}"
+    file_path = os.path.join("output/uploads", filename)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    sha256 = hashlib.sha256()
+    tmp_path = f"{file_path}.tmp"
+    try:
+        with open(tmp_path, "wb") as buffer:
+            for chunk in iter(lambda: src.read(UPLOAD_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+                buffer.write(chunk)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    remember_file_sha256(file_path, sha256.hexdigest())
+
+    content_hash = get_media_store().ingest(file_path)
+    if is_time_based(file_path):
+        get_media_index().record(file_path, content_hash)
+
+    object_key = None
+    uploader = OSSImageUploader()
+    if uploader.is_configured:
+        object_key = uploader.upload_input_file(file_path, sub_path="uploads")
+    return f"uploads/{filename}", content_hash, object_key
+
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     """Uploads a file and returns its URL (OSS if configured, else local)."""
     try:
-        file_ext = os.path.splitext(file.filename)[1]
-        filename = f"{uuid.uuid4()}{file_ext}"
-        file_path = os.path.join("output/uploads", filename)
-
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Try uploading to OSS
-        oss_url = OSSImageUploader().upload_image(file_path)
-        if oss_url:
-            return signed_response({"url": oss_url})
+        local_url, _, object_key = await run_in(IO, _store_upload, file.file, file.filename)
+        if object_key:
+            return signed_response({"url": object_key})
 
         # Fallback to local URL (relative path for frontend getAssetUrl)
-        return {"url": f"uploads/{filename}"}
+        return {"url": local_url}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -172,28 +237,21 @@ async def upload_asset(
     - description: Optional modified description for the asset
     """
     try:
-        # 1. Save file locally first
-        file_ext = os.path.splitext(file.filename)[1]
-        filename = f"{uuid.uuid4()}{file_ext}"
-        file_path = os.path.join("output/uploads", filename)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 2. Upload to OSS
-        uploader = OSSImageUploader()
-        oss_url = uploader.upload_image(file_path)
-        if not oss_url:
-            oss_url = f"uploads/{filename}"  # Fallback to local path
+        # 1. Save locally and upload to OSS, off the event loop
+        local_url, content_hash, object_key = await run_in(IO, _store_upload, file.file, file.filename)
+        oss_url = object_key or local_url  # Fallback to local path
         
-        # 3. Update asset with new variant
-        updated_script = pipeline.add_uploaded_asset_variant(
+        # 2. Update asset with new variant
+        updated_script = await run_in(
+            IO,
+            pipeline.add_uploaded_asset_variant,
             script_id=script_id,
             asset_type=asset_type,
             asset_id=asset_id,
             upload_type=upload_type,
             image_url=oss_url,
-            description=description
+            description=description,
+            content_hash=content_hash
         )
         
         if not updated_script:
@@ -216,12 +274,8 @@ class CreateProjectRequest(BaseModel):
 @app.post("/projects", response_model=Script)
 async def create_project(request: CreateProjectRequest, skip_analysis: bool = False):
     """Creates a new project from a novel text."""
-    # Run in thread pool to avoid blocking event loop during LLM analysis (Python 3.8 compatible)
-    loop = asyncio.get_event_loop()
-    result = await loop.run_in_executor(
-        None,  # Use default executor
-        partial(pipeline.create_project, request.title, request.text, skip_analysis)
-    )
+    # LLM analysis runs on the LLM pool to avoid blocking the event loop
+    result = await run_in(LLM, pipeline.create_project, request.title, request.text, skip_analysis)
     return signed_response(result)
 
 
@@ -232,14 +286,10 @@ class ReparseProjectRequest(BaseModel):
 
 @app.put("/projects/{script_id}/reparse", response_model=Script)
 async def reparse_project(script_id: str, request: ReparseProjectRequest):
-    """Re-parses the text for an existing project, replacing all entities."""
+    """Re-parses edited text for an existing project, keeping existing entity IDs."""
     try:
-        # Run the blocking LLM call in a thread pool to avoid blocking the event loop (Python 3.8 compatible)
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None,  # Use default executor
-            partial(pipeline.reparse_project, script_id, request.text)
-        )
+        # The LLM call runs on the LLM pool to avoid blocking the event loop
+        result = await run_in(LLM, pipeline.reparse_project, script_id, request.text)
         return signed_response(result)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -413,7 +463,7 @@ async def delete_project(script_id: str):
     try:
         # Remove from pipeline scripts
         del pipeline.scripts[script_id]
-        pipeline._save_data()
+        await run_in(IO, pipeline._save_data)
         return {"status": "deleted", "id": script_id, "title": script.title}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -430,7 +480,7 @@ async def sync_descriptions(script_id: str):
     Note: This only syncs descriptions; generated images/videos are preserved.
     """
     try:
-        updated_script = pipeline.sync_descriptions_from_script_entities(script_id)
+        updated_script = await run_in(IO, pipeline.sync_descriptions_from_script_entities, script_id)
         return signed_response(updated_script)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -446,7 +496,7 @@ class AddCharacterRequest(BaseModel):
 async def add_character(script_id: str, request: AddCharacterRequest):
     """Adds a new character."""
     try:
-        updated_script = pipeline.add_character(script_id, request.name, request.description)
+        updated_script = await run_in(IO, pipeline.add_character, script_id, request.name, request.description)
         return signed_response(updated_script)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -457,7 +507,7 @@ async def add_character(script_id: str, request: AddCharacterRequest):
 async def delete_character(script_id: str, char_id: str):
     """Deletes a character."""
     try:
-        updated_script = pipeline.delete_character(script_id, char_id)
+        updated_script = await run_in(IO, pipeline.delete_character, script_id, char_id)
         return signed_response(updated_script)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -472,7 +522,7 @@ class AddSceneRequest(BaseModel):
 async def add_scene(script_id: str, request: AddSceneRequest):
     """Adds a new scene."""
     try:
-        updated_script = pipeline.add_scene(script_id, request.name, request.description)
+        updated_script = await run_in(IO, pipeline.add_scene, script_id, request.name, request.description)
         return signed_response(updated_script)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -483,7 +533,7 @@ async def add_scene(script_id: str, request: AddSceneRequest):
 async def delete_scene(script_id: str, scene_id: str):
     """Deletes a scene."""
     try:
-        updated_script = pipeline.delete_scene(script_id, scene_id)
+        updated_script = await run_in(IO, pipeline.delete_scene, script_id, scene_id)
         return signed_response(updated_script)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -499,7 +549,7 @@ class UpdateStyleRequest(BaseModel):
 async def update_project_style(script_id: str, request: UpdateStyleRequest):
     """Updates the global style settings for a project."""
     try:
-        updated_script = pipeline.update_project_style(
+        updated_script = await run_in(IO, pipeline.update_project_style,
             script_id,
             request.style_preset,
             request.style_prompt
@@ -518,14 +568,8 @@ async def generate_assets(script_id: str, background_tasks: BackgroundTasks):
     if not script:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    # Run in background to avoid blocking
-    # For simplicity in this demo, we run synchronously or use background tasks
-    # pipeline.generate_assets(script_id) 
-    # But since we want to return the updated status, we might want to run it and return.
-    # Given the mock nature, it's fast.
-
     try:
-        updated_script = pipeline.generate_assets(script_id)
+        updated_script = await run_in(IMAGE, pipeline.generate_assets, script_id)
         return signed_response(updated_script)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -546,7 +590,7 @@ class GenerateMotionRefRequest(BaseModel):
 async def generate_motion_ref(script_id: str, request: GenerateMotionRefRequest, background_tasks: BackgroundTasks):
     """Generates a Motion Reference video for an asset (Character Full Body/Headshot, Scene, or Prop)."""
     try:
-        script, task_id = pipeline.create_motion_ref_task(
+        script, task_id = await run_in(IO, pipeline.create_motion_ref_task,
             script_id=script_id,
             asset_id=request.asset_id,
             asset_type=request.asset_type,
@@ -557,7 +601,7 @@ async def generate_motion_ref(script_id: str, request: GenerateMotionRefRequest,
         )
         
         # Add background processing
-        background_tasks.add_task(pipeline.process_motion_ref_task, script_id, task_id)
+        background_tasks.add_task(run_in, VIDEO, pipeline.process_motion_ref_task, script_id, task_id)
         
         # Return script with task_id for frontend polling
         response_data = script.model_dump() if hasattr(script, 'model_dump') else script.dict()
@@ -584,7 +628,7 @@ async def analyze_to_storyboard(script_id: str, request: AnalyzeToStoryboardRequ
     Replaces existing frames with newly generated ones.
     """
     try:
-        updated_script = pipeline.analyze_text_to_frames(script_id, request.text)
+        updated_script = await run_in(LLM, pipeline.analyze_text_to_frames, script_id, request.text)
         return signed_response(updated_script)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -593,6 +637,39 @@ async def analyze_to_storyboard(script_id: str, request: AnalyzeToStoryboardRequ
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/projects/{script_id}/storyboard/analyze/stream")
+async def analyze_to_storyboard_stream(script_id: str, request: AnalyzeToStoryboardRequest):
+    """
+    Streaming variant of /storyboard/analyze, as NDJSON (one JSON object per line):
+
+        {"type": "frame", "index": 0, "frame": {...}}   each frame as soon as the LLM wrote it
+        {"type": "done", "script": {...}}               the updated project
+        {"type": "error", "detail": "...", "previous_frames_kept": true}
+
+    The streamed frames replace the project's storyboard only when the stream
+    completes ("done"); on an error the previous frames are left unchanged.
+    """
+    if script_id not in pipeline.scripts:
+        raise HTTPException(status_code=404, detail="Script not found")
+
+    def line(event: Dict[str, Any]) -> bytes:
+        return (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+    async def events():
+        index = 0
+        try:
+            async for frame in pipeline.stream_text_to_frames(script_id, request.text):
+                yield line({"type": "frame", "index": index, "frame": signed_content(frame)})
+                index += 1
+            yield line({"type": "done", "script": signed_content(pipeline.get_script(script_id))})
+        except Exception as e:
+            logger.error(f"Error in analyze_to_storyboard_stream: {e}", exc_info=True)
+            yield line({"type": "error", "detail": str(e), "previous_frames_kept": True})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 class RefinePromptRequest(BaseModel):
     """Request to refine a frame's prompt using AI."""
     frame_id: str
@@ -607,8 +684,10 @@ async def refine_storyboard_prompt(script_id: str, request: RefinePromptRequest)
     Returns the refined prompts and optionally updates the frame.
     """
     try:
-        result = pipeline.refine_frame_prompt(
-            script_id, 
+        result = await run_in(
+            LLM,
+            pipeline.refine_frame_prompt,
+            script_id,
             request.frame_id, 
             request.raw_prompt, 
             request.assets
@@ -625,7 +704,7 @@ async def refine_storyboard_prompt(script_id: str, request: RefinePromptRequest)
 async def generate_storyboard(script_id: str):
     """Triggers storyboard generation."""
     try:
-        updated_script = pipeline.generate_storyboard(script_id)
+        updated_script = await run_in(IMAGE, pipeline.generate_storyboard, script_id)
         return signed_response(updated_script)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -636,7 +715,7 @@ async def generate_storyboard(script_id: str):
 async def generate_video(script_id: str):
     """Triggers video generation."""
     try:
-        updated_script = pipeline.generate_video(script_id)
+        updated_script = await run_in(VIDEO, pipeline.generate_video, script_id)
         return signed_response(updated_script)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -647,7 +726,7 @@ async def generate_video(script_id: str):
 async def generate_audio(script_id: str):
     """Triggers audio generation."""
     try:
-        updated_script = pipeline.generate_audio(script_id)
+        updated_script = await run_in(LLM, pipeline.generate_audio, script_id)
         return signed_response(updated_script)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -660,6 +739,7 @@ class CreateVideoTaskRequest(BaseModel):
     frame_id: Optional[str] = None
     duration: int = 5
     seed: Optional[int] = None
+    bypass_cache: bool = False  # Skip the result cache for seeded repeats
     resolution: str = "720p"
     generate_audio: bool = False
     audio_url: Optional[str] = None
@@ -675,7 +755,7 @@ class CreateVideoTaskRequest(BaseModel):
 async def process_video_task(script_id: str, task_id: str):
     """Background task to generate video."""
     try:
-        pipeline.process_video_task(script_id, task_id)
+        await run_in(VIDEO, pipeline.process_video_task, script_id, task_id)
     except Exception as e:
         logger.error(f"Error processing video task {task_id}: {e}")
 
@@ -686,13 +766,14 @@ async def create_video_task(script_id: str, request: CreateVideoTaskRequest, bac
     try:
         tasks = []
         for _ in range(request.batch_size):
-            script, task_id = pipeline.create_video_task(
+            script, task_id = await run_in(IO, pipeline.create_video_task,
                 script_id=script_id,
                 image_url=request.image_url,
                 prompt=request.prompt,
                 frame_id=request.frame_id,
                 duration=request.duration,
                 seed=request.seed,
+                bypass_cache=request.bypass_cache,
                 resolution=request.resolution,
                 generate_audio=request.generate_audio,
                 audio_url=request.audio_url,
@@ -710,7 +791,7 @@ async def create_video_task(script_id: str, request: CreateVideoTaskRequest, bac
                 tasks.append(created_task)
 
             # Add background processing
-            background_tasks.add_task(pipeline.process_video_task, script_id, task_id)
+            background_tasks.add_task(run_in, VIDEO, pipeline.process_video_task, script_id, task_id)
 
         return signed_response(tasks)
 
@@ -739,7 +820,7 @@ async def generate_single_asset(script_id: str, request: GenerateAssetRequest, b
     """Generates a single asset with specific options (async).
     Returns immediately with task_id for polling progress."""
     try:
-        script, task_id = pipeline.create_asset_generation_task(
+        script, task_id = await run_in(IO, pipeline.create_asset_generation_task,
             script_id,
             request.asset_id,
             request.asset_type,
@@ -755,7 +836,7 @@ async def generate_single_asset(script_id: str, request: GenerateAssetRequest, b
         )
         
         # Add background processing
-        background_tasks.add_task(pipeline.process_asset_generation_task, task_id)
+        background_tasks.add_task(run_in, IMAGE, pipeline.process_asset_generation_task, task_id)
         
         # Return script with task_id for frontend polling
         response_data = script.model_dump() if hasattr(script, 'model_dump') else script.dict()
@@ -784,6 +865,41 @@ async def get_task_status(task_id: str):
     return status
 
 
+@app.post("/tasks/{task_id}/cancel")
+async def cancel_task(task_id: str):
+    """Cancels a queued or in-flight generation task."""
+    try:
+        # Cancelling persists the task state (projects.json), so it runs on the IO pool
+        return await run_in(IO, pipeline.cancel_task, task_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class CancelTasksRequest(BaseModel):
+    task_ids: Optional[List[str]] = None  # None = every active task matching the filters below
+    frame_id: Optional[str] = None
+    asset_id: Optional[str] = None
+
+
+@app.post("/projects/{script_id}/tasks/cancel")
+async def cancel_project_tasks(script_id: str, request: CancelTasksRequest):
+    """Batch-cancels active tasks of a project, optionally filtered by ids, frame or asset."""
+    try:
+        cancelled = await run_in(IO, pipeline.cancel_tasks,
+            script_id,
+            task_ids=request.task_ids,
+            frame_id=request.frame_id,
+            asset_id=request.asset_id
+        )
+        return {"cancelled": cancelled, "count": len(cancelled)}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 class GenerateAssetVideoRequest(BaseModel):
     prompt: Optional[str] = None
     duration: int = 5
@@ -794,7 +910,7 @@ class GenerateAssetVideoRequest(BaseModel):
 async def generate_asset_video(script_id: str, asset_type: str, asset_id: str, request: GenerateAssetVideoRequest, background_tasks: BackgroundTasks):
     """Generates a video for a specific asset (I2V)."""
     try:
-        script, task_id = pipeline.create_asset_video_task(
+        script, task_id = await run_in(IO, pipeline.create_asset_video_task,
             script_id,
             asset_id,
             asset_type,
@@ -804,7 +920,7 @@ async def generate_asset_video(script_id: str, asset_type: str, asset_id: str, r
         )
         
         # Add background processing
-        background_tasks.add_task(pipeline.process_video_task, script_id, task_id)
+        background_tasks.add_task(run_in, VIDEO, pipeline.process_video_task, script_id, task_id)
         
         return signed_response(script)
 
@@ -818,7 +934,7 @@ async def generate_asset_video(script_id: str, asset_type: str, asset_id: str, r
 async def delete_asset_video(script_id: str, asset_type: str, asset_id: str, video_id: str):
     """Deletes a video from an asset."""
     try:
-        updated_script = pipeline.delete_asset_video(
+        updated_script = await run_in(IO, pipeline.delete_asset_video,
             script_id,
             asset_id,
             asset_type,
@@ -841,7 +957,7 @@ class ToggleLockRequest(BaseModel):
 async def toggle_asset_lock(script_id: str, request: ToggleLockRequest):
     """Toggles the locked status of an asset."""
     try:
-        updated_script = pipeline.toggle_asset_lock(
+        updated_script = await run_in(IO, pipeline.toggle_asset_lock,
             script_id,
             request.asset_id,
             request.asset_type
@@ -864,7 +980,7 @@ class UpdateAssetImageRequest(BaseModel):
 async def update_asset_image(script_id: str, request: UpdateAssetImageRequest):
     """Updates an asset's image URL manually."""
     try:
-        updated_script = pipeline.update_asset_image(
+        updated_script = await run_in(IO, pipeline.update_asset_image,
             script_id,
             request.asset_id,
             request.asset_type,
@@ -888,7 +1004,7 @@ class UpdateAssetAttributesRequest(BaseModel):
 async def update_asset_attributes(script_id: str, request: UpdateAssetAttributesRequest):
     """Updates arbitrary attributes of an asset."""
     try:
-        updated_script = pipeline.update_asset_attributes(
+        updated_script = await run_in(IO, pipeline.update_asset_attributes,
             script_id,
             request.asset_id,
             request.asset_type,
@@ -912,7 +1028,7 @@ class UpdateAssetDescriptionRequest(BaseModel):
 async def update_asset_description(script_id: str, request: UpdateAssetDescriptionRequest):
     """Updates an asset's description."""
     try:
-        updated_script = pipeline.update_asset_description(
+        updated_script = await run_in(IO, pipeline.update_asset_description,
             script_id,
             request.asset_id,
             request.asset_type,
@@ -936,7 +1052,7 @@ class SelectVariantRequest(BaseModel):
 async def select_asset_variant(script_id: str, request: SelectVariantRequest):
     """Selects a specific variant for an asset."""
     try:
-        updated_script = pipeline.select_asset_variant(
+        updated_script = await run_in(IO, pipeline.select_asset_variant,
             script_id,
             request.asset_id,
             request.asset_type,
@@ -958,7 +1074,7 @@ class DeleteVariantRequest(BaseModel):
 async def delete_asset_variant(script_id: str, request: DeleteVariantRequest):
     """Deletes a specific variant from an asset."""
     try:
-        updated_script = pipeline.delete_asset_variant(
+        updated_script = await run_in(IO, pipeline.delete_asset_variant,
             script_id,
             request.asset_id,
             request.asset_type,
@@ -982,7 +1098,7 @@ class FavoriteVariantRequest(BaseModel):
 async def toggle_variant_favorite(script_id: str, request: FavoriteVariantRequest):
     """Toggles the favorite status of a variant. Favorited variants won't be auto-deleted when limit is reached."""
     try:
-        updated_script = pipeline.toggle_variant_favorite(
+        updated_script = await run_in(IO, pipeline.toggle_variant_favorite,
             script_id,
             request.asset_id,
             request.asset_type,
@@ -1009,7 +1125,7 @@ class UpdateModelSettingsRequest(BaseModel):
 async def update_model_settings(script_id: str, request: UpdateModelSettingsRequest):
     """Updates project's model settings for T2I/I2I/I2V and aspect ratios."""
     try:
-        updated_script = pipeline.update_model_settings(
+        updated_script = await run_in(IO, pipeline.update_model_settings,
             script_id,
             request.t2i_model,
             request.i2i_model,
@@ -1034,7 +1150,7 @@ class BindVoiceRequest(BaseModel):
 async def bind_voice(script_id: str, char_id: str, request: BindVoiceRequest):
     """Binds a voice to a character."""
     try:
-        updated_script = pipeline.bind_voice(script_id, char_id, request.voice_id, request.voice_name)
+        updated_script = await run_in(IO, pipeline.bind_voice, script_id, char_id, request.voice_id, request.voice_name)
         return signed_response(updated_script)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1055,7 +1171,7 @@ class GenerateLineAudioRequest(BaseModel):
 async def generate_line_audio(script_id: str, frame_id: str, request: GenerateLineAudioRequest):
     """Generates audio for a specific frame with parameters."""
     try:
-        updated_script = pipeline.generate_dialogue_line(script_id, frame_id, request.speed, request.pitch)
+        updated_script = await run_in(LLM, pipeline.generate_dialogue_line, script_id, frame_id, request.speed, request.pitch)
         return signed_response(updated_script)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1068,7 +1184,7 @@ async def generate_mix_sfx(script_id: str):
     # but ideally we'd have granular methods in pipeline.
     # Let's just call generate_audio again, it's idempotent-ish.
     try:
-        updated_script = pipeline.generate_audio(script_id)
+        updated_script = await run_in(LLM, pipeline.generate_audio, script_id)
         return signed_response(updated_script)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1078,7 +1194,7 @@ async def generate_mix_sfx(script_id: str):
 async def generate_mix_bgm(script_id: str):
     """Triggers BGM generation."""
     try:
-        updated_script = pipeline.generate_audio(script_id)
+        updated_script = await run_in(LLM, pipeline.generate_audio, script_id)
         return signed_response(updated_script)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1092,7 +1208,7 @@ class ToggleFrameLockRequest(BaseModel):
 async def toggle_frame_lock(script_id: str, request: ToggleFrameLockRequest):
     """Toggles the locked status of a frame."""
     try:
-        updated_script = pipeline.toggle_frame_lock(
+        updated_script = await run_in(IO, pipeline.toggle_frame_lock,
             script_id,
             request.frame_id
         )
@@ -1116,7 +1232,7 @@ class UpdateFrameRequest(BaseModel):
 async def update_frame(script_id: str, request: UpdateFrameRequest):
     """Updates frame data (prompt, scene, characters, etc.)."""
     try:
-        updated_script = pipeline.update_frame(
+        updated_script = await run_in(IO, pipeline.update_frame,
             script_id,
             request.frame_id,
             image_prompt=request.image_prompt,
@@ -1142,7 +1258,7 @@ class AddFrameRequest(BaseModel):
 async def add_frame(script_id: str, request: AddFrameRequest):
     """Adds a new storyboard frame."""
     try:
-        updated_script = pipeline.add_frame(
+        updated_script = await run_in(IO, pipeline.add_frame,
             script_id, 
             request.scene_id, 
             request.action_description, 
@@ -1159,7 +1275,7 @@ async def add_frame(script_id: str, request: AddFrameRequest):
 async def delete_frame(script_id: str, frame_id: str):
     """Deletes a storyboard frame."""
     try:
-        updated_script = pipeline.delete_frame(script_id, frame_id)
+        updated_script = await run_in(IO, pipeline.delete_frame, script_id, frame_id)
         return signed_response(updated_script)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -1174,7 +1290,7 @@ class CopyFrameRequest(BaseModel):
 async def copy_frame(script_id: str, request: CopyFrameRequest):
     """Copies a storyboard frame."""
     try:
-        updated_script = pipeline.copy_frame(script_id, request.frame_id, request.insert_at)
+        updated_script = await run_in(IO, pipeline.copy_frame, script_id, request.frame_id, request.insert_at)
         return signed_response(updated_script)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -1188,7 +1304,7 @@ class ReorderFramesRequest(BaseModel):
 async def reorder_frames(script_id: str, request: ReorderFramesRequest):
     """Reorders storyboard frames."""
     try:
-        updated_script = pipeline.reorder_frames(script_id, request.frame_ids)
+        updated_script = await run_in(IO, pipeline.reorder_frames, script_id, request.frame_ids)
         return signed_response(updated_script)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -1208,7 +1324,9 @@ async def render_frame(script_id: str, request: RenderFrameRequest):
     try:
         logger.info(f"Rendering frame {request.frame_id}")
         
-        updated_script = pipeline.generate_storyboard_render(
+        updated_script = await run_in(
+            IMAGE,
+            pipeline.generate_storyboard_render,
             script_id,
             request.frame_id,
             request.composition_data,
@@ -1231,7 +1349,7 @@ class SelectVideoRequest(BaseModel):
 async def select_video(script_id: str, frame_id: str, request: SelectVideoRequest):
     """Selects a video variant for a specific frame."""
     try:
-        updated_script = pipeline.select_video_for_frame(script_id, frame_id, request.video_id)
+        updated_script = await run_in(IO, pipeline.select_video_for_frame, script_id, frame_id, request.video_id)
         return signed_response(updated_script)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -1239,29 +1357,99 @@ async def select_video(script_id: str, frame_id: str, request: SelectVideoReques
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/projects/{script_id}/merge", response_model=Script)
-async def merge_videos(script_id: str):
-    """Merge all selected frame videos into final output"""
-    import traceback
+@app.post("/projects/{script_id}/merge")
+async def merge_videos(script_id: str, background_tasks: BackgroundTasks, hls: Optional[bool] = None):
+    """
+    Starts merging all selected frame videos into the final output.
+
+    The merge runs in the background; poll GET /tasks/{task_id} for
+    percent/fps/speed and cancel it with POST /tasks/{task_id}/cancel.
+    ``hls=true`` also packages the result as HLS (``merged_hls_url``).
+    """
     try:
-        merged_script = pipeline.merge_videos(script_id)
-        return signed_response(merged_script)
+        task_id = await run_in(IO, pipeline.create_merge_task, script_id, hls=hls)
+        background_tasks.add_task(run_in, FFMPEG, pipeline.process_merge_task, task_id)
+        return {"task_id": task_id, "status": pipeline.merge_tasks[task_id]["status"]}
     except ValueError as e:
         # Known validation errors (no videos, etc.)
         logger.error(f"[MERGE ERROR] Validation failed: {e}")
-        logger.exception("An error occurred")
         raise HTTPException(status_code=400, detail=str(e))
-    except RuntimeError as e:
-        # FFmpeg or processing errors
-        logger.error(f"[MERGE ERROR] Runtime error: {e}")
-        logger.exception("An error occurred")
-        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         logger.error(f"[MERGE ERROR] Unexpected error: {e}")
         logger.exception("An error occurred")
         raise HTTPException(status_code=500, detail=f"Merge failed: {str(e)}")
 
 
+@app.post("/projects/{script_id}/preview")
+async def build_preview(script_id: str):
+    """
+    Assembles a low-resolution preview of the current cut from 360p clip proxies
+    (stream copy, no full-quality encode). The final merge stays separate.
+    """
+    cancel_event = threading.Event()
+    try:
+        return await run_in(FFMPEG, pipeline.build_preview, script_id, cancel_event)
+    except asyncio.CancelledError:
+        # Request aborted: stop fetching clips for it
+        cancel_event.set()
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("An error occurred")
+        raise HTTPException(status_code=500, detail=f"Preview failed: {str(e)}")
+
+
+@app.get("/media/info")
+async def get_media_info(url: str):
+    """
+    Returns indexed metadata (duration, codecs, resolution, size) for a local media
+    URL such as "video/xxx.mp4". Files not yet indexed are probed once.
+    """
+    path = os.path.join("output", url)
+    # Resolve symlinks and compare whole path components ("output_old/..." is not inside "output")
+    root = os.path.realpath("output")
+    if not os.path.isfile(path) or os.path.commonpath([os.path.realpath(path), root]) != root:
+        raise HTTPException(status_code=404, detail="Media not found")
+    entry = await run_in(IO, get_media_index().lookup, path)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Media not found")
+    entry.pop("path", None)
+    return dict(entry, url=url)
+
+
+class ExportRequest(BaseModel):
+    resolution: str = "1080p"  # 720p | 1080p | 4K
+    format: str = "mp4"  # mp4 | mov | gif
+    subtitles: str = "burn-in"  # burn-in | srt | none
+    bgm_url: Optional[str] = None  # Project-level music bed, looped under the whole timeline
+    bgm_volume: Optional[float] = None  # Linear gain of the music bed (default 0.3, 0 mutes it)
+    hls: bool = False  # Also package mp4/mov exports as HLS for progressive playback
+
+
+@app.post("/projects/{script_id}/export")
+async def export_project(script_id: str, request: ExportRequest):
+    """Renders the final video: stitch, audio mix and subtitles in a single ffmpeg pass."""
+    try:
+        options = request.model_dump(exclude_none=True) if hasattr(request, 'model_dump') else request.dict(exclude_none=True)
+        # Encoding runs on the ffmpeg pool to avoid blocking the event loop
+        export_url = await run_in(FFMPEG, pipeline.export_project, script_id, options)
+        result = {"url": export_url}
+        base = os.path.splitext(export_url)[0]
+        for key, ext in (("subtitles_url", ".srt"), ("ass_url", ".ass")):
+            if request.subtitles != "none" and os.path.exists(os.path.join("output", base + ext)):
+                result[key] = base + ext
+        playlist = os.path.join(hls_dir_for(export_url), PLAYLIST_NAME)
+        if request.hls and os.path.exists(playlist):
+            result["hls_url"] = os.path.relpath(playlist, "output").replace(os.sep, "/")
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("An error occurred")
+        raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
+
+
 # ===== Art Direction Endpoints =====
 
 class AnalyzeStyleRequest(BaseModel):
@@ -1284,12 +1472,8 @@ async def analyze_script_for_styles(script_id: str, request: AnalyzeStyleRequest
         if not script:
             raise HTTPException(status_code=404, detail="Script not found")
 
-        # Use LLM to analyze and recommend styles (run in thread pool to avoid blocking, Python 3.8 compatible)
-        loop = asyncio.get_event_loop()
-        recommendations = await loop.run_in_executor(
-            None,  # Use default executor
-            partial(pipeline.script_processor.analyze_script_for_styles, request.script_text)
-        )
+        # Use LLM to analyze and recommend styles (on the LLM pool to avoid blocking)
+        recommendations = await run_in(LLM, pipeline.script_processor.analyze_script_for_styles, request.script_text)
 
         return {"recommendations": recommendations}
     except HTTPException:
@@ -1304,7 +1488,7 @@ async def analyze_script_for_styles(script_id: str, request: AnalyzeStyleRequest
 async def save_art_direction(script_id: str, request: SaveArtDirectionRequest):
     """Save Art Direction configuration to the project"""
     try:
-        updated_script = pipeline.save_art_direction(
+        updated_script = await run_in(IO, pipeline.save_art_direction,
             script_id,
             request.selected_style_id,
             request.style_config,
@@ -1355,7 +1539,7 @@ async def polish_video_prompt(request: PolishVideoPromptRequest):
     """Polishes a video generation prompt using LLM. Returns bilingual prompts."""
     try:
         processor = ScriptProcessor()
-        result = processor.polish_video_prompt(request.draft_prompt)
+        result = await run_in(LLM, processor.polish_video_prompt, request.draft_prompt)
         return {
             "prompt_cn": result.get("prompt_cn", ""),
             "prompt_en": result.get("prompt_en", "")
@@ -1381,7 +1565,7 @@ async def polish_r2v_prompt(request: PolishR2VPromptRequest):
     try:
         processor = ScriptProcessor()
         slot_info = [{"description": s.description} for s in request.slots]
-        result = processor.polish_r2v_prompt(request.draft_prompt, slot_info)
+        result = await run_in(LLM, processor.polish_r2v_prompt, request.draft_prompt, slot_info)
         return {
             "prompt_cn": result.get("prompt_cn", ""),
             "prompt_en": result.get("prompt_en", "")
@@ -1457,7 +1641,7 @@ async def create_character(script_id: str, request: CreateCharacterRequest):
     
     script.characters.append(new_character)
     script.updated_at = time.time()
-    pipeline._save_data()
+    await run_in(IO, pipeline._save_data)
     
     return {"status": "success", "character": new_character.dict()}
 
@@ -1482,7 +1666,7 @@ async def delete_character(script_id: str, character_id: str):
             frame.character_ids.remove(character_id)
     
     script.updated_at = time.time()
-    pipeline._save_data()
+    await run_in(IO, pipeline._save_data)
     
     return {"status": "success", "message": f"Character {character_id} deleted"}
 
@@ -1516,7 +1700,7 @@ async def create_scene(script_id: str, request: CreateSceneRequest):
     
     script.scenes.append(new_scene)
     script.updated_at = time.time()
-    pipeline._save_data()
+    await run_in(IO, pipeline._save_data)
     
     return {"status": "success", "scene": new_scene.dict()}
 
@@ -1535,7 +1719,7 @@ async def delete_scene(script_id: str, scene_id: str):
         raise HTTPException(status_code=404, detail="Scene not found")
     
     script.updated_at = time.time()
-    pipeline._save_data()
+    await run_in(IO, pipeline._save_data)
     
     return {"status": "success", "message": f"Scene {scene_id} deleted"}
 
@@ -1565,7 +1749,7 @@ async def create_prop(script_id: str, request: CreatePropRequest):
     
     script.props.append(new_prop)
     script.updated_at = time.time()
-    pipeline._save_data()
+    await run_in(IO, pipeline._save_data)
     
     return {"status": "success", "prop": new_prop.dict()}
 
@@ -1577,6 +1761,8 @@ async def delete_prop(script_id: str, prop_id: str):
     if not script:
         raise HTTPException(status_code=404, detail="Project not found")
     
+    await run_in(IO, pipeline.cancel_tasks, script_id, asset_id=prop_id)
+
     original_count = len(script.props)
     script.props = [p for p in script.props if p.id != prop_id]
     
@@ -1589,7 +1775,7 @@ async def delete_prop(script_id: str, prop_id: str):
             frame.prop_ids.remove(prop_id)
     
     script.updated_at = time.time()
-    pipeline._save_data()
+    await run_in(IO, pipeline._save_data)
     
     return {"status": "success", "message": f"Prop {prop_id} deleted"}
 
@@ -1635,7 +1821,7 @@ async def create_frame(script_id: str, request: CreateFrameRequest):
         script.frames.append(new_frame)
     
     script.updated_at = time.time()
-    pipeline._save_data()
+    await run_in(IO, pipeline._save_data)
     
     return {"status": "success", "frame": new_frame.dict(), "index": script.frames.index(new_frame)}
 
@@ -1654,7 +1840,7 @@ async def delete_frame(script_id: str, frame_id: str):
         raise HTTPException(status_code=404, detail="Frame not found")
     
     script.updated_at = time.time()
-    pipeline._save_data()
+    await run_in(IO, pipeline._save_data)
     
     return {"status": "success", "message": f"Frame {frame_id} deleted"}
 
@@ -1700,7 +1886,7 @@ async def copy_frame(script_id: str, request: CopyFrameRequest):
         script.frames.insert(source_index + 1, new_frame)
     
     script.updated_at = time.time()
-    pipeline._save_data()
+    await run_in(IO, pipeline._save_data)
     
     return {"status": "success", "frame": new_frame.dict(), "index": script.frames.index(new_frame)}
 
@@ -1730,7 +1916,7 @@ async def reorder_frames(script_id: str, request: ReorderFramesRequest):
     # Reorder frames
     script.frames = [frame_lookup[fid] for fid in request.frame_ids]
     script.updated_at = time.time()
-    pipeline._save_data()
+    await run_in(IO, pipeline._save_data)
     
     return {"status": "success", "message": "Frames reordered", "frame_count": len(script.frames)}
 
@@ -7,6 +7,8 @@ from .models import Character, Scene, Prop, GenerationStatus, ImageAsset, ImageV
 from ...models.image import WanxImageModel
 from ...utils import get_logger
 from ...utils.oss_utils import is_object_key
+from ...utils.cancellation import TaskCancelledError
+from ...utils.media_store import get_media_store
 
 logger = get_logger(__name__)
 
@@ -160,6 +162,7 @@ class AssetGenerator:
                         variant = ImageVariant(
                             id=variant_id,
                             url=rel_fullbody_path,
+                            content_hash=get_media_store().ingest(fullbody_path),
                             created_at=time.time(),
                             prompt_used=generation_prompt
                         )
@@ -179,6 +182,8 @@ class AssetGenerator:
                         # Add small delay between API calls to avoid rate limiting (except for last one)
                         if i < batch_size - 1:
                             time.sleep(1)
+                    except TaskCancelledError:
+                        raise
                     except Exception as e:
                         logger.error(f"Failed to generate full body variant {i+1}/{batch_size}: {e}")
                         # Continue with next variant instead of stopping entirely
@@ -307,6 +312,7 @@ class AssetGenerator:
                         variant = ImageVariant(
                             id=variant_id,
                             url=rel_sheet_path,
+                            content_hash=get_media_store().ingest(sheet_path),
                             created_at=time.time(),
                             prompt_used=generation_prompt
                         )
@@ -325,6 +331,8 @@ class AssetGenerator:
                         
                         if i < batch_size - 1:
                             time.sleep(1)
+                    except TaskCancelledError:
+                        raise
                     except Exception as e:
                         logger.error(f"Failed to generate three view variant {i+1}/{batch_size}: {e}")
                         continue
@@ -383,6 +391,7 @@ class AssetGenerator:
                         variant = ImageVariant(
                             id=variant_id,
                             url=rel_avatar_path,
+                            content_hash=get_media_store().ingest(avatar_path),
                             created_at=time.time(),
                             prompt_used=generation_prompt
                         )
@@ -401,6 +410,8 @@ class AssetGenerator:
                         
                         if i < batch_size - 1:
                             time.sleep(1)
+                    except TaskCancelledError:
+                        raise
                     except Exception as e:
                         logger.error(f"Failed to generate headshot variant {i+1}/{batch_size}: {e}")
                         continue
@@ -474,6 +485,7 @@ class AssetGenerator:
                 variant = ImageVariant(
                     id=variant_id,
                     url=rel_path,
+                    content_hash=get_media_store().ingest(output_path),
                     created_at=time.time(),
                     prompt_used=prompt
                 )
@@ -536,6 +548,7 @@ class AssetGenerator:
                 variant = ImageVariant(
                     id=variant_id,
                     url=rel_path,
+                    content_hash=get_media_store().ingest(output_path),
                     created_at=time.time(),
                     prompt_used=prompt
                 )
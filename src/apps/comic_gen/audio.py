@@ -4,6 +4,7 @@ from typing import Dict, Any, List
 from .models import StoryboardFrame, Character, GenerationStatus
 from ...utils import get_logger
 from ...audio.tts import TTSProcessor
+from .media_index import get_media_index
 
 logger = get_logger(__name__)
 
@@ -77,6 +78,7 @@ class AudioGenerator:
             # Store relative path for frontend serving
             rel_path = os.path.relpath(output_path, "output")
             frame.audio_url = rel_path
+            get_media_index().record(output_path)
             frame.status = GenerationStatus.COMPLETED
             
         except Exception as e:
@@ -99,6 +101,7 @@ class AudioGenerator:
         # Store relative path for frontend serving
         rel_path = os.path.relpath(output_path, "output")
         frame.audio_url = rel_path
+        get_media_index().record(output_path)
         frame.status = GenerationStatus.COMPLETED
         return frame
 
@@ -121,6 +124,7 @@ class AudioGenerator:
             # Store relative path for frontend serving
             rel_path = os.path.relpath(output_path, "output")
             frame.sfx_url = rel_path
+            get_media_index().record(output_path)
             frame.status = GenerationStatus.COMPLETED
             
         except Exception as e:
@@ -145,6 +149,7 @@ class AudioGenerator:
             f.write(b'dummy v2a sfx content')
             
         frame.sfx_url = os.path.relpath(output_path, "output")
+        get_media_index().record(output_path)
         return frame
 
     def generate_bgm(self, frame: StoryboardFrame) -> StoryboardFrame:
@@ -160,4 +165,5 @@ class AudioGenerator:
             f.write(b'dummy bgm content')
             
         frame.bgm_url = os.path.relpath(output_path, "output")
+        get_media_index().record(output_path)
         return frame
@@ -1,63 +1,388 @@
+import math
 import os
 import time
+import threading
 import uuid
-from typing import Dict, Any, List
-from .models import Script, GenerationStatus
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .models import Script, StoryboardFrame
+from .audio_mix import TimelineAudioMixer
+from .media_index import get_media_index
+from .hls import package_hls, segment_seconds
+from .merge import VideoMerger
+from .subtitles import write_subtitles
 from ...utils import get_logger
+from ...utils.oss_media_cache import get_oss_media_cache
+from ...utils.system_check import get_ffmpeg_path
 
 logger = get_logger(__name__)
 
+# Short side of the output frame for each resolution option
+RESOLUTION_SHORT_SIDE = {"480p": 480, "720p": 720, "1080p": 1080, "2K": 1440, "4K": 2160}
+GIF_WIDTH = 480
+GIF_FPS = 12
+MIX_SAMPLE_RATE = 48000
+
+# Default gains (linear) of the layers in the export mix
+CLIP_AUDIO_VOLUME = 1.0
+DIALOGUE_VOLUME = 1.0
+SFX_VOLUME = 0.8
+BGM_VOLUME = 0.3
+
+
+def _local_path(url: Optional[str]) -> Optional[str]:
+    """
+    Resolves a stored media URL (relative to output/, or an OSS object key) to a
+    readable local file, fetching OSS objects through the read-through cache.
+    """
+    return get_oss_media_cache().resolve(url)
+
+
+def _bgm_volume(options: Dict[str, Any]) -> float:
+    """Linear gain of the project BGM for both mixers: BGM_VOLUME when unset, 0 mutes it."""
+    value = options.get("bgm_volume")
+    if value is None:
+        return BGM_VOLUME
+    try:
+        volume = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"bgm_volume must be a number, got {value!r}")
+    if not math.isfinite(volume) or volume < 0:
+        raise ValueError(f"bgm_volume must be >= 0, got {value!r}")
+    return volume
+
+
+def _filter_escape(path: str) -> str:
+    """Escapes a file path for use as a filter option value inside a filtergraph."""
+    return path.replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
+
+
 class ExportManager:
     def __init__(self, config: Dict[str, Any] = None):
         self.config = config or {}
         self.output_dir = self.config.get('output_dir', 'output/export')
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def render_project(self, script: Script, options: Dict[str, Any]) -> str:
+    def render_project(self, script: Script, options: Dict[str, Any],
+                       on_progress: Callable[[Dict[str, Any]], None] = None,
+                       cancel_event: Optional[threading.Event] = None) -> str:
         """
         Renders the final video for the project.
+
+        The selected clips are conformed (scale/pad, fps, audio resampling) and
+        concatenated, dialogue/SFX/BGM are mixed over them, subtitles are burned
+        in (or muxed as a soft track) and the result is encoded, all in a single
+        ffmpeg filtergraph pass; mismatched clips are never re-encoded to
+        intermediate files first. SRT/ASS sidecars are written next to the export.
+
+        Audio is mixed by the NumPy TimelineAudioMixer (ducking + loudness
+        normalization) into one stem when numpy is installed, otherwise by an
+        ffmpeg amix graph inside the same pass. Set LUMENX_AUDIO_MIXER=ffmpeg to
+        force the latter.
+
+        Options: resolution ("720p" | "1080p" | "4K"), format ("mp4" | "mov" | "gif"),
+        subtitles ("burn-in" | "srt" | "none"), bgm_url (project-level music bed),
+        bgm_volume (its linear gain, >= 0; 0 mutes it), hls (also package mp4/mov as fMP4 HLS, keyframes forced on the segment grid).
         Returns the relative URL of the exported file.
         """
         logger.info(f"Starting export for project {script.id} with options: {options}")
-        
+        options = dict(options)
+        options["bgm_volume"] = _bgm_volume(options)
+
         # Options
         resolution = options.get('resolution', '1080p')
         format = options.get('format', 'mp4')
         subtitles = options.get('subtitles', 'burn-in')
-        
-        # Mock Rendering Process
-        # 1. Collect Assets (Video, Audio)
-        # 2. Stitch Video
-        # 3. Mix Audio
-        # 4. Burn Subtitles
-        
+
+        ffmpeg_path = get_ffmpeg_path()
+        if not ffmpeg_path:
+            raise RuntimeError("FFmpeg is required for export but was not found.")
+
+        start = time.time()
+        work_dir = os.path.join(self.output_dir, "work")
+        merger = VideoMerger(ffmpeg_path, work_dir=work_dir, on_progress=on_progress, cancel_event=cancel_event)
+
+        # 1. Collect assets and lay them out on the timeline
+        timeline = self._build_timeline(script)
+        if not timeline:
+            raise ValueError("No videos selected to export. Please select videos for each frame first.")
+        total_duration = sum(entry["duration"] for entry in timeline)
+
+        # 2. Pick the frame/rate profile; every clip is conformed to it inside the export graph
+        aspect_ratio = script.model_settings.storyboard_aspect_ratio
+        target = merger.target_profile([entry["info"] for entry in timeline], aspect_ratio=aspect_ratio)
+        has_clip_audio = any(entry["info"].get("acodec") for entry in timeline)
+
+        filename = f"{script.id}_{int(time.time())}.{format}"
+        output_path = os.path.join(self.output_dir, filename)
+        job_id = uuid.uuid4().hex[:8]
+        os.makedirs(work_dir, exist_ok=True)
+        temp_files = []
+
         try:
-            # Simulate processing time based on frame count
-            duration = len(script.frames) * 0.5 # 0.5s per frame processing mock
-            time.sleep(min(duration, 5)) # Cap at 5s for demo
-            
-            filename = f"{script.id}_{int(time.time())}.{format}"
-            output_path = os.path.join(self.output_dir, filename)
-            
-            # Create a dummy file
-            with open(output_path, 'wb') as f:
-                f.write(b'dummy video content')
-                
-            logger.info(f"Export completed: {output_path}")
+            width, height = self._output_size(target, resolution)
+            subtitle_files = {}
+            if subtitles in ("burn-in", "srt") and format != "gif":
+                subtitle_files = write_subtitles(timeline, os.path.splitext(output_path)[0], width, height)
+
+            if format != "gif" and self._use_numpy_mixer():
+                stem_path = os.path.join(work_dir, f"mix_{job_id}.flac")
+                temp_files.append(stem_path)
+                merger.progress.stage("mixing", total_duration)
+                self._render_audio_stem(timeline, total_duration, options, stem_path, merger)
+                options["mixed_audio_path"] = stem_path
+
+            cmd = self._build_command(
+                ffmpeg_path, timeline, total_duration, options,
+                has_clip_audio=has_clip_audio, fps=target.get("fps"),
+                size=(width, height), format=format,
+                subtitle_files=subtitle_files, burn_subtitles=(subtitles == "burn-in"),
+                output_path=output_path
+            )
+            merger.progress.stage("exporting", total_duration)
+            merger._run(cmd, timeout=max(600, int(total_duration * 20)), job="export")
+            if options.get("hls") and format != "gif":
+                package_hls(output_path, merger, duration=total_duration)
+
+            logger.info(f"Export completed: {output_path} ({time.time() - start:.2f}s)")
             return os.path.relpath(output_path, "output")
-            
+
         except Exception as e:
             logger.error(f"Export failed: {e}")
+            if os.path.exists(output_path):
+                temp_files.append(output_path)
             raise e
+        finally:
+            for path in temp_files:
+                if os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def _build_timeline(self, script: Script) -> List[Dict[str, Any]]:
+        """
+        One entry per frame that has a usable clip: the clip's probe info, its start
+        time on the timeline and the frame's audio layers.
+        """
+        # Fetch any OSS-hosted clips and audio layers in parallel up front
+        get_oss_media_cache().resolve_many([
+            url for frame in script.frames
+            for url in (self._selected_clip_url(script, frame), frame.audio_url, frame.sfx_url, frame.bgm_url)
+        ])
+
+        timeline = []
+        cursor = 0.0
+        for frame in script.frames:
+            clip_path = _local_path(self._selected_clip_url(script, frame))
+            if not clip_path:
+                logger.warning(f"Export: frame {frame.id} has no local clip, skipping")
+                continue
+            try:
+                info = get_media_index().clip_info(clip_path)
+            except Exception as e:
+                # One broken clip should not abort the whole export (merge skips them too)
+                logger.warning(f"Export: frame {frame.id} clip {clip_path} cannot be probed ({e}), skipping")
+                continue
+            duration = info.get("duration") or 0.0
+            timeline.append({
+                "frame": frame,
+                "info": info,
+                "start": cursor,
+                "duration": duration,
+                "dialogue": self._audio_track(frame.audio_url),
+                "sfx": self._audio_track(frame.sfx_url),
+                "bgm": self._audio_track(frame.bgm_url),
+            })
+            cursor += duration
+        return timeline
+
+    def _selected_clip_url(self, script: Script, frame: StoryboardFrame) -> Optional[str]:
+        """Selected video of a frame, or its first completed one (same rule as merge)."""
+        if frame.selected_video_id:
+            video = next((v for v in script.video_tasks if v.id == frame.selected_video_id), None)
+        else:
+            video = next((v for v in script.video_tasks if v.frame_id == frame.id and v.status == "completed"), None)
+        return video.video_url if video else None
+
+    def _audio_track(self, url: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Local path and duration of an audio layer; None if missing or undecodable."""
+        path = _local_path(url)
+        if not path:
+            return None
+        duration = get_media_index().duration(path)
+        if not duration:
+            logger.warning(f"Export: skipping undecodable audio {url}")
+            return None
+        return {"path": path, "duration": duration}
+
+    def _output_size(self, target: Dict[str, Any], resolution: str) -> Tuple[int, int]:
+        """Scales the (aspect-conformed) target frame so its short side matches the resolution."""
+        short_side = RESOLUTION_SHORT_SIDE.get(resolution)
+        width, height = target["width"], target["height"]
+        if not short_side:
+            return width, height
+        if width >= height:
+            return int(round(short_side * width / height / 2)) * 2, short_side
+        return short_side, int(round(short_side * height / width / 2)) * 2
+
+    def _build_command(self, ffmpeg_path: str, timeline: List[Dict[str, Any]],
+                       total_duration: float, options: Dict[str, Any], has_clip_audio: bool,
+                       fps: Optional[str], size: Tuple[int, int], format: str, subtitle_files: Dict[str, str],
+                       burn_subtitles: bool, output_path: str) -> List[str]:
+        """Builds the single-pass export command: one input per media file, one filtergraph."""
+        cmd = [ffmpeg_path, "-y"]
+        filters = []
+        mixed_stem = options.get("mixed_audio_path") if format != "gif" else None
+        clip_audio = has_clip_audio and format != "gif" and not mixed_stem
+        self._concat_clips(cmd, filters, timeline, size, fps, clip_audio)
+
+        # Video: clips are already at the output frame; burn subtitles at output resolution
+        if format == "gif":
+            filters.append(
+                f"[vcat]fps={GIF_FPS},scale={GIF_WIDTH}:-2:flags=lanczos,split[g0][g1];"
+                f"[g0]palettegen[pal];[g1][pal]paletteuse[vout]"
+            )
+        elif subtitle_files and burn_subtitles:
+            # The ASS script is laid out for the output size, so it is rendered after scaling
+            filters.append(f"[vcat]ass=filename='{_filter_escape(os.path.abspath(subtitle_files['ass']))}'[vout]")
+        else:
+            filters.append("[vcat]null[vout]")
+
+        audio_labels = []
+        if format != "gif":
+            if mixed_stem:
+                # Pre-mixed timeline stem (dialogue/SFX/BGM already placed and ducked)
+                index = self._add_input(cmd, mixed_stem)
+                filters.append(f"[{index}:a]aresample={MIX_SAMPLE_RATE}[a_stem]")
+                audio_labels.append("[a_stem]")
+            else:
+                audio_labels += self._mix_audio(cmd, filters, timeline, total_duration, options, clip_audio)
 
-    def _stitch_video(self, frames: List[Any], output_path: str):
-        # TODO: Implement FFmpeg stitching
-        pass
+        if audio_labels:
+            # The silent bed fixes the mix length to the video timeline
+            filters.append(
+                f"anullsrc=r={MIX_SAMPLE_RATE}:cl=stereo,atrim=0:{total_duration:.3f}[bed];"
+                f"[bed]{''.join(audio_labels)}amix=inputs={len(audio_labels) + 1}:duration=first:normalize=0[aout]"
+            )
+
+        subtitle_index = None
+        if subtitle_files and not burn_subtitles:
+            subtitle_index = self._add_input(cmd, subtitle_files["srt"])
+
+        cmd += ["-filter_complex", ";".join(filters), "-map", "[vout]"]
+        if format == "gif":
+            cmd += ["-an", "-loop", "0"]
+        else:
+            if audio_labels:
+                cmd += ["-map", "[aout]", "-c:a", "aac", "-b:a", "192k"]
+            if subtitle_index is not None:
+                cmd += ["-map", f"{subtitle_index}:s", "-c:s", "mov_text"]
+            cmd += ["-c:v", "libx264", "-preset", "medium", "-crf", "20", "-pix_fmt", "yuv420p",
+                    "-movflags", "+faststart"]
+            if options.get("hls"):
+                # Keyframe on every segment boundary so HLS segments are cut evenly
+                cmd += ["-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds()})"]
+        cmd.append(output_path)
+        return cmd
+
+    def _concat_clips(self, cmd: List[str], filters: List[str], timeline: List[Dict[str, Any]],
+                      size: Tuple[int, int], fps: Optional[str], with_audio: bool):
+        """
+        Adds every clip as its own input, conforms it inside the graph (scale/pad to
+        the output frame, fps, pixel format; audio resampled and padded/trimmed to
+        the clip, silence for clips without audio) and concatenates them into
+        [vcat] (and [acat]).
+        """
+        width, height = size
+        segments = []
+        for n, entry in enumerate(timeline):
+            info = entry["info"]
+            index = self._add_input(cmd, info["path"])
+            vf = (f"[{index}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                  f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1")
+            if fps:
+                vf += f",fps={fps}"
+            filters.append(vf + f",format=yuv420p[v_clip{n}]")
+            segments.append(f"[v_clip{n}]")
+            if with_audio:
+                duration = f"{entry['duration']:.3f}"
+                if info.get("acodec"):
+                    filters.append(f"[{index}:a]aresample={MIX_SAMPLE_RATE},aformat=sample_fmts=fltp:"
+                                   f"channel_layouts=stereo,apad,atrim=0:{duration}[a_src{n}]")
+                else:
+                    filters.append(f"anullsrc=r={MIX_SAMPLE_RATE}:cl=stereo,atrim=0:{duration},"
+                                   f"aformat=sample_fmts=fltp[a_src{n}]")
+                segments.append(f"[a_src{n}]")
+        outputs = "[vcat][acat]" if with_audio else "[vcat]"
+        filters.append(f"{''.join(segments)}concat=n={len(timeline)}:v=1:a={int(with_audio)}{outputs}")
+
+    def _use_numpy_mixer(self) -> bool:
+        return os.getenv("LUMENX_AUDIO_MIXER", "numpy") != "ffmpeg" and TimelineAudioMixer.available()
+
+    def _render_audio_stem(self, timeline: List[Dict[str, Any]], total_duration: float, options: Dict[str, Any],
+                           stem_path: str, merger: VideoMerger):
+        """Mixes every audio layer of the timeline into one stem with the NumPy mixer."""
+        mixer = TimelineAudioMixer(sample_rate=MIX_SAMPLE_RATE)
+        for entry in timeline:
+            if entry["info"].get("acodec"):
+                mixer.add_track(entry["info"]["path"], entry["start"], entry["duration"], role="clip")
+            for layer in ("dialogue", "sfx", "bgm"):
+                track = entry.get(layer)
+                if track:
+                    # Frame-scoped layers end with their clip
+                    mixer.add_track(track["path"], entry["start"], min(track["duration"], entry["duration"]),
+                                    role=layer)
+        bgm_path = _local_path(options.get("bgm_url"))
+        if bgm_path and options["bgm_volume"] > 0:
+            # Same linear gain the ffmpeg mixer applies
+            gain_db = 20 * math.log10(options["bgm_volume"])
+            mixer.add_track(bgm_path, 0.0, total_duration, role="bgm", gain_db=gain_db, loop=True)
+        mixer.render(stem_path, total_duration, cancel_event=merger.cancel_event,
+                     on_progress=lambda seconds: merger.progress.update("mix", seconds))
+
+    def _add_input(self, cmd: List[str], path: str, loop: bool = False) -> int:
+        """Appends an input file to the command and returns its input index."""
+        index = cmd.count("-i")
+        if loop:
+            cmd += ["-stream_loop", "-1"]
+        cmd += ["-i", path]
+        return index
+
+    def _mix_audio(self, cmd: List[str], filters: List[str], timeline: List[Dict[str, Any]],
+                   total_duration: float, options: Dict[str, Any], has_clip_audio: bool) -> List[str]:
+        """
+        Adds the audio layers to the filtergraph: clip audio, per-frame dialogue and
+        SFX delayed to their frame's start, per-frame or project BGM.
+        Returns the labels to be mixed.
+        """
+        labels = []
+        if has_clip_audio:
+            filters.append(f"[acat]volume={CLIP_AUDIO_VOLUME}[a_clip]")
+            labels.append("[a_clip]")
 
-    def _mix_audio(self, audio_tracks: List[Any], output_path: str):
-        # TODO: Implement FFmpeg audio mixing
-        pass
+        layers = (("dialogue", DIALOGUE_VOLUME), ("sfx", SFX_VOLUME), ("bgm", BGM_VOLUME))
+        for n, entry in enumerate(timeline):
+            delay_ms = int(round(entry["start"] * 1000))
+            for layer, volume in layers:
+                track = entry.get(layer)
+                if not track:
+                    continue
+                index = self._add_input(cmd, track["path"])
+                label = f"[a_{layer}{n}]"
+                # Frame-scoped layers end with their clip
+                filters.append(
+                    f"[{index}:a]aresample={MIX_SAMPLE_RATE},aformat=channel_layouts=stereo,"
+                    f"atrim=0:{entry['duration']:.3f},volume={volume},"
+                    f"adelay={delay_ms}:all=1{label}"
+                )
+                labels.append(label)
 
-    def _add_subtitles(self, video_path: str, subtitles: List[Any]):
-        # TODO: Implement FFmpeg subtitle burning
-        pass
+        bgm_path = _local_path(options.get("bgm_url"))
+        if bgm_path and options["bgm_volume"] > 0:
+            index = self._add_input(cmd, bgm_path, loop=True)
+            filters.append(
+                f"[{index}:a]aresample={MIX_SAMPLE_RATE},aformat=channel_layouts=stereo,"
+                f"atrim=0:{total_duration:.3f},volume={options['bgm_volume']}[a_music]"
+            )
+            labels.append("[a_music]")
+        return labels
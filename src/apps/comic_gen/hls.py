@@ -0,0 +1,85 @@
+"""
+HLS packaging of merged and exported videos.
+
+A finished MP4 is remuxed (stream copy, no re-encode) into fMP4 segments plus
+a VOD playlist under ``output/hls/<name>/``, which the ``/files`` mount serves
+as-is. Players start after the first segment and a seek fetches only the
+segments it lands in.
+
+Segments are cut at keyframes, so ``LUMENX_HLS_SEGMENT_SECONDS`` is a target:
+exports force keyframes on that grid, merges keep whatever GOP the clips have.
+
+Environment:
+    LUMENX_HLS_PACKAGING        package merges as HLS by default (default: 0)
+    LUMENX_HLS_SEGMENT_SECONDS  target segment length (default: 4)
+"""
+import os
+import shutil
+import uuid
+from typing import Optional
+
+from .merge import VideoMerger
+from ...utils import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_HLS_DIR = os.path.join("output", "hls")
+DEFAULT_SEGMENT_SECONDS = 4
+PLAYLIST_NAME = "index.m3u8"
+
+
+def hls_enabled_by_default() -> bool:
+    return os.getenv("LUMENX_HLS_PACKAGING", "0").lower() in ("1", "true", "yes")
+
+
+def segment_seconds() -> int:
+    return max(1, int(os.getenv("LUMENX_HLS_SEGMENT_SECONDS", DEFAULT_SEGMENT_SECONDS)))
+
+
+def hls_dir_for(video_path: str, root: str = None) -> str:
+    """Package directory of a video: ``<root>/<video file stem>``."""
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(root or DEFAULT_HLS_DIR, stem)
+
+
+def package_hls(video_path: str, merger: VideoMerger, root: str = None,
+                duration: Optional[float] = None) -> str:
+    """
+    Remuxes ``video_path`` into an fMP4 HLS package and returns the playlist path.
+
+    Runs through ``merger._run`` so the merge job's progress reporting and
+    cancellation cover this stage too. The package is written to a temporary
+    directory and moved into place when complete.
+    """
+    output_dir = hls_dir_for(video_path, root)
+    tmp_dir = f"{output_dir}.{uuid.uuid4().hex[:8]}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    cmd = [
+        merger.ffmpeg_path, "-y", "-v", "error", "-i", video_path,
+        # Soft subtitle tracks are offered as sidecar files instead
+        "-map", "0:v:0", "-map", "0:a?", "-c", "copy",
+        "-f", "hls", "-hls_time", str(segment_seconds()), "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", "init.mp4",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", os.path.join(tmp_dir, "seg_%05d.m4s"),
+        os.path.join(tmp_dir, PLAYLIST_NAME),
+    ]
+    merger.progress.stage("packaging", duration or 0.0, 99, 100)
+    try:
+        merger._run(cmd, timeout=600, job="hls")
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir)
+        os.replace(tmp_dir, output_dir)
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    segments = sum(1 for name in os.listdir(output_dir) if name.endswith(".m4s"))
+    logger.info(f"HLS package ready: {output_dir} ({segments} segments)")
+    return os.path.join(output_dir, PLAYLIST_NAME)
+
+
+def remove_hls(video_path: str, root: str = None):
+    """Deletes the package of a video, if any (e.g. when the merge is replaced)."""
+    output_dir = hls_dir_for(video_path, root)
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir, ignore_errors=True)
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import time
@@ -5,13 +6,31 @@ import uuid
 import logging
 import traceback
 import re
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 
 from .models import Script, Character, Scene, Prop, StoryboardFrame, GenerationStatus
 from ...utils import get_logger
+from ...utils.dashscope_client import call_generation, get_dashscope_client, run_sync
+from ...utils.json_stream import JsonArrayStream
+from .novel_chunks import ChunkResultCache, chunk_chars, chunk_concurrency, merge_entities, split_novel
 
 logger = get_logger(__name__)
 
+PARSE_MODEL = 'qwen-max'
+# Bump when the entity prompt changes so cached chunk results are not reused
+ENTITY_PROMPT_VERSION = "entities-v1"
+CHUNK_ATTEMPTS = 2
+STORYBOARD_MODEL = 'qwen-max'
+
+
+def _strip_code_fence(content: str) -> str:
+    """Returns the JSON payload of a reply, without markdown code fences."""
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0]
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0]
+    return content.strip()
+
 class ScriptProcessor:
     def __init__(self, api_key: str = None):
         self._api_key = api_key
@@ -33,15 +52,18 @@ class ScriptProcessor:
              logger.error("DASHSCOPE_API_KEY not set.")
              raise ValueError("DASHSCOPE_API_KEY 未配置。请在 API 配置中设置 DASHSCOPE_API_KEY 后重试。")
 
+        # Long texts: extract per chunk in parallel and merge (map-reduce)
+        if len(text) > chunk_chars():
+            chunks = split_novel(text)
+            if len(chunks) > 1:
+                return self._parse_novel_chunked(title, text, chunks)
+
         prompt = self._construct_prompt(text)
         
         try:
-            import dashscope
-            dashscope.api_key = self.api_key
-            
-            response = dashscope.Generation.call(
+            response = call_generation(
                 # model='deepseek-v3.2',
-                model='qwen-max',
+                model=PARSE_MODEL,
                 prompt=prompt,
                 result_format='message',
             )
@@ -75,6 +97,77 @@ class ScriptProcessor:
             logger.error(error_msg, exc_info=True)
             raise RuntimeError(error_msg)
 
+    def _parse_novel_chunked(self, title: str, text: str, chunks: List[str]) -> Script:
+        """
+        Map: extracts entities from every chunk in parallel (cached per chunk).
+        Reduce: merges and de-duplicates them into one script.
+        """
+        logger.info(f"Parsing {title} in {len(chunks)} chunks")
+        return self._create_script_from_data(title, text, self.extract_entities(chunks))
+
+    def extract_entities(self, chunks: List[str], indices: List[int] = None) -> Dict[str, Any]:
+        """
+        Extracts and merges characters/scenes/props from ``chunks`` (only the
+        ``indices`` given, default all). Returns the merged entity data.
+
+        If some chunks fail, the successful ones stay cached and the error
+        names the failed ones, so a retry only re-runs those.
+        """
+        if not self.api_key:
+            raise ValueError("DASHSCOPE_API_KEY 未配置。请在 API 配置中设置 DASHSCOPE_API_KEY 后重试。")
+
+        indices = list(range(len(chunks))) if indices is None else indices
+        cache = ChunkResultCache()
+        keys = {i: cache.make_key(PARSE_MODEL, ENTITY_PROMPT_VERSION, chunks[i]) for i in indices}
+        results = {i: cache.get(keys[i]) for i in indices}
+        pending = [i for i in indices if results[i] is None]
+        logger.info(f"Extracting entities from {len(indices)}/{len(chunks)} chunks ({len(indices) - len(pending)} cached)")
+
+        if pending:
+            outcomes = run_sync(self._extract_chunks([(i, chunks[i]) for i in pending], len(chunks)))
+            failed = []
+            for i, outcome in zip(pending, outcomes):
+                if isinstance(outcome, BaseException):
+                    logger.error(f"Chunk {i + 1}/{len(chunks)} failed: {outcome}")
+                    failed.append((i, outcome))
+                else:
+                    cache.put(keys[i], outcome)
+                    results[i] = outcome
+            if failed:
+                numbers = ", ".join(str(i + 1) for i, _ in failed)
+                raise RuntimeError(
+                    f"剧本解析失败: {len(failed)}/{len(chunks)} 个分段解析失败（第 {numbers} 段），"
+                    f"重试时只会重新解析这些分段。{failed[0][1]}"
+                )
+
+        merged = merge_entities([results[i] for i in indices])
+        logger.info(f"Merged {len(indices)} chunks into {len(merged['characters'])} characters, "
+                    f"{len(merged['scenes'])} scenes, {len(merged['props'])} props")
+        return merged
+
+    async def _extract_chunks(self, chunks: List[Tuple[int, str]], total: int) -> List[Any]:
+        """Entity extraction for (index, chunk) pairs, bounded concurrency. Failures are returned, not raised."""
+        client = get_dashscope_client()
+        semaphore = asyncio.Semaphore(chunk_concurrency())
+
+        async def extract(index: int, chunk: str) -> Dict[str, Any]:
+            prompt = self._construct_prompt(chunk, part=(index + 1, total))
+            error: Optional[Exception] = None
+            async with semaphore:
+                for attempt in range(CHUNK_ATTEMPTS):
+                    try:
+                        response = await client.generate_text(PARSE_MODEL, prompt=prompt, result_format='message')
+                        if response.status_code != 200:
+                            raise RuntimeError(f"LLM 调用失败: {response.code} - {response.message}")
+                        return json.loads(_strip_code_fence(response.output.choices[0].message.content))
+                    except Exception as e:
+                        # Malformed JSON or a transient failure: one more try for this chunk only
+                        error = e
+                        logger.warning(f"Chunk {index + 1}/{total} attempt {attempt + 1} failed: {e}")
+            raise error
+
+        return await asyncio.gather(*[extract(i, chunk) for i, chunk in chunks], return_exceptions=True)
+
     def _create_script_from_data(self, title: str, original_text: str, data: Dict[str, Any]) -> Script:
         script_id = str(uuid.uuid4())
         
@@ -315,19 +408,25 @@ class ScriptProcessor:
         
         return script
 
-    def _construct_prompt(self, text: str) -> str:
+    def _construct_prompt(self, text: str, part: Tuple[int, int] = None) -> str:
         """
         Prompt A: Entity Extractor
         Constructs the system prompt for extracting characters, scenes, and props ONLY.
         Frames are generated separately via analyze_to_storyboard (Prompt B).
+        ``part`` = (index, total) marks one chunk of a longer novel.
         """
+        part_rules = ""
+        if part:
+            part_rules = f"""
+        - This text is part {part[0]} of {part[1]} of a longer novel. Extract only entities that appear in this part.
+        - For each character also output "aliases": a list of other names, nicknames or titles used for them in this part (empty list if none)."""
         return f"""
         You are a professional storyboard artist and scriptwriter.
         Analyze the following novel text and extract structured data for a comic/video production.
         
         IMPORTANT: 
         - All descriptive content (names, descriptions) MUST be in CHINESE (Simplified Chinese).
-        - Extract ONLY characters, scenes, and props.
+        - Extract ONLY characters, scenes, and props.{part_rules}
         
         Output strictly in valid JSON format with the following structure:
         {{
@@ -412,10 +511,7 @@ CRITICAL STYLE GUIDELINES:
         user_prompt = f"剧本内容：\n\n{script_text[:2000]}"  # 限制长度避免 token 限制
         
         try:
-            import dashscope
-            dashscope.api_key = self.api_key
-            
-            response = dashscope.Generation.call(
+            response = call_generation(
                 model='qwen-plus',
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -569,17 +665,8 @@ CRITICAL STYLE GUIDELINES:
             }
         ]
     
-    def analyze_to_storyboard(self, text: str, entities_json: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """
-        Analyzes script text and generates storyboard frames using Prompt B (Storyboard Director).
-        Returns a list of frame dictionaries with visual atoms.
-        """
-        logger.info(f"Analyzing text to storyboard: {text[:100]}...")
-        
-        if not self.api_key:
-            logger.warning("DASHSCOPE_API_KEY not set. Returning mock frames.")
-            return self._mock_storyboard_frames(text)
-        
+    def _storyboard_messages(self, text: str, entities_json: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Prompt B (Storyboard Director) messages for ``text`` with the project's entities as context."""
         # Build entities context
         characters_list = entities_json.get("characters", [])
         scenes_list = entities_json.get("scenes", [])
@@ -665,17 +752,26 @@ Props:
 # 剧本内容
 {text}
 """
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "请开始生成分镜帧列表，确保覆盖剧本中的所有内容。"}
+        ]
+
+    def analyze_to_storyboard(self, text: str, entities_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Analyzes script text and generates storyboard frames using Prompt B (Storyboard Director).
+        Returns a list of frame dictionaries with visual atoms.
+        """
+        logger.info(f"Analyzing text to storyboard: {text[:100]}...")
+        
+        if not self.api_key:
+            logger.warning("DASHSCOPE_API_KEY not set. Returning mock frames.")
+            return self._mock_storyboard_frames(text)
 
         try:
-            import dashscope
-            dashscope.api_key = self.api_key
-            
-            response = dashscope.Generation.call(
-                model='qwen-max',
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": "请开始生成分镜帧列表，确保覆盖剧本中的所有内容。"}
-                ],
+            response = call_generation(
+                model=STORYBOARD_MODEL,
+                messages=self._storyboard_messages(text, entities_json),
                 result_format='message',
                 # response_format={'type': 'json_object'} # Removed to allow freer generation
             )
@@ -706,6 +802,44 @@ Props:
             logger.error(f"Error in storyboard analysis: {e}", exc_info=True)
             return self._mock_storyboard_frames(text)
     
+    async def stream_storyboard(self, text: str, entities_json: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of ``analyze_to_storyboard``: yields each frame dict
+        as soon as the model has finished writing it. Runs on the shared
+        DashScope loop (consume it through ``iterate_on_bridge``).
+        Raises RuntimeError if the model produced no frames.
+        """
+        logger.info(f"Streaming storyboard analysis: {text[:100]}...")
+
+        if not self.api_key:
+            logger.warning("DASHSCOPE_API_KEY not set. Returning mock frames.")
+            for frame in self._mock_storyboard_frames(text):
+                yield frame
+            return
+
+        parser = JsonArrayStream("frames")
+        content = []
+        async for delta in get_dashscope_client().stream_text(
+            STORYBOARD_MODEL, messages=self._storyboard_messages(text, entities_json), result_format='message'
+        ):
+            content.append(delta)
+            for frame in parser.feed(delta):
+                yield frame
+
+        if parser.emitted == 0:
+            # No "frames" array in the reply (e.g. a bare list); fall back to parsing it whole
+            try:
+                result = json.loads(_strip_code_fence("".join(content)))
+            except json.JSONDecodeError as e:
+                raise RuntimeError(f"分镜解析失败: 无法解析模型返回的 JSON ({e})")
+            frames = result.get("frames", []) if isinstance(result, dict) else result
+            if not frames:
+                raise RuntimeError("分镜解析失败: 模型未返回任何分镜帧")
+            for frame in frames:
+                yield frame
+        else:
+            logger.info(f"Storyboard stream finished with {parser.emitted} frames")
+
     def _mock_storyboard_frames(self, text: str) -> List[Dict[str, Any]]:
         """Returns mock storyboard frames for testing when API is unavailable."""
         return [
@@ -788,10 +922,7 @@ Return STRICTLY a JSON object:
 """
 
         try:
-            import dashscope
-            dashscope.api_key = self.api_key
-            
-            response = dashscope.Generation.call(
+            response = call_generation(
                 model='qwen-plus',
                 prompt=system_prompt,
                 result_format='message',
@@ -862,10 +993,7 @@ Return STRICTLY a JSON object:
 """
 
         try:
-            import dashscope
-            dashscope.api_key = self.api_key
-
-            response = dashscope.Generation.call(
+            response = call_generation(
                 model='qwen-plus',
                 messages=[
                     {'role': 'system', 'content': system_prompt},
@@ -960,10 +1088,7 @@ OUTPUT:
 """
 
         try:
-            import dashscope
-            dashscope.api_key = self.api_key
-
-            response = dashscope.Generation.call(
+            response = call_generation(
                 model='qwen-plus',
                 messages=[
                     {'role': 'system', 'content': system_prompt},
@@ -0,0 +1,148 @@
+"""
+Media metadata index.
+
+Stream parameters (duration, codecs, resolution, frame rate, audio layout,
+size) of every generated or uploaded clip and audio file, probed once and
+stored in ``output/media_index.json`` next to ``projects.json``. Entries are
+keyed by content hash, so a file that is copied, hardlinked or re-downloaded
+keeps its entry, and merge, export and the API read from here instead of
+spawning ffprobe again.
+
+Files are recorded at download/upload time; anything not yet indexed is
+probed on first lookup. Files the prober rejects are remembered too, so they
+are not re-probed on every merge, but only when the file was complete (not
+changing during the probe) and only for UNDECODABLE_TTL. Environment failures
+(no ffprobe, timeouts) are never stored.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from .probe import MediaDecodeError, probe_media
+from ...utils import get_logger
+from ...utils.hashing import try_file_sha256
+
+logger = get_logger(__name__)
+
+DEFAULT_INDEX_FILE = os.path.join("output", "media_index.json")
+# How long an "undecodable" verdict is trusted before the file is probed again
+UNDECODABLE_TTL = 24 * 3600
+TIME_BASED_EXTENSIONS = {".mp4", ".mov", ".webm", ".mkv", ".m4v", ".mp3", ".wav", ".m4a", ".aac", ".flac", ".ogg"}
+
+
+def is_time_based(path: str) -> bool:
+    """True for audio/video files (the ones worth indexing)."""
+    return os.path.splitext(path or "")[1].lower() in TIME_BASED_EXTENSIONS
+
+
+class MediaIndex:
+    """Content-hash keyed cache of media probe results, persisted as JSON."""
+
+    def __init__(self, index_file: str = None):
+        self.index_file = index_file or DEFAULT_INDEX_FILE
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            entries = {}
+            if os.path.exists(self.index_file):
+                try:
+                    with open(self.index_file, 'r', encoding='utf-8') as f:
+                        entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not read media index {self.index_file}: {e}")
+            self._entries = entries
+        return self._entries
+
+    def _save(self):
+        """Atomically rewrites the index file. Caller holds the lock."""
+        os.makedirs(os.path.dirname(self.index_file) or ".", exist_ok=True)
+        tmp = f"{self.index_file}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp, self.index_file)
+        except OSError as e:
+            logger.warning(f"Could not write media index: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def record(self, path: str, content_hash: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Probes a file and stores its metadata. Returns the entry (with ``path``),
+        or None if the file cannot be read.
+        """
+        if not path or not os.path.isfile(path):
+            return None
+        content_hash = content_hash or try_file_sha256(path)
+        if not content_hash:
+            return None
+        with self._lock:
+            entry = self._load().get(content_hash)
+        if entry is None or self._expired(entry):
+            entry, persist = self._probe(path)
+            if persist:
+                with self._lock:
+                    self._load()[content_hash] = entry
+                    self._save()
+        return dict(entry, path=path, content_hash=content_hash)
+
+    @staticmethod
+    def _expired(entry: Dict[str, Any]) -> bool:
+        return not entry.get("decodable") and time.time() - entry.get("probed_at", 0) > UNDECODABLE_TTL
+
+    def _probe(self, path: str) -> Tuple[Dict[str, Any], bool]:
+        """Returns (entry, whether to persist it)."""
+        before = os.stat(path)
+        persist = True
+        try:
+            info = probe_media(path)
+            info.pop("path", None)
+            info["decodable"] = True
+        except MediaDecodeError as e:
+            after = os.stat(path)
+            # A file still being written fails to decode too; only a stable file is really undecodable
+            persist = (before.st_size, before.st_mtime_ns) == (after.st_size, after.st_mtime_ns)
+            logger.warning(f"Media index: cannot decode {path}: {e}")
+            info = {"decodable": False, "duration": None}
+        except Exception as e:
+            # No ffprobe, timeout, I/O error: says nothing about the file, so nothing is stored
+            logger.warning(f"Media index: cannot probe {path} right now: {e}")
+            persist = False
+            info = {"decodable": False, "duration": None}
+        info["size"] = before.st_size
+        info["probed_at"] = time.time()
+        return info, persist
+
+    def lookup(self, path: str) -> Optional[Dict[str, Any]]:
+        """Metadata for a file, probing it first if it has not been indexed yet."""
+        return self.record(path)
+
+    def clip_info(self, path: str) -> Dict[str, Any]:
+        """Index-backed equivalent of probe.probe_clip (raises if there is no video stream)."""
+        entry = self.lookup(path)
+        if not entry or not entry.get("decodable") or not entry.get("vcodec"):
+            raise RuntimeError(f"No decodable video stream in {path}")
+        return entry
+
+    def duration(self, path: str) -> Optional[float]:
+        """Duration in seconds, or None if the file is missing or undecodable."""
+        entry = self.lookup(path)
+        if not entry or not entry.get("decodable"):
+            return None
+        return entry.get("duration")
+
+
+_media_index: Optional[MediaIndex] = None
+
+
+def get_media_index() -> MediaIndex:
+    """Returns the process-wide media metadata index."""
+    global _media_index
+    if _media_index is None:
+        _media_index = MediaIndex()
+    return _media_index
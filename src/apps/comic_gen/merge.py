@@ -0,0 +1,491 @@
+"""
+Video merging for storyboard clips.
+
+Clips produced by the same model normally share codec parameters, so they can
+be joined with the concat demuxer and ``-c copy`` without decoding anything.
+Every input's stream parameters are read from the media metadata index
+(probed once per file). Clips that differ from the majority profile
+(codec, resolution, frame rate, timebase, audio layout) are normalized to
+match it, and the result is stream-copied together.
+
+Normalized segments are cached under ``output/cache/segments`` keyed by the
+source content hash and the normalization profile, so re-merging after
+swapping one shot only normalizes the clip that changed.
+
+Normalization (scale/pad to the storyboard aspect ratio, fps conform, audio
+resample, optional loudness) runs one ffmpeg process per clip on a bounded
+worker pool; the final concat is a cheap stream copy. Every ffmpeg process runs
+with ``-progress pipe:1``; its reports are aggregated into one percentage for
+the merge task, and a cancel kills the running processes.
+
+Environment:
+    LUMENX_SEGMENT_CACHE_DIR      segment cache directory (default: output/cache/segments)
+    LUMENX_SEGMENT_CACHE_MAX_MB   size budget in MB (default: 4096)
+    LUMENX_FFMPEG_WORKERS         concurrent normalization processes (default: min(4, CPU count))
+    LUMENX_MERGE_LOUDNORM         set to "1" to loudness-normalize every clip (EBU R128)
+"""
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ...utils import get_logger
+from ...utils.cancellation import TaskCancelledError, current_cancel_event, raise_if_cancelled
+from ...utils.hashing import try_file_sha256
+from ...utils.result_cache import evict_lru
+from ...utils.system_check import get_ffmpeg_path
+from .media_index import get_media_index
+
+logger = get_logger(__name__)
+
+# Encoders used when a mismatched clip has to be re-encoded to the target profile
+VIDEO_ENCODERS = {"h264": "libx264", "hevc": "libx265"}
+AUDIO_ENCODERS = {"aac": "aac", "mp3": "libmp3lame", "opus": "libopus"}
+X264_PROFILES = {"baseline", "main", "high"}
+
+DEFAULT_SEGMENT_CACHE_DIR = os.path.join("output", "cache", "segments")
+DEFAULT_SEGMENT_CACHE_MAX_MB = 4096
+# Bump when the normalization encoder settings change so stale segments are not reused
+NORMALIZE_VERSION = 1
+DEFAULT_MAX_WORKERS = 4
+# Single-pass EBU R128 target used when loudness normalization is enabled
+LOUDNORM_FILTER = "loudnorm=I=-16:TP=-1.5:LRA=11"
+
+SIGNATURE_FIELDS = ("vcodec", "profile", "pix_fmt", "width", "height", "fps", "time_base",
+                    "acodec", "sample_rate", "channels")
+
+
+def default_ffmpeg_workers() -> int:
+    """Number of ffmpeg normalization processes to run concurrently."""
+    configured = os.getenv("LUMENX_FFMPEG_WORKERS")
+    if configured:
+        try:
+            return max(1, int(configured))
+        except ValueError:
+            logger.warning(f"Invalid LUMENX_FFMPEG_WORKERS={configured!r}, using default")
+    return max(1, min(DEFAULT_MAX_WORKERS, os.cpu_count() or 1))
+
+
+def aspect_fit_size(width: int, height: int, aspect_ratio: Optional[str]) -> Tuple[int, int]:
+    """
+    Frame size for ``aspect_ratio`` (e.g. "16:9") that keeps the given height.
+
+    Returns the input size unchanged when it already matches the ratio (within
+    rounding) or the ratio cannot be parsed. Dimensions are kept even for yuv420p.
+    """
+    if not aspect_ratio or not width or not height:
+        return width, height
+    try:
+        ratio_w, ratio_h = (float(x) for x in aspect_ratio.split(":"))
+    except ValueError:
+        return width, height
+    if ratio_w <= 0 or ratio_h <= 0:
+        return width, height
+    height = height - height % 2
+    fitted_width = int(round(height * ratio_w / ratio_h / 2)) * 2
+    if abs(fitted_width - width) <= 2:
+        return width, height
+    return fitted_width, height
+
+
+def clip_signature(info: Dict[str, Any]) -> Tuple:
+    """The parameters that must be identical for a stream-copy concat to be valid."""
+    return tuple(info.get(field) for field in SIGNATURE_FIELDS)
+
+
+def profile_key(target: Dict[str, Any]) -> str:
+    """Short stable hash identifying a normalization profile."""
+    blob = json.dumps({"v": NORMALIZE_VERSION, **target}, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+class SegmentCache:
+    """LRU disk cache of normalized clip segments keyed by (source hash, profile)."""
+
+    def __init__(self, root: str = None, max_bytes: int = None):
+        self.root = root or os.getenv("LUMENX_SEGMENT_CACHE_DIR", DEFAULT_SEGMENT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("LUMENX_SEGMENT_CACHE_MAX_MB", DEFAULT_SEGMENT_CACHE_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+
+    def path_for(self, source_hash: str, profile: str) -> str:
+        return os.path.join(self.root, source_hash[:2], f"{source_hash}_{profile}.mp4")
+
+    def get(self, source_hash: str, profile: str) -> Optional[str]:
+        path = self.path_for(source_hash, profile)
+        if os.path.isfile(path):
+            os.utime(path, None)  # Bump recency for LRU
+            return path
+        return None
+
+    def evict(self):
+        evict_lru(self.root, self.max_bytes)
+
+
+class MergeProgress:
+    """
+    Aggregates ``-progress`` reports of concurrent ffmpeg processes into a single
+    percentage, weighted by the media seconds each process has to produce.
+    """
+
+    def __init__(self, callback: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._stage = None
+        self._total = 0.0
+        self._done: Dict[str, float] = {}
+        self._base = 0.0
+        self._span = 100.0
+
+    def stage(self, name: str, total_seconds: float, start: float = 0.0, end: float = 100.0):
+        """Starts a stage covering [start, end] percent of the whole merge."""
+        with self._lock:
+            self._stage = name
+            self._total = total_seconds or 0.0
+            self._done = {}
+            self._base, self._span = start, end - start
+        self._emit({})
+
+    def update(self, job: str, seconds: float, **stats):
+        with self._lock:
+            self._done[job] = max(seconds, self._done.get(job, 0.0))
+        self._emit(stats)
+
+    def _emit(self, stats: Dict[str, Any]):
+        if not self.callback:
+            return
+        with self._lock:
+            # Unknown duration (probe failed): stay at the stage start until it finishes
+            fraction = min(sum(self._done.values()) / self._total, 1.0) if self._total > 0 else 0.0
+            report = {"stage": self._stage, "percent": round(self._base + self._span * fraction, 1), **stats}
+        try:
+            self.callback(report)
+        except Exception as e:
+            logger.debug(f"[MERGE] Progress callback failed: {e}")
+
+
+def _parse_progress_block(lines: List[str]) -> Dict[str, str]:
+    return dict(line.split("=", 1) for line in lines if "=" in line)
+
+
+def _concat_list_line(path: str) -> str:
+    escaped = os.path.abspath(path).replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+
+class VideoMerger:
+    """Joins clips with a stream-copy concat, re-encoding only clips that do not match."""
+
+    def __init__(self, ffmpeg_path: str = None, work_dir: str = None, segment_cache: SegmentCache = None,
+                 workers: int = None, on_progress: Callable[[Dict[str, Any]], None] = None,
+                 cancel_event: threading.Event = None):
+        self.ffmpeg_path = ffmpeg_path or get_ffmpeg_path()
+        self.work_dir = work_dir or os.path.join("output", "merge_work")
+        self.segment_cache = segment_cache or SegmentCache()
+        self.workers = workers or default_ffmpeg_workers()
+        # Split the cores between concurrent encoders instead of letting each one grab all of them
+        self.threads_per_process = max(1, (os.cpu_count() or 1) // self.workers)
+        self.progress = MergeProgress(on_progress)
+        # Captured here because normalization runs on pool threads outside the caller's cancel_scope
+        self.cancel_event = cancel_event or current_cancel_event()
+
+    def _run(self, cmd: List[str], timeout: int = 600, job: str = None):
+        """
+        Runs ffmpeg, streaming its ``-progress`` output into ``self.progress``.
+
+        Kills the process when the merge is cancelled (TaskCancelledError) or the
+        timeout expires (TimeoutExpired). Raises CalledProcessError on failure,
+        with stderr as bytes like ``subprocess.run(capture_output=True)``.
+        """
+        cmd = [cmd[0], "-nostats", "-progress", "pipe:1"] + cmd[1:]
+        logger.debug(f"[MERGE] Running FFmpeg command: {' '.join(cmd)}")
+        job = job or uuid.uuid4().hex[:8]
+
+        with tempfile.TemporaryFile() as stderr_file:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, stdin=subprocess.DEVNULL)
+            reader = threading.Thread(target=self._read_progress, args=(proc, job), daemon=True)
+            reader.start()
+            deadline = time.time() + timeout
+            try:
+                while True:
+                    try:
+                        proc.wait(timeout=0.5)
+                        break
+                    except subprocess.TimeoutExpired:
+                        if self.cancel_event is not None and self.cancel_event.is_set():
+                            proc.kill()
+                            proc.wait()
+                            raise TaskCancelledError("Merge cancelled")
+                        if time.time() > deadline:
+                            proc.kill()
+                            proc.wait()
+                            raise subprocess.TimeoutExpired(cmd, timeout)
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+                reader.join(timeout=5)
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, output=b"", stderr=stderr)
+        return subprocess.CompletedProcess(cmd, proc.returncode, b"", stderr)
+
+    def _read_progress(self, proc: subprocess.Popen, job: str):
+        """Parses ffmpeg's key=value progress blocks (terminated by a ``progress=`` line)."""
+        block: List[str] = []
+        for raw in proc.stdout:
+            line = raw.decode(errors="replace").strip()
+            if not line.startswith("progress="):
+                block.append(line)
+                continue
+            values = _parse_progress_block(block)
+            block = []
+            try:
+                out_time_us = int(values.get("out_time_us") or values.get("out_time_ms") or 0)
+            except ValueError:
+                out_time_us = 0
+            fps = values.get("fps")
+            speed = (values.get("speed") or "").rstrip("x").strip()
+            self.progress.update(
+                job, max(out_time_us, 0) / 1_000_000,
+                fps=float(fps) if fps and fps != "N/A" else None,
+                speed=float(speed) if speed and speed != "N/A" else None,
+            )
+        proc.stdout.close()
+
+    def target_profile(self, infos: List[Dict[str, Any]], aspect_ratio: str = None,
+                       loudnorm: bool = False) -> Dict[str, Any]:
+        """
+        Normalization target for a set of clips.
+
+        Starts from the majority signature (clips already matching it are left
+        untouched), then widens/narrows the frame to ``aspect_ratio`` if the
+        majority does not already have it.
+        """
+        counts = Counter(clip_signature(i) for i in infos)
+        target = dict(zip(SIGNATURE_FIELDS, counts.most_common(1)[0][0]))
+        width, height = aspect_fit_size(target["width"], target["height"], aspect_ratio)
+        if (width, height) != (target["width"], target["height"]):
+            logger.info(f"[MERGE] Conforming {target['width']}x{target['height']} to {aspect_ratio}: {width}x{height}")
+            target["width"], target["height"] = width, height
+        if loudnorm and target.get("acodec"):
+            target["loudnorm"] = True
+        return target
+
+    def needs_normalization(self, info: Dict[str, Any], target: Dict[str, Any]) -> bool:
+        if target.get("loudnorm"):
+            return True
+        return clip_signature(info) != tuple(target[f] for f in SIGNATURE_FIELDS)
+
+    def _reencode_to_profile(self, info: Dict[str, Any], target: Dict[str, Any], output_path: str):
+        """Re-encodes one clip so that its parameters match the target profile."""
+        width, height = target["width"], target["height"]
+        vf = [
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease",
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2",
+            "setsar=1",
+        ]
+        if target.get("fps"):
+            vf.append(f"fps={target['fps']}")
+        if target.get("pix_fmt"):
+            vf.append(f"format={target['pix_fmt']}")
+
+        cmd = [self.ffmpeg_path, "-y", "-i", info["path"]]
+        has_target_audio = bool(target.get("acodec"))
+        if has_target_audio and not info.get("acodec"):
+            # Clip has no audio track: synthesize silence so the layout matches
+            layout = "mono" if target.get("channels") == 1 else "stereo"
+            cmd += ["-f", "lavfi", "-i", f"anullsrc=r={target['sample_rate']}:cl={layout}"]
+            cmd += ["-map", "0:v:0", "-map", "1:a:0", "-shortest"]
+        else:
+            cmd += ["-map", "0:v:0"]
+            if has_target_audio:
+                cmd += ["-map", "0:a:0"]
+
+        cmd += ["-vf", ",".join(vf), "-c:v", VIDEO_ENCODERS.get(target["vcodec"], "libx264"),
+                "-preset", "fast", "-crf", "20", "-threads", str(self.threads_per_process)]
+        if target.get("profile") in X264_PROFILES and target["vcodec"] == "h264":
+            cmd += ["-profile:v", target["profile"]]
+        if target.get("time_base") and "/" in target["time_base"]:
+            cmd += ["-video_track_timescale", target["time_base"].split("/")[1]]
+
+        if has_target_audio:
+            if target.get("loudnorm") and info.get("acodec"):
+                cmd += ["-af", LOUDNORM_FILTER]
+            cmd += ["-c:a", AUDIO_ENCODERS.get(target["acodec"], "aac"), "-ar", str(target["sample_rate"])]
+            if target.get("channels"):
+                cmd += ["-ac", str(target["channels"])]
+        else:
+            cmd += ["-an"]
+
+        cmd += ["-movflags", "+faststart", "-f", "mp4", output_path]
+        self._run(cmd, job=info["path"])
+
+    def _normalized_segment(self, info: Dict[str, Any], target: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        Returns (segment_path, cache_hit) for a clip normalized to the target profile.
+
+        Segments are written to the cache atomically, so concurrent merges never
+        see a partially written file.
+        """
+        source_hash = try_file_sha256(info["path"])
+        if not source_hash:
+            raise RuntimeError(f"Cannot read clip {info['path']}")
+        profile = profile_key(target)
+        cached = self.segment_cache.get(source_hash, profile)
+        if cached:
+            self.progress.update(info["path"], info.get("duration") or 0.0)
+            return cached, True
+
+        final_path = self.segment_cache.path_for(source_hash, profile)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        tmp_path = f"{final_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            self._reencode_to_profile(info, target, tmp_path)
+            os.replace(tmp_path, final_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return final_path, False
+
+    def normalize_clips(self, infos: List[Dict[str, Any]], target: Dict[str, Any]) -> Tuple[List[str], int, int]:
+        """
+        Conforms every clip that differs from ``target``, running up to
+        ``self.workers`` ffmpeg processes at once.
+
+        Returns (paths, reencoded, cached): ``paths`` lines up with ``infos`` and
+        points at the original file for clips that already match.
+        """
+        paths = [info["path"] for info in infos]
+        pending = [i for i, info in enumerate(infos) if self.needs_normalization(info, target)]
+        if not pending:
+            return paths, 0, 0
+
+        reencoded, cached = 0, 0
+        workers = min(self.workers, len(pending))
+        self.progress.stage("normalizing", sum(infos[i].get("duration") or 0.0 for i in pending), 0, 90)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ffmpeg-norm") as pool:
+            futures = {i: pool.submit(self._normalized_segment, infos[i], target) for i in pending}
+            try:
+                for i, future in futures.items():
+                    segment_path, hit = future.result()
+                    paths[i] = segment_path
+                    if hit:
+                        cached += 1
+                    else:
+                        reencoded += 1
+                        logger.info(f"[MERGE] Clip {i + 1} normalized: {clip_signature(infos[i])} -> "
+                                    f"{tuple(target[f] for f in SIGNATURE_FIELDS)}")
+            except BaseException:
+                for future in futures.values():
+                    future.cancel()
+                raise
+        logger.info(f"[MERGE] Normalized {len(pending)} clips with {workers} workers "
+                    f"(reencoded={reencoded}, cached={cached})")
+        return paths, reencoded, cached
+
+    def _concat_copy(self, paths: List[str], output_path: str, list_path: str):
+        with open(list_path, "w") as f:
+            for path in paths:
+                f.write(_concat_list_line(path))
+        self._run([
+            self.ffmpeg_path, "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy", "-movflags", "+faststart", output_path
+        ], job="concat")
+
+    def _concat_reencode(self, paths: List[str], output_path: str, list_path: str):
+        """Legacy full re-encode of the whole concatenation (last-resort fallback)."""
+        with open(list_path, "w") as f:
+            for path in paths:
+                f.write(_concat_list_line(path))
+        self._run([
+            self.ffmpeg_path, "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c:v", "libx264", "-crf", "23", "-preset", "fast",
+            "-c:a", "aac", "-b:a", "128k",
+            "-movflags", "+faststart", output_path
+        ], job="concat")
+
+    def merge(self, clip_paths: List[str], output_path: str, aspect_ratio: str = None,
+              loudnorm: bool = None) -> Dict[str, Any]:
+        """
+        Merges clips into output_path.
+
+        ``aspect_ratio`` (e.g. the storyboard's "16:9") pads the output frame to that
+        ratio; ``loudnorm`` loudness-normalizes every clip (defaults to
+        LUMENX_MERGE_LOUDNORM).
+
+        Returns a summary dict: {"mode": "copy" | "partial" | "reencode", "reencoded": int,
+        "cached": int, "elapsed": float}. ``reencoded`` counts clips normalized in this
+        call; ``cached`` counts mismatched clips served from the segment cache.
+        Raises subprocess.CalledProcessError / TimeoutExpired on ffmpeg failure and
+        TaskCancelledError when the cancel event is set (the partial output is removed).
+        """
+        if not self.ffmpeg_path:
+            raise RuntimeError("FFmpeg not found")
+        if loudnorm is None:
+            loudnorm = os.getenv("LUMENX_MERGE_LOUDNORM", "0") == "1"
+        start = time.time()
+        os.makedirs(self.work_dir, exist_ok=True)
+        job_id = uuid.uuid4().hex[:8]
+        list_path = os.path.join(self.work_dir, f"concat_{job_id}.txt")
+        temp_files = [list_path]
+
+        try:
+            try:
+                infos = [get_media_index().clip_info(p) for p in clip_paths]
+            except Exception as e:
+                logger.warning(f"[MERGE] Probe failed ({e}), falling back to full re-encode")
+                self.progress.stage("reencoding", 0)
+                self._concat_reencode(clip_paths, output_path, list_path)
+                return {"mode": "reencode", "reencoded": len(clip_paths), "cached": 0, "elapsed": time.time() - start}
+
+            total_duration = sum(info.get("duration") or 0.0 for info in infos)
+            target = self.target_profile(infos, aspect_ratio=aspect_ratio, loudnorm=loudnorm)
+            mismatched = any(self.needs_normalization(info, target) for info in infos)
+
+            if mismatched and target["vcodec"] not in VIDEO_ENCODERS:
+                logger.info(f"[MERGE] Majority codec {target['vcodec']} cannot be matched, re-encoding all")
+                self.progress.stage("reencoding", total_duration)
+                self._concat_reencode(clip_paths, output_path, list_path)
+                return {"mode": "reencode", "reencoded": len(clip_paths), "cached": 0, "elapsed": time.time() - start}
+
+            concat_paths, reencoded, cached = self.normalize_clips(infos, target)
+            raise_if_cancelled(self.cancel_event, "Merge cancelled")
+
+            try:
+                self.progress.stage("concat", total_duration, 90 if mismatched else 0, 100)
+                self._concat_copy(concat_paths, output_path, list_path)
+                mode = "partial" if mismatched else "copy"
+            except subprocess.CalledProcessError as e:
+                stderr = e.stderr.decode(errors="replace") if e.stderr else ""
+                logger.warning(f"[MERGE] Stream-copy concat failed, falling back to full re-encode: {stderr[-300:]}")
+                self.progress.stage("reencoding", total_duration)
+                self._concat_reencode(clip_paths, output_path, list_path)
+                mode, reencoded, cached = "reencode", len(clip_paths), 0
+
+            if mismatched:
+                self.segment_cache.evict()
+
+            elapsed = time.time() - start
+            logger.info(f"[MERGE] Merged {len(clip_paths)} clips in {elapsed:.2f}s "
+                        f"(mode={mode}, reencoded={reencoded}, cached={cached})")
+            return {"mode": mode, "reencoded": reencoded, "cached": cached, "elapsed": elapsed}
+        except TaskCancelledError:
+            temp_files.append(output_path)
+            raise
+        finally:
+            for path in temp_files:
+                if os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
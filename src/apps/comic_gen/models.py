@@ -24,6 +24,7 @@ class ImageVariant(BaseModel):
     # NEW: 上传来源标记
     is_uploaded_source: bool = Field(False, description="Whether this is a user-uploaded source file")
     upload_type: Optional[str] = Field(None, description="Upload type if is_uploaded_source: full_body/head_shot/three_views/image")
+    content_hash: Optional[str] = Field(None, description="sha256 of the file in the local media store")
 
 # Maximum variants to keep per asset (excluding favorited ones)
 MAX_VARIANTS_PER_ASSET = 10
@@ -41,6 +42,7 @@ class VideoVariant(BaseModel):
     audio_url: Optional[str] = Field(None, description="URL of the driving audio (for lip-sync)")
     source_image_id: Optional[str] = Field(None, description="ID of the static image used as source")
     is_favorited: bool = Field(False, description="Whether this variant is favorited")
+    content_hash: Optional[str] = Field(None, description="sha256 of the file in the local media store")
 
 class AssetUnit(BaseModel):
     """A unified asset container holding both static images and motion references"""
@@ -67,10 +69,13 @@ class VideoTask(BaseModel):
     asset_id: Optional[str] = Field(None, description="ID of the asset this video belongs to")
     image_url: str
     prompt: str
-    status: str = "pending"  # pending, processing, completed, failed
+    status: str = "pending"  # pending, processing, completed, failed, cancelled
     video_url: Optional[str] = None
+    content_hash: Optional[str] = Field(None, description="sha256 of the generated video in the local media store")
+    input_hash: Optional[str] = Field(None, description="sha256 of the snapshotted input image in the local media store")
     duration: int = Field(5, description="Video duration in seconds (5 or 10)")
     seed: Optional[int] = Field(None, description="Random seed for reproducibility")
+    bypass_cache: bool = Field(False, description="Always call the API instead of serving a seeded repeat from the result cache")
     resolution: str = Field("720p", description="Video resolution")
     generate_audio: bool = Field(False, description="Whether to generate audio")
     audio_url: Optional[str] = Field(None, description="URL of generated/uploaded audio")
@@ -213,6 +218,7 @@ class StoryboardFrame(BaseModel):
     
     audio_url: Optional[str] = Field(None, description="URL of the generated dialogue audio")
     sfx_url: Optional[str] = Field(None, description="URL of the generated sound effect")
+    bgm_url: Optional[str] = Field(None, description="URL of the generated background music")
     
     selected_video_id: Optional[str] = Field(None, description="ID of the selected VideoTask for this frame")
     locked: bool = Field(False, description="Whether this frame is locked from regeneration")
@@ -260,6 +266,7 @@ class Script(BaseModel):
     
     # Merged video URL
     merged_video_url: Optional[str] = Field(None, description="URL of the merged final video")
+    merged_hls_url: Optional[str] = Field(None, description="HLS playlist of the merged video, if packaged")
     
     created_at: float
     updated_at: float
@@ -0,0 +1,271 @@
+"""
+Chunked (map-reduce) entity extraction for long novels.
+
+``ScriptProcessor.parse_novel`` used to send the whole text in one prompt.
+Long serials exceed the context window, the single call runs for minutes and
+one malformed reply fails the whole job. For long texts the novel is instead
+split on chapter/paragraph boundaries (``split_novel``), entities are
+extracted per chunk in parallel, and ``merge_entities`` folds the per-chunk
+results together, de-duplicating characters across aliases and outfit
+variants, and scenes/props by name.
+
+Per-chunk replies are cached on disk (``ChunkResultCache``), keyed by model,
+prompt version and chunk text, so retrying a partially failed parse only
+re-runs the chunks that failed.
+
+Environment:
+    LUMENX_PARSE_CHUNK_CHARS         target chunk size in characters (default: 6000)
+    LUMENX_PARSE_CHUNK_CONCURRENCY   chunks extracted at once (default: 4)
+    LUMENX_PARSE_CACHE_DIR           chunk result cache (default: output/cache/parse_chunks)
+"""
+import difflib
+import hashlib
+import json
+import os
+import re
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from ...utils import get_logger
+from ...utils.result_cache import evict_lru
+
+logger = get_logger(__name__)
+
+DEFAULT_CHUNK_CHARS = 6000
+DEFAULT_CONCURRENCY = 4
+DEFAULT_CACHE_DIR = os.path.join("output", "cache", "parse_chunks")
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Chapter headings: 第十二章 / 第3回 / 卷一 / Chapter 7 / CHAPTER VII
+_CHAPTER_RE = re.compile(
+    r"^[ \t　]*(?:第[0-9零〇一二三四五六七八九十百千万两]+[章回节卷集幕]|卷[0-9零〇一二三四五六七八九十百千]+"
+    r"|chapter\s+[0-9ivxlc]+)",
+    re.IGNORECASE | re.MULTILINE,
+)
+_SENTENCE_END_RE = re.compile(r"(?<=[。！？!?…；;.])")
+# "叶墨 (古装)" / "叶墨（古装）" -> ("叶墨", "古装")
+_VARIANT_RE = re.compile(r"^(.*?)\s*[(（]\s*(.+?)\s*[)）]\s*$")
+
+
+def chunk_chars() -> int:
+    return int(os.getenv("LUMENX_PARSE_CHUNK_CHARS", DEFAULT_CHUNK_CHARS))
+
+
+def chunk_concurrency() -> int:
+    return max(1, int(os.getenv("LUMENX_PARSE_CHUNK_CONCURRENCY", DEFAULT_CONCURRENCY)))
+
+
+def _split_long(block: str, max_chars: int) -> List[str]:
+    """Splits one oversized paragraph at sentence ends, hard-cutting only sentences longer than a chunk."""
+    pieces, current = [], ""
+    for sentence in _SENTENCE_END_RE.split(block):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if len(current) + len(sentence) > max_chars and current:
+            pieces.append(current)
+            current = ""
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_novel(text: str, max_chars: int = None) -> List[str]:
+    """
+    Splits a novel into chunks of at most ``max_chars`` characters.
+
+    A new chapter always starts a new chunk; within a chapter paragraphs are
+    packed together, and only paragraphs longer than a chunk are cut (at
+    sentence ends where possible). A chapter heading stays with the text that
+    follows it, even when that text has to be cut.
+    """
+    max_chars = max_chars or chunk_chars()
+    starts = [m.start() for m in _CHAPTER_RE.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    sections = [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)])]
+
+    chunks = []
+    for section in sections:
+        current, heading = "", ""
+        for paragraph in re.split(r"\n\s*\n|\n", section):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if not current and not heading and len(paragraph) < max_chars and _CHAPTER_RE.match(paragraph):
+                heading = paragraph
+                continue
+            if heading:
+                # Cut together with the first paragraph so the heading never ends up alone
+                paragraph, heading = f"{heading}\n{paragraph}", ""
+            pieces = _split_long(paragraph, max_chars) if len(paragraph) > max_chars else [paragraph]
+            for piece in pieces:
+                if current and len(current) + 1 + len(piece) > max_chars:
+                    chunks.append(current)
+                    current = ""
+                current = f"{current}\n{piece}" if current else piece
+        if current or heading:
+            chunks.append(current or heading)
+    return chunks
+
+
+def changed_chunks(old_chunks: List[str], new_chunks: List[str]) -> List[int]:
+    """Indices of ``new_chunks`` that are not an unchanged chunk of ``old_chunks`` (edited, inserted or moved)."""
+    matcher = difflib.SequenceMatcher(a=old_chunks, b=new_chunks, autojunk=False)
+    changed = []
+    for tag, _, _, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            changed.extend(range(j1, j2))
+    return changed
+
+
+class ChunkResultCache:
+    """Parsed per-chunk LLM replies on disk, one JSON file per chunk."""
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir or os.getenv("LUMENX_PARSE_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, chunk: str) -> str:
+        return hashlib.sha256(f"{model}\n{prompt_version}\n{chunk}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(path, None)  # Bump recency for LRU
+        return data
+
+    def put(self, key: str, data: Dict[str, Any]):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not cache parse chunk {key[:12]}: {e}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        evict_lru(self.cache_dir, self.max_bytes)
+
+
+def normalize_name(name: str) -> str:
+    """Name key for de-duplication: whitespace removed, full-width brackets folded, case-folded."""
+    return re.sub(r"\s+", "", (name or "")).replace("（", "(").replace("）", ")").lower()
+
+
+def split_variant(name: str) -> Tuple[str, Optional[str]]:
+    """Splits an outfit variant name into (base name, outfit); outfit is None for base characters."""
+    match = _VARIANT_RE.match(name or "")
+    if match and match.group(1):
+        return match.group(1).strip(), match.group(2).strip()
+    return (name or "").strip(), None
+
+
+def _merge_fields(target: Dict[str, Any], item: Dict[str, Any]):
+    """Longest description wins (later chunks often describe more); other fields keep the first value seen."""
+    for key, value in item.items():
+        if key in ("id", "name", "aliases") or value in (None, ""):
+            continue
+        if key == "visual_weight":
+            try:
+                target[key] = max(int(target.get(key) or 0), int(value))
+            except (TypeError, ValueError):
+                pass
+        elif key in ("description", "clothing"):
+            if len(str(value)) > len(str(target.get(key) or "")):
+                target[key] = value
+        elif target.get(key) in (None, ""):
+            target[key] = value
+
+
+def _merge_characters(chunk_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Canonical base name for every known name/alias (normalized)
+    alias_to_base: Dict[str, str] = {}
+    merged: Dict[str, Dict[str, Any]] = {}
+    order: List[str] = []
+
+    def canonical_base(base: str, aliases: List[str]) -> str:
+        for candidate in [base] + aliases:
+            known = alias_to_base.get(normalize_name(candidate))
+            if known:
+                return known
+        return base
+
+    for result in chunk_results:
+        for char in result.get("characters", []) or []:
+            base, outfit = split_variant(char.get("name", ""))
+            if not base:
+                continue
+            aliases = [a for a in (char.get("aliases") or []) if isinstance(a, str) and a.strip()]
+            if outfit is None:
+                base_aliases = aliases
+            else:
+                # Aliases of a variant may be given with or without the outfit suffix
+                base_aliases = [split_variant(a)[0] for a in aliases]
+            base = canonical_base(base, base_aliases)
+            for name in [base] + base_aliases:
+                alias_to_base.setdefault(normalize_name(name), base)
+
+            name = f"{base} ({outfit})" if outfit else base
+            key = normalize_name(name)
+            if key not in merged:
+                merged[key] = {"name": name, "aliases": []}
+                order.append(key)
+            entry = merged[key]
+            for alias in aliases:
+                if normalize_name(alias) != key and alias not in entry["aliases"]:
+                    entry["aliases"].append(alias)
+            _merge_fields(entry, char)
+
+    # An outfit variant needs its base character to link to
+    for key in list(order):
+        base, outfit = split_variant(merged[key]["name"])
+        if outfit and normalize_name(base) not in merged:
+            merged[normalize_name(base)] = {"name": base, "aliases": [],
+                                   **{k: v for k, v in merged[key].items() if k in ("description", "age", "gender",
+                                                                                   "visual_weight")}}
+            order.insert(order.index(key), normalize_name(base))
+    return [merged[key] for key in order]
+
+
+def _merge_by_name(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    merged: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        name = (item.get("name") or "").strip()
+        if not name:
+            continue
+        entry = merged.setdefault(normalize_name(name), {"name": name})
+        _merge_fields(entry, item)
+    return list(merged.values())
+
+
+def merge_entities(chunk_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Reduce step: folds per-chunk extraction results into one entity set.
+
+    Characters are merged when their names or aliases match (also across
+    outfit variants, "名字 (服装)"); scenes and props by normalized name. IDs are
+    reassigned, since every chunk numbered its entities from 001.
+    """
+    characters = _merge_characters(chunk_results)
+    scenes = _merge_by_name([s for r in chunk_results for s in (r.get("scenes") or [])])
+    props = _merge_by_name([p for r in chunk_results for p in (r.get("props") or [])])
+    for prefix, items in (("char", characters), ("scene", scenes), ("prop", props)):
+        for i, item in enumerate(items, 1):
+            item["id"] = f"{prefix}_{i:03d}"
+    return {"characters": characters, "scenes": scenes, "props": props}
@@ -1,4 +1,4 @@
-from typing import Dict, Any, List, Optional, Tuple
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional, Tuple
 import json
 import os
 import time
@@ -6,20 +6,36 @@ import uuid
 import subprocess
 import threading
 import platform
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 from .models import Script, GenerationStatus, VideoTask, Character, Scene, StoryboardFrame
 from .llm import ScriptProcessor
+from .novel_chunks import changed_chunks, split_novel
+from .reparse import reconcile_entities
 from .assets import AssetGenerator
 from .storyboard import StoryboardGenerator
 from .video import VideoGenerator
 from .audio import AudioGenerator
 from .export import ExportManager
+from .merge import VideoMerger
+from .media_index import get_media_index
+from .proxy import get_proxy_manager
+from .hls import hls_enabled_by_default, package_hls
 from ...utils import get_logger
-from ...utils.oss_utils import is_object_key
+from ...utils.http_client import get_http_session
+from ...utils.oss_utils import is_object_key, OSSImageUploader
+from ...utils.cancellation import TaskCancelledError, cancel_scope
+from ...utils.dashscope_client import iterate_on_bridge
+from ...utils.executors import IO, run_in
+from ...utils.media_store import get_media_store
+from ...utils.oss_media_cache import get_oss_media_cache
 from ...utils.system_check import get_ffmpeg_path, get_ffmpeg_install_instructions
 
 logger = get_logger(__name__)
 
+# Share of a merge's progress spent fetching OSS-hosted clips, when any are remote
+FETCH_PROGRESS_SHARE = 10
+
 class ComicGenPipeline:
     def __init__(self, config: Dict[str, Any] = None):
         self.config = config or {}
@@ -38,6 +54,18 @@ class ComicGenPipeline:
         # Format: { task_id: { status: str, progress: int, error: str, script_id: str, asset_id: str, created_at: float } }
         self.asset_generation_tasks: Dict[str, Dict[str, Any]] = {}
         self.video_generation_tasks: Dict[str, Dict[str, Any]] = {}
+        # Background merge jobs, with live ffmpeg progress (percent/fps/speed/stage)
+        self.merge_tasks: Dict[str, Dict[str, Any]] = {}
+        # Guards the "already queued or running" check and the insert in create_merge_task
+        self._merge_lock = threading.Lock()
+
+        # Cancellation: one threading.Event per queued/in-flight task id.
+        # Workers poll these so a cancel stops local polling and downloads.
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._cancel_lock = threading.Lock()
+
+        # Background OSS staging of selected reference assets (see stage_for_generation)
+        self._staging_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="oss-stage")
 
     # ... (existing methods)
 
@@ -47,7 +75,9 @@ class ComicGenPipeline:
         if not script:
             raise ValueError("Script not found")
             
-        export_url = self.export_manager.render_project(script, options)
+        # Fetched OSS clips stay pinned in the cache until ffmpeg is done with them
+        with get_oss_media_cache().hold():
+            export_url = self.export_manager.render_project(script, options)
         return export_url
 
     def get_script(self, script_id: str) -> Optional[Script]:
@@ -86,30 +116,35 @@ class ComicGenPipeline:
         return script
     
     def reparse_project(self, script_id: str, text: str) -> Script:
-        """Re-parse the text for an existing project, replacing all entities."""
+        """
+        Re-parses edited text for an existing project. Only chunks that changed
+        since the last parse are re-analyzed; existing characters, scenes and
+        props keep their IDs, variants and locks (see reparse.reconcile_entities).
+        """
         existing_script = self.scripts.get(script_id)
         if not existing_script:
             raise ValueError("Script not found")
-        
-        # Parse the new text (this generates new entities with new IDs)
-        new_script = self.script_processor.parse_novel(existing_script.title, text)
-        
-        # Preserve the original script ID and timestamps
-        new_script.id = existing_script.id
-        new_script.created_at = existing_script.created_at
-        new_script.updated_at = time.time()
-        
-        # Preserve project-level settings
-        new_script.art_direction = existing_script.art_direction
-        new_script.model_settings = existing_script.model_settings
-        new_script.style_preset = existing_script.style_preset
-        new_script.style_prompt = existing_script.style_prompt
-        new_script.merged_video_url = existing_script.merged_video_url
-        
-        # Replace the script in memory
-        self.scripts[script_id] = new_script
+        if text == existing_script.original_text:
+            logger.info(f"Reparse {script_id}: text unchanged, nothing to do")
+            return existing_script
+
+        new_chunks = split_novel(text)
+        if existing_script.characters or existing_script.scenes or existing_script.props:
+            old_chunks = split_novel(existing_script.original_text or "")
+            indices = changed_chunks(old_chunks, new_chunks)
+        else:
+            indices = list(range(len(new_chunks)))
+        logger.info(f"Reparse {script_id}: {len(indices)}/{len(new_chunks)} chunks changed")
+
+        if indices:
+            extracted = self.script_processor.extract_entities(new_chunks, indices)
+        else:
+            extracted = {"characters": [], "scenes": [], "props": []}
+
+        stats = reconcile_entities(existing_script, extracted, text)
+        logger.info(f"Reparse {script_id}: {stats}")
         self._save_data()
-        return new_script
+        return existing_script
 
 
     def generate_assets(self, script_id: str) -> Script:
@@ -305,33 +340,46 @@ class ComicGenPipeline:
         if not task:
             logger.error(f"Task {task_id} not found")
             return
+        if task["status"] == "cancelled":
+            logger.info(f"Task {task_id} was cancelled before it started")
+            self._release_cancel_event(task_id)
+            return
         
         task["status"] = "processing"
+        cancel_event = self._get_cancel_event(task_id)
         
         try:
             params = task["params"]
             # Call the synchronous generate_asset method
-            self.generate_asset(
-                task["script_id"],
-                task["asset_id"],
-                task["asset_type"],
-                params["style_preset"],
-                params["reference_image_url"],
-                params["style_prompt"],
-                params["generation_type"],
-                params["prompt"],
-                params["apply_style"],
-                params["negative_prompt"],
-                params["batch_size"],
-                params["model_name"]
-            )
+            with cancel_scope(cancel_event):
+                self.generate_asset(
+                    task["script_id"],
+                    task["asset_id"],
+                    task["asset_type"],
+                    params["style_preset"],
+                    params["reference_image_url"],
+                    params["style_prompt"],
+                    params["generation_type"],
+                    params["prompt"],
+                    params["apply_style"],
+                    params["negative_prompt"],
+                    params["batch_size"],
+                    params["model_name"]
+                )
+            if cancel_event.is_set():
+                raise TaskCancelledError("Task cancelled")
             task["status"] = "completed"
             task["progress"] = 100
             logger.info(f"Task {task_id} completed successfully")
+        except TaskCancelledError:
+            task["status"] = "cancelled"
+            logger.info(f"Task {task_id} cancelled")
         except Exception as e:
             task["status"] = "failed"
             task["error"] = str(e)
             logger.error(f"Task {task_id} failed: {e}")
+        finally:
+            self._release_cancel_event(task_id)
 
     def get_asset_generation_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
         """Returns the status of an asset generation task."""
@@ -340,13 +388,15 @@ class ComicGenPipeline:
         if not task:
             # Then check video tasks
             task = self.video_generation_tasks.get(task_id)
+        if not task:
+            task = self.merge_tasks.get(task_id)
             
         if not task:
             return None
         
-        return {
+        status = {
             "task_id": task_id,
-            "status": task["status"],
+            "status": task["status"],  # pending | processing | completed | failed | cancelled
             "progress": task.get("progress", 0),
             "error": task.get("error"),
             "asset_id": task.get("asset_id"),
@@ -354,6 +404,16 @@ class ComicGenPipeline:
             "script_id": task.get("script_id"),
             "created_at": task.get("created_at")
         }
+        if task.get("type") == "merge":
+            status.update({
+                "type": "merge",
+                "stage": task.get("stage"),
+                "fps": task.get("fps"),
+                "speed": task.get("speed"),
+                "merged_video_url": task.get("merged_video_url"),
+                "merged_hls_url": task.get("merged_hls_url"),
+            })
+        return status
 
     def create_motion_ref_task(self, script_id: str, asset_id: str, asset_type: str, 
                                 prompt: Optional[str] = None, audio_url: Optional[str] = None, 
@@ -389,28 +449,258 @@ class ComicGenPipeline:
         if not task:
             logger.error(f"Video task {task_id} not found")
             return
+        if task["status"] == "cancelled":
+            logger.info(f"Video task {task_id} was cancelled before it started")
+            self._release_cancel_event(task_id)
+            return
             
         task["status"] = "processing"
+        cancel_event = self._get_cancel_event(task_id)
         
         try:
             params = task["params"]
             # Call the synchronous generate_motion_ref method
-            self.generate_motion_ref(
-                script_id=script_id,
-                asset_id=task["asset_id"],
-                asset_type=task["asset_type"],
-                prompt=params["prompt"],
-                audio_url=params["audio_url"],
-                duration=params["duration"],
-                batch_size=params["batch_size"]
-            )
+            with cancel_scope(cancel_event):
+                self.generate_motion_ref(
+                    script_id=script_id,
+                    asset_id=task["asset_id"],
+                    asset_type=task["asset_type"],
+                    prompt=params["prompt"],
+                    audio_url=params["audio_url"],
+                    duration=params["duration"],
+                    batch_size=params["batch_size"]
+                )
+            if cancel_event.is_set():
+                raise TaskCancelledError("Task cancelled")
             task["status"] = "completed"
             task["progress"] = 100
             logger.info(f"Video task {task_id} completed successfully")
+        except TaskCancelledError:
+            task["status"] = "cancelled"
+            logger.info(f"Video task {task_id} cancelled")
         except Exception as e:
             task["status"] = "failed"
             task["error"] = str(e)
             logger.error(f"Video task {task_id} failed: {e}")
+        finally:
+            self._release_cancel_event(task_id)
+
+    # --- Video merge jobs ---
+
+    def create_merge_task(self, script_id: str, hls: Optional[bool] = None) -> str:
+        """
+        Queues a background merge of the project's selected videos.
+
+        Validation (missing project, no frame with a video) happens here so the
+        caller gets the error immediately; clips are fetched by the task itself. If a merge of the project is already queued
+        or running, its task id is returned instead of starting another one.
+        ``hls`` adds an HLS packaging stage (default: LUMENX_HLS_PACKAGING).
+        """
+        script = self.scripts.get(script_id)
+        if not script:
+            raise ValueError("Script not found")
+        # Concurrent POST /merge requests run on different executor threads
+        with self._merge_lock:
+            for task_id, task in self.merge_tasks.items():
+                if task["script_id"] == script_id and task["status"] in ("pending", "processing"):
+                    return task_id
+            self._merge_clip_refs(script)
+
+            task_id = str(uuid.uuid4())
+            self.merge_tasks[task_id] = {
+                "type": "merge",
+                "status": "pending",
+                "progress": 0,
+                "stage": None,
+                "fps": None,
+                "speed": None,
+                "error": None,
+                "script_id": script_id,
+                "merged_video_url": None,
+                "merged_hls_url": None,
+                "hls": hls_enabled_by_default() if hls is None else hls,
+                "created_at": time.time(),
+            }
+        return task_id
+
+    def process_merge_task(self, task_id: str):
+        """Runs a merge task in the background, recording ffmpeg progress on the task."""
+        task = self.merge_tasks.get(task_id)
+        if not task:
+            logger.error(f"Merge task {task_id} not found")
+            return
+        if task["status"] == "cancelled":
+            logger.info(f"Merge task {task_id} was cancelled before it started")
+            self._release_cancel_event(task_id)
+            return
+        with self._cancel_lock:
+            # A repeated merge request returns the running task id; only its first worker runs it
+            if task["status"] != "pending":
+                return
+            task["status"] = "processing"
+        cancel_event = self._get_cancel_event(task_id)
+
+        def on_progress(report: Dict[str, Any]):
+            task["stage"] = report.get("stage")
+            task["progress"] = report.get("percent", task["progress"])
+            if report.get("fps") is not None:
+                task["fps"] = report["fps"]
+            if report.get("speed") is not None:
+                task["speed"] = report["speed"]
+
+        try:
+            # Fetched OSS clips stay pinned in the cache until ffmpeg is done with them
+            with get_oss_media_cache().hold():
+                script = self.merge_videos(task["script_id"], on_progress=on_progress, cancel_event=cancel_event,
+                                           hls=task["hls"])
+            task["merged_video_url"] = script.merged_video_url
+            task["merged_hls_url"] = script.merged_hls_url
+            task["status"] = "completed"
+            task["progress"] = 100
+            logger.info(f"Merge task {task_id} completed successfully")
+        except TaskCancelledError:
+            task["status"] = "cancelled"
+            logger.info(f"Merge task {task_id} cancelled")
+        except Exception as e:
+            task["status"] = "failed"
+            task["error"] = str(e)
+            logger.error(f"Merge task {task_id} failed: {e}")
+        finally:
+            self._release_cancel_event(task_id)
+
+    # --- OSS pre-staging ---
+
+    def stage_for_generation(self, url: Optional[str]):
+        """
+        Uploads a newly selected local asset to OSS in the background.
+
+        Model clients upload local inputs through the content-hash upload index,
+        so once staging finishes a later storyboard render or I2V/R2V submission
+        finds the object already there and only signs its URL.
+        """
+        if not url or is_object_key(url) or url.startswith(("http://", "https://")):
+            return
+        local_path = os.path.join("output", url)
+        if not os.path.isfile(local_path):
+            local_path = url
+            if not os.path.isfile(local_path):
+                return
+        uploader = OSSImageUploader()
+        if not uploader.is_configured:
+            return
+        ext = os.path.splitext(local_path)[1].lower()
+        sub_path = "temp/r2v_input" if ext in (".mp4", ".mov", ".webm") else "temp/ref_images"
+        self._staging_executor.submit(self._stage_upload, uploader, local_path, sub_path)
+
+    def _stage_upload(self, uploader: OSSImageUploader, local_path: str, sub_path: str):
+        start = time.time()
+        try:
+            object_key = uploader.upload_input_file(local_path, sub_path=sub_path)
+            if object_key:
+                logger.info(f"Pre-staged {local_path} -> {object_key} ({time.time() - start:.2f}s)")
+        except Exception as e:
+            logger.warning(f"Pre-staging failed for {local_path}: {e}")
+
+    # --- Cancellation ---
+
+    def _get_cancel_event(self, task_id: str) -> threading.Event:
+        """Returns the cancel event for a task, creating it on first use."""
+        with self._cancel_lock:
+            event = self._cancel_events.get(task_id)
+            if event is None:
+                event = threading.Event()
+                self._cancel_events[task_id] = event
+            return event
+
+    def _release_cancel_event(self, task_id: str):
+        with self._cancel_lock:
+            self._cancel_events.pop(task_id, None)
+
+    def _find_video_task(self, task_id: str) -> Tuple[Optional[Script], Optional[VideoTask]]:
+        """Locates a VideoTask across all projects."""
+        for script in self.scripts.values():
+            for t in script.video_tasks or []:
+                if t.id == task_id:
+                    return script, t
+        return None, None
+
+    def cancel_task(self, task_id: str) -> Dict[str, Any]:
+        """
+        Cancels a queued or in-flight task (asset image, motion ref, video or merge task).
+
+        Queued tasks are dropped before they start. In-flight tasks have their
+        cancel event set, which stops local polling/downloads and cancels the
+        remote DashScope task where the provider still allows it.
+        Returns {"task_id", "status", "cancelled"}.
+        """
+        task = (self.asset_generation_tasks.get(task_id) or self.video_generation_tasks.get(task_id)
+                or self.merge_tasks.get(task_id))
+        if task:
+            cancelled = task["status"] in ("pending", "processing")
+            if cancelled:
+                task["status"] = "cancelled"
+                self._get_cancel_event(task_id).set()
+                logger.info(f"Cancelled task {task_id}")
+            return {"task_id": task_id, "status": task["status"], "cancelled": cancelled}
+
+        script, video_task = self._find_video_task(task_id)
+        if not video_task:
+            raise ValueError(f"Task {task_id} not found")
+
+        cancelled = video_task.status in ("pending", "processing")
+        if cancelled:
+            video_task.status = "cancelled"
+            self._get_cancel_event(task_id).set()
+            if video_task.asset_id:
+                self._sync_asset_video_task(script, video_task)
+            self._save_data()
+            logger.info(f"Cancelled video task {task_id}")
+        return {"task_id": task_id, "status": video_task.status, "cancelled": cancelled}
+
+    def cancel_tasks(self, script_id: str, task_ids: List[str] = None, frame_id: str = None,
+                     asset_id: str = None) -> List[str]:
+        """
+        Batch-cancels active tasks of a project.
+
+        With no filters every pending/processing task of the project is cancelled;
+        otherwise only tasks matching the given ids, frame or asset.
+        Returns the ids of the tasks that were actually cancelled.
+        """
+        script = self.scripts.get(script_id)
+        if not script:
+            raise ValueError("Script not found")
+
+        wanted = set(task_ids) if task_ids else None
+
+        def matches(tid: str, t_frame_id: Optional[str], t_asset_id: Optional[str]) -> bool:
+            if wanted is not None and tid not in wanted:
+                return False
+            if frame_id and t_frame_id != frame_id:
+                return False
+            if asset_id and t_asset_id != asset_id:
+                return False
+            return True
+
+        candidates = []
+        for tasks in (self.asset_generation_tasks, self.video_generation_tasks, self.merge_tasks):
+            for tid, t in list(tasks.items()):
+                if t.get("script_id") == script_id and t["status"] in ("pending", "processing") \
+                        and matches(tid, None, t.get("asset_id")):
+                    candidates.append(tid)
+        for t in script.video_tasks or []:
+            if t.status in ("pending", "processing") and matches(t.id, t.frame_id, t.asset_id):
+                candidates.append(t.id)
+
+        cancelled = []
+        for tid in candidates:
+            try:
+                if self.cancel_task(tid)["cancelled"]:
+                    cancelled.append(tid)
+            except ValueError:
+                continue
+        if cancelled:
+            logger.info(f"Cancelled {len(cancelled)} task(s) in project {script_id}")
+        return cancelled
 
     def sync_descriptions_from_script_entities(self, script_id: str) -> Script:
         """
@@ -462,6 +752,7 @@ class ComicGenPipeline:
         if not script:
             raise ValueError("Script not found")
         
+        self.cancel_tasks(script_id, asset_id=char_id)
         script.characters = [c for c in script.characters if c.id != char_id]
         self._save_data()
         return script
@@ -485,6 +776,7 @@ class ComicGenPipeline:
         if not script:
             raise ValueError("Script not found")
         
+        self.cancel_tasks(script_id, asset_id=scene_id)
         script.scenes = [s for s in script.scenes if s.id != scene_id]
         self._save_data()
         return script
@@ -551,6 +843,7 @@ class ComicGenPipeline:
             target_asset.avatar_url = image_url
             
         self._save_data()
+        self.stage_for_generation(image_url)
         return script
 
     def update_asset_description(self, script_id: str, asset_id: str, asset_type: str, description: str) -> Script:
@@ -591,7 +884,8 @@ class ComicGenPipeline:
         asset_id: str, 
         upload_type: str, 
         image_url: str, 
-        description: Optional[str] = None
+        description: Optional[str] = None,
+        content_hash: Optional[str] = None
     ) -> Script:
         """
         Adds an uploaded image as a new variant to an asset.
@@ -604,6 +898,7 @@ class ComicGenPipeline:
             upload_type: "full_body", "head_shot", "three_views", or "image"
             image_url: URL of the uploaded image (OSS Object Key)
             description: Optional modified description for reverse generation
+            content_hash: sha256 of the uploaded file in the local media store
         """
         from .models import ImageVariant, AssetUnit
         
@@ -629,7 +924,8 @@ class ComicGenPipeline:
             url=image_url,
             prompt_used=description or target_asset.description,
             is_uploaded_source=True,
-            upload_type=upload_type
+            upload_type=upload_type,
+            content_hash=content_hash
         )
         
         # Update description if provided
@@ -670,7 +966,8 @@ class ComicGenPipeline:
                 url=image_url,
                 prompt_used=description or target_asset.description,
                 is_uploaded_source=True,
-                upload_type=upload_type
+                upload_type=upload_type,
+                content_hash=content_hash
             )
             
             if upload_type == "full_body":
@@ -715,6 +1012,7 @@ class ComicGenPipeline:
             logger.info(f"Added uploaded variant {new_variant.id} to {asset_type} {asset_id}")
         
         self._save_data()
+        self.stage_for_generation(image_url)
         return script
 
     def update_project_style(self, script_id: str, style_preset: str, style_prompt: Optional[str] = None) -> Script:
@@ -752,6 +1050,68 @@ class ComicGenPipeline:
 
     # === STORYBOARD DRAMATIZATION v2 ===
 
+    @staticmethod
+    def _storyboard_entities(script: Script) -> Dict[str, Any]:
+        """Entities JSON from existing characters, scenes, props (context for the storyboard prompt)."""
+        return {
+            "characters": [{"id": c.id, "name": c.name, "description": c.description} for c in script.characters],
+            "scenes": [{"id": s.id, "name": s.name, "description": s.description} for s in script.scenes],
+            "props": [{"id": p.id, "name": p.name, "description": p.description} for p in script.props],
+        }
+
+    @staticmethod
+    def _build_frame(script: Script, frame_data: Dict[str, Any]) -> StoryboardFrame:
+        """Converts one raw frame dict from the LLM into a StoryboardFrame, resolving entity names to IDs."""
+        # Resolve scene ID by name
+        scene_ref_name = frame_data.get("scene_ref_name", "")
+        scene_id = None
+        for scene in script.scenes:
+            if scene.name == scene_ref_name or scene_ref_name in scene.name:
+                scene_id = scene.id
+                break
+        if not scene_id and script.scenes:
+            scene_id = script.scenes[0].id  # Fallback to first scene
+        elif not scene_id:
+            scene_id = str(uuid.uuid4())  # Generate a placeholder ID
+
+        # Resolve character IDs by names
+        char_ref_names = frame_data.get("character_ref_names", [])
+        character_ids = []
+        for char_name in char_ref_names:
+            for char in script.characters:
+                if char.name == char_name or char_name in char.name:
+                    character_ids.append(char.id)
+                    break
+
+        # Resolve prop IDs by names
+        prop_ref_names = frame_data.get("prop_ref_names", [])
+        prop_ids = []
+        for prop_name in prop_ref_names:
+            for prop in script.props:
+                if prop.name == prop_name or prop_name in prop.name:
+                    prop_ids.append(prop.id)
+                    break
+
+        return StoryboardFrame(
+            id=str(uuid.uuid4()),
+            scene_id=scene_id,
+            character_ids=character_ids,
+            prop_ids=prop_ids,
+            # Action description - now a unified field combining character acting and physics
+            action_description=frame_data.get("action_description", ""),
+            # Visual atmosphere
+            visual_atmosphere=frame_data.get("visual_atmosphere"),
+            # Camera parameters
+            shot_size=frame_data.get("shot_size"),
+            camera_angle=frame_data.get("camera_angle", "平视"),
+            camera_movement=frame_data.get("camera_movement"),
+            # Dialogue
+            dialogue=frame_data.get("dialogue"),
+            speaker=frame_data.get("speaker"),
+            # Status
+            status=GenerationStatus.PENDING
+        )
+
     def analyze_text_to_frames(self, script_id: str, text: str) -> Script:
         """
         Analyzes script text and generates storyboard frames using LLM.
@@ -763,69 +1123,11 @@ class ComicGenPipeline:
         
         logger.info(f"Analyzing text to frames for project {script_id}")
         
-        # Build entities JSON from existing characters, scenes, props
-        entities_json = {
-            "characters": [{"id": c.id, "name": c.name, "description": c.description} for c in script.characters],
-            "scenes": [{"id": s.id, "name": s.name, "description": s.description} for s in script.scenes],
-            "props": [{"id": p.id, "name": p.name, "description": p.description} for p in script.props],
-        }
-        
         # Call LLM to analyze text
-        raw_frames = self.script_processor.analyze_to_storyboard(text, entities_json)
+        raw_frames = self.script_processor.analyze_to_storyboard(text, self._storyboard_entities(script))
         
         # Convert raw frame dicts to StoryboardFrame objects
-        new_frames = []
-        for idx, frame_data in enumerate(raw_frames):
-            # Resolve scene ID by name
-            scene_ref_name = frame_data.get("scene_ref_name", "")
-            scene_id = None
-            for scene in script.scenes:
-                if scene.name == scene_ref_name or scene_ref_name in scene.name:
-                    scene_id = scene.id
-                    break
-            if not scene_id and script.scenes:
-                scene_id = script.scenes[0].id  # Fallback to first scene
-            elif not scene_id:
-                scene_id = str(uuid.uuid4())  # Generate a placeholder ID
-            
-            # Resolve character IDs by names
-            char_ref_names = frame_data.get("character_ref_names", [])
-            character_ids = []
-            for char_name in char_ref_names:
-                for char in script.characters:
-                    if char.name == char_name or char_name in char.name:
-                        character_ids.append(char.id)
-                        break
-            
-            # Resolve prop IDs by names
-            prop_ref_names = frame_data.get("prop_ref_names", [])
-            prop_ids = []
-            for prop_name in prop_ref_names:
-                for prop in script.props:
-                    if prop.name == prop_name or prop_name in prop.name:
-                        prop_ids.append(prop.id)
-                        break
-            
-            frame = StoryboardFrame(
-                id=str(uuid.uuid4()),
-                scene_id=scene_id,
-                character_ids=character_ids,
-                prop_ids=prop_ids,
-                # Action description - now a unified field combining character acting and physics
-                action_description=frame_data.get("action_description", ""),
-                # Visual atmosphere
-                visual_atmosphere=frame_data.get("visual_atmosphere"),
-                # Camera parameters
-                shot_size=frame_data.get("shot_size"),
-                camera_angle=frame_data.get("camera_angle", "平视"),
-                camera_movement=frame_data.get("camera_movement"),
-                # Dialogue
-                dialogue=frame_data.get("dialogue"),
-                speaker=frame_data.get("speaker"),
-                # Status
-                status=GenerationStatus.PENDING
-            )
-            new_frames.append(frame)
+        new_frames = [self._build_frame(script, frame_data) for frame_data in raw_frames]
         
         # Replace existing frames with new ones
         script.frames = new_frames
@@ -835,6 +1137,34 @@ class ComicGenPipeline:
         self._save_data()
         return script
 
+    async def stream_text_to_frames(self, script_id: str, text: str) -> AsyncIterator[StoryboardFrame]:
+        """
+        Streaming variant of ``analyze_text_to_frames``: yields each frame as
+        soon as the LLM has written it.
+
+        The new frames are collected separately and replace the existing ones
+        only once the stream completes; if it fails or the consumer stops, the
+        project keeps its previous storyboard.
+        """
+        script = self.scripts.get(script_id)
+        if not script:
+            raise ValueError("Script not found")
+
+        logger.info(f"Streaming text to frames for project {script_id}")
+        entities_json = self._storyboard_entities(script)
+        new_frames: List[StoryboardFrame] = []
+        async for frame_data in iterate_on_bridge(self.script_processor.stream_storyboard(text, entities_json)):
+            if not isinstance(frame_data, dict):
+                continue
+            frame = self._build_frame(script, frame_data)
+            new_frames.append(frame)
+            yield frame
+
+        script.frames = new_frames
+        script.updated_at = time.time()
+        logger.info(f"Streamed {len(new_frames)} frames from text analysis")
+        await run_in(IO, self._save_data)
+
     def refine_frame_prompt(self, script_id: str, frame_id: str, raw_prompt: str, assets: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Refines a raw prompt into bilingual (CN/EN) prompts using LLM.
@@ -965,6 +1295,8 @@ class ComicGenPipeline:
         if not script:
             raise ValueError("Script not found")
         
+        # Stop any video generation still running for this frame
+        self.cancel_tasks(script_id, frame_id=frame_id)
         script.frames = [f for f in script.frames if f.id != frame_id]
         self._save_data()
         return script
@@ -1098,6 +1430,7 @@ class ComicGenPipeline:
                         video_variant = VideoVariant(
                             id=f"video_{uuid.uuid4().hex[:8]}",
                             url=video_result["video_url"],
+                            content_hash=video_result.get("content_hash"),
                             prompt_used=prompt,
                             audio_url=audio_url,
                             source_image_id=None  # Don't set this to avoid complications
@@ -1107,6 +1440,7 @@ class ComicGenPipeline:
                         # Auto-select the first generated video
                         if not asset_unit.selected_video_id:
                             asset_unit.selected_video_id = video_variant.id
+                            self.stage_for_generation(video_variant.url)
 
                         generated_videos.append(video_variant)
                         logger.info(f"Generated motion ref video: {video_variant.id}")
@@ -1120,6 +1454,7 @@ class ComicGenPipeline:
                             prompt=prompt,
                             status="completed",  # Since generation is done in this step
                             video_url=video_result["video_url"],
+                            content_hash=video_result.get("content_hash"),
                             duration=duration,
                             created_at=time.time(),
                             generate_audio=bool(audio_url),
@@ -1131,6 +1466,8 @@ class ComicGenPipeline:
                         target_asset.video_assets.append(video_task)
                         generated_videos.append(video_task)
                         logger.info(f"Generated motion ref video for {asset_type}: {video_task.id}")
+            except TaskCancelledError:
+                raise
             except Exception as e:
                 logger.error(f"Failed to generate motion ref video for {asset_type}: {e}")
 
@@ -1273,7 +1610,7 @@ class ComicGenPipeline:
         self._save_data()
         return script
 
-    def create_video_task(self, script_id: str, image_url: str, prompt: str, duration: int = 5, seed: int = None, resolution: str = "720p", generate_audio: bool = False, audio_url: str = None, prompt_extend: bool = True, negative_prompt: str = None, model: str = "wan2.6-i2v", frame_id: str = None, shot_type: str = "single", generation_mode: str = "i2v", reference_video_urls: list = None) -> Tuple[Script, str]:
+    def create_video_task(self, script_id: str, image_url: str, prompt: str, duration: int = 5, seed: int = None, resolution: str = "720p", generate_audio: bool = False, audio_url: str = None, prompt_extend: bool = True, negative_prompt: str = None, model: str = "wan2.6-i2v", frame_id: str = None, shot_type: str = "single", generation_mode: str = "i2v", reference_video_urls: list = None, bypass_cache: bool = False) -> Tuple[Script, str]:
         """Creates a new video generation task."""
         script = self.get_script(script_id)
         if not script:
@@ -1287,6 +1624,7 @@ class ComicGenPipeline:
         
         # Snapshot the input image to ensure consistency
         snapshot_url = image_url
+        input_hash = None
         try:
             # Resolve source path
             if image_url and not image_url.startswith("http"):
@@ -1302,12 +1640,12 @@ class ComicGenPipeline:
                     snapshot_filename = f"{task_id}{ext}"
                     snapshot_path = os.path.join(snapshot_dir, snapshot_filename)
                     
-                    # Copy file
-                    import shutil
-                    shutil.copy2(src_path, snapshot_path)
+                    # Hardlink to the content-addressed blob instead of copying bytes
+                    input_hash = get_media_store().link(src_path, snapshot_path)
                     
                     # Update URL to relative path
-                    snapshot_url = f"video_inputs/{snapshot_filename}"
+                    if input_hash:
+                        snapshot_url = f"video_inputs/{snapshot_filename}"
         except Exception as e:
             logger.error(f"Failed to snapshot input image: {e}")
             # Fallback to original URL
@@ -1317,10 +1655,12 @@ class ComicGenPipeline:
             project_id=script_id,
             frame_id=frame_id,
             image_url=snapshot_url,
+            input_hash=input_hash,
             prompt=prompt,
             status="pending",
             duration=duration,
             seed=seed,
+            bypass_cache=bypass_cache,
             resolution=resolution,
             generate_audio=generate_audio,
             audio_url=audio_url,
@@ -1342,7 +1682,6 @@ class ComicGenPipeline:
 
     def _download_temp_image(self, url: str) -> str:
         """Downloads an image to a temporary file."""
-        import requests
         import tempfile
         
         # If it's a local file path (relative to output)
@@ -1356,7 +1695,7 @@ class ComicGenPipeline:
                 
         # Download from URL
         try:
-            response = requests.get(url, stream=True)
+            response = get_http_session().get(url, stream=True)
             response.raise_for_status()
             
             # Create temp file
@@ -1391,8 +1730,15 @@ class ComicGenPipeline:
         self._save_data()
         return script
 
-    def merge_videos(self, script_id: str) -> Script:
-        """Step 5b: Merge selected videos into a single file."""
+    def merge_videos(self, script_id: str, on_progress: Callable[[Dict[str, Any]], None] = None,
+                     cancel_event: Optional[threading.Event] = None, hls: bool = False) -> Script:
+        """
+        Step 5b: Merge selected videos into a single file.
+
+        ``on_progress`` receives {"stage", "percent", "fps", "speed"} reports from
+        ffmpeg; setting ``cancel_event`` kills the running ffmpeg processes.
+        With ``hls`` the result is also packaged as fMP4 HLS (``merged_hls_url``).
+        """
         script = self.scripts.get(script_id)
         if not script:
             raise ValueError("Script not found")
@@ -1428,55 +1774,20 @@ class ComicGenPipeline:
         except Exception as e:
             logger.warning(f"[MERGE] Could not get FFmpeg version: {e}")
             
-        # Collect video paths
-        video_paths = []
-        for i, frame in enumerate(script.frames):
-            logger.info(f"[MERGE] Processing frame {i+1}/{len(script.frames)}: {frame.id}")
-            
-            if not frame.selected_video_id:
-                # Try to find a default completed video
-                default_video = next((v for v in script.video_tasks if v.frame_id == frame.id and v.status == "completed"), None)
-                if default_video and default_video.video_url:
-                    logger.debug(f"[MERGE]   -> Using default video: {default_video.video_url}")
-                    video_paths.append(default_video.video_url)
-                else:
-                    logger.warning(f"[MERGE]   -> No video selected or available, skipping")
-                continue
-                
-            video = next((v for v in script.video_tasks if v.id == frame.selected_video_id), None)
-            if video and video.video_url:
-                logger.debug(f"[MERGE]   -> Selected video: {video.video_url}")
-                video_paths.append(video.video_url)
-            else:
-                logger.warning(f"[MERGE]   -> Selected video {frame.selected_video_id} not found or has no URL")
-                
-        if not video_paths:
-            logger.error("[MERGE] No videos found to merge!")
-            raise ValueError("No videos selected to merge. Please select videos for each frame first.")
-        
-        logger.info(f"[MERGE] Found {len(video_paths)} videos to merge")
-            
-        # Create file list for ffmpeg
-        list_path = os.path.join("output", f"merge_list_{script_id}.txt")
-        abs_video_paths = []
-        
-        with open(list_path, "w") as f:
-            for path in video_paths:
-                # Resolve to absolute path
-                if not path.startswith("http"):
-                    abs_path = os.path.abspath(os.path.join("output", path))
-                    if os.path.exists(abs_path):
-                        f.write(f"file '{abs_path}'\n")
-                        abs_video_paths.append(abs_path)
-                        logger.debug(f"[MERGE] Added to list: {abs_path}")
-                    else:
-                        logger.warning(f"[MERGE] Video file not found: {abs_path}")
-                        
-        if not abs_video_paths:
-            logger.error("[MERGE] No valid video files found on disk!")
-            raise ValueError("No valid video files found. The video files may have been deleted or moved.")
-        
-        logger.info(f"[MERGE] Merge list created with {len(abs_video_paths)} videos")
+        # Fetching OSS-hosted clips takes the first FETCH_PROGRESS_SHARE percent of the progress
+        cache = get_oss_media_cache()
+        fetch_share = FETCH_PROGRESS_SHARE if any(cache.is_remote(r) for r in self._merge_clip_refs(script)) else 0
+
+        def report(progress: Dict[str, Any]):
+            if on_progress:
+                percent = progress.get("percent")
+                if percent is not None and progress.get("stage") != "fetching":
+                    progress = {**progress, "percent": round(fetch_share + percent * (100 - fetch_share) / 100, 1)}
+                on_progress(progress)
+
+        abs_video_paths = self._collect_merge_clips(
+            script, cancel_event=cancel_event,
+            on_progress=lambda done, total: report({"stage": "fetching", "percent": round(fetch_share * done / total, 1)}))
 
         # Output path
         output_filename = f"merged_{script_id}_{int(time.time())}.mp4"
@@ -1485,45 +1796,37 @@ class ComicGenPipeline:
         
         logger.debug(f"[MERGE] Output path: {output_path}")
         
-        # Log video file details for debugging
+        # Log video file details for debugging (from the metadata index, probed once per file)
         for i, path in enumerate(abs_video_paths):
-            try:
-                size_mb = os.path.getsize(path) / (1024 * 1024)
-                logger.debug(f"[MERGE] Input video {i+1}: {os.path.basename(path)} ({size_mb:.2f} MB)")
-            except Exception as e:
-                logger.warning(f"[MERGE] Could not get size for video {i+1}: {e}")
-        
-        # Run ffmpeg
-        # Use re-encoding for better compatibility (slower but more reliable)
-        # -c:v libx264 -c:a aac ensures consistent output format
-        cmd = [
-            ffmpeg_path, "-y",  # Use the detected ffmpeg path
-            "-f", "concat",
-            "-safe", "0",
-            "-i", list_path,
-            "-c:v", "libx264",  # Re-encode video with H.264
-            "-crf", "23",       # Quality (lower = better, 23 is default)
-            "-preset", "fast",  # Encoding speed
-            "-c:a", "aac",      # Re-encode audio with AAC
-            "-b:a", "128k",     # Audio bitrate
-            "-movflags", "+faststart",  # Web optimization
-            output_path
-        ]
-        
-        logger.debug(f"[MERGE] Running FFmpeg command: {' '.join(cmd)}")
+            meta = get_media_index().lookup(path) or {}
+            size_mb = (meta.get("size") or 0) / (1024 * 1024)
+            logger.debug(f"[MERGE] Input video {i+1}: {os.path.basename(path)} ({size_mb:.2f} MB, "
+                         f"{meta.get('duration')}s, {meta.get('width')}x{meta.get('height')} {meta.get('vcodec')})")
+        
+        # Probe all clips: stream-copy when they share codec parameters,
+        # re-encode (in parallel) only the clips that differ from the target profile.
         logger.debug(f"[MERGE] Platform: {platform.system()} {platform.release()}")
         
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True, timeout=600)  # 10 min timeout for re-encoding
-            logger.debug(f"[MERGE] FFmpeg stdout: {result.stdout.decode()[:500] if result.stdout else 'empty'}")
+            merger = VideoMerger(ffmpeg_path, on_progress=report, cancel_event=cancel_event)
+            merger.merge(
+                abs_video_paths, output_path,
+                aspect_ratio=script.model_settings.storyboard_aspect_ratio
+            )
             logger.info(f"[MERGE] FFmpeg completed successfully")
             
-            # Update script with merged video path
-            # Use 'videos/' (plural) to match the /files/videos route
-            script.merged_video_url = f"videos/{output_filename}"
-            
             # Verify file was created and log details
             if os.path.exists(output_path):
+                merged_meta = get_media_index().record(output_path) or {}
+                hls_url = None
+                if hls:
+                    playlist = package_hls(output_path, merger, duration=merged_meta.get("duration"))
+                    hls_url = os.path.relpath(playlist, "output").replace(os.sep, "/")
+
+                # Update script with merged video path
+                # Use 'videos/' (plural) to match the /files/videos route
+                script.merged_video_url = f"videos/{output_filename}"
+                script.merged_hls_url = hls_url
                 file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
                 logger.info(f"[MERGE] ✅ Merged video created successfully: {output_filename} ({file_size_mb:.2f} MB)")
                 logger.info(f"[MERGE] ✅ Video accessible at: /files/videos/{output_filename}")
@@ -1532,22 +1835,18 @@ class ComicGenPipeline:
                 raise RuntimeError(f"Video merge completed but output file not found: {output_path}")
                 
             self._save_data()
-            
-            # Cleanup list file
-            if os.path.exists(list_path):
-                os.remove(list_path)
-                
             return script
-        except subprocess.TimeoutExpired:
-            logger.error("[MERGE] FFmpeg timed out after 600 seconds")
-            raise RuntimeError("FFmpeg timed out. The videos may be too large.")
+        except subprocess.TimeoutExpired as e:
+            # Raised by VideoMerger._run with the timeout of the ffmpeg step that expired
+            logger.error(f"[MERGE] FFmpeg timed out after {e.timeout:.0f}s: {' '.join(map(str, e.cmd))[:300]}")
+            raise RuntimeError(f"FFmpeg timed out after {e.timeout:.0f}s. The videos may be too large.")
         except subprocess.CalledProcessError as e:
             stderr_msg = e.stderr.decode() if e.stderr else "No error output"
             stdout_msg = e.stdout.decode() if e.stdout else "No output"
             
             # Log full details for debugging
             logger.error(f"[MERGE] FFmpeg failed with exit code {e.returncode}")
-            logger.error(f"[MERGE] FFmpeg command: {' '.join(cmd)}")
+            logger.error(f"[MERGE] FFmpeg command: {' '.join(e.cmd)}")
             logger.error(f"[MERGE] FFmpeg stderr: {stderr_msg}")
             logger.error(f"[MERGE] FFmpeg stdout: {stdout_msg}")
             logger.error(f"[MERGE] Video files attempted: {[os.path.basename(p) for p in abs_video_paths]}")
@@ -1556,6 +1855,90 @@ class ComicGenPipeline:
             user_msg = self._extract_ffmpeg_error_message(stderr_msg, abs_video_paths)
             raise RuntimeError(user_msg)
     
+    def build_preview(self, script_id: str, cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """
+        Assembles a quick low-resolution preview of the current cut from clip proxies.
+
+        Unlike merge_videos this never re-encodes at full quality and does not touch
+        ``merged_video_url``. Setting ``cancel_event`` stops fetching OSS-hosted clips
+        and kills the proxy encodes.
+        Returns {"url", "clips", "created", "cached", "elapsed"}.
+        """
+        script = self.scripts.get(script_id)
+        if not script:
+            raise ValueError("Script not found")
+        with get_oss_media_cache().hold():
+            clips = self._collect_merge_clips(script, cancel_event=cancel_event)
+            result = get_proxy_manager().build_preview(clips, script.model_settings.storyboard_aspect_ratio,
+                                                       cancel_event=cancel_event)
+        return {
+            "url": os.path.relpath(result["path"], "output").replace(os.sep, "/"),
+            "clips": len(clips),
+            "created": result["created"],
+            "cached": result["cached"],
+            "elapsed": round(result["elapsed"], 2),
+        }
+
+    def _merge_clip_refs(self, script: Script) -> List[str]:
+        """
+        Stored video reference (selected, or first completed) of each frame.
+        Only inspects the project; raises ValueError when no frame has one.
+        """
+        # Collect video paths
+        video_paths = []
+        for i, frame in enumerate(script.frames):
+            logger.info(f"[MERGE] Processing frame {i+1}/{len(script.frames)}: {frame.id}")
+            
+            if not frame.selected_video_id:
+                # Try to find a default completed video
+                default_video = next((v for v in script.video_tasks if v.frame_id == frame.id and v.status == "completed"), None)
+                if default_video and default_video.video_url:
+                    logger.debug(f"[MERGE]   -> Using default video: {default_video.video_url}")
+                    video_paths.append(default_video.video_url)
+                else:
+                    logger.warning(f"[MERGE]   -> No video selected or available, skipping")
+                continue
+                
+            video = next((v for v in script.video_tasks if v.id == frame.selected_video_id), None)
+            if video and video.video_url:
+                logger.debug(f"[MERGE]   -> Selected video: {video.video_url}")
+                video_paths.append(video.video_url)
+            else:
+                logger.warning(f"[MERGE]   -> Selected video {frame.selected_video_id} not found or has no URL")
+                
+        if not video_paths:
+            logger.error("[MERGE] No videos found to merge!")
+            raise ValueError("No videos selected to merge. Please select videos for each frame first.")
+        
+        logger.info(f"[MERGE] Found {len(video_paths)} videos to merge")
+        return video_paths
+
+    def _collect_merge_clips(self, script: Script, cancel_event: Optional[threading.Event] = None,
+                             on_progress: Callable[[int, int], None] = None) -> List[str]:
+        """
+        Resolves the selected (or first completed) video of each frame to an
+        absolute path. OSS-hosted clips are fetched into the local cache;
+        ``cancel_event`` stops the downloads and ``on_progress(done, total)``
+        reports them.
+        """
+        video_paths = self._merge_clip_refs(script)
+        abs_video_paths = []
+        resolved = get_oss_media_cache().resolve_many(video_paths, cancel_event=cancel_event, on_progress=on_progress)
+        for path, abs_path in zip(video_paths, resolved):
+            if abs_path:
+                abs_video_paths.append(abs_path)
+                logger.debug(f"[MERGE] Added to list: {abs_path}")
+            else:
+                logger.warning(f"[MERGE] Video file not found: {path}")
+                        
+        if not abs_video_paths:
+            logger.error("[MERGE] No valid video files found on disk!")
+            raise ValueError("No valid video files found. The video files may have been deleted or moved.")
+        
+        logger.info(f"[MERGE] Merge list created with {len(abs_video_paths)} videos")
+        return abs_video_paths
+
+
     def _extract_ffmpeg_error_message(self, stderr: str, video_paths: List[str]) -> str:
         """
         Extract a user-friendly error message from ffmpeg stderr output.
@@ -1716,15 +2099,22 @@ class ComicGenPipeline:
         if not task:
             logger.error(f"Task {task_id} not found in script {script_id}")
             return
+        if task.status == "cancelled":
+            logger.info(f"Video task {task_id} was cancelled before it started")
+            self._release_cancel_event(task_id)
+            return
 
+        cancel_event = self._get_cancel_event(task_id)
+        output_path = None
         try:
             # Update status to processing
             task.status = "processing"
             self._save_data()
             
-            # Download image to temp file
+            # Download image to temp file. OSS Object Keys are already remote:
+            # the model client only needs to sign them, not download and re-upload.
             img_path = None
-            if task.image_url:
+            if task.image_url and not is_object_key(task.image_url):
                 img_path = self._download_temp_image(task.image_url)
             
             # Generate video
@@ -1763,6 +2153,7 @@ class ComicGenPipeline:
                 img_url=img_url,
                 duration=task.duration,
                 seed=task.seed,
+                bypass_cache=task.bypass_cache,
                 resolution=task.resolution,
                 # Pass new params
                 audio_url=final_audio_url,
@@ -1774,16 +2165,34 @@ class ComicGenPipeline:
                 ref_video_urls=task.reference_video_urls if task.generation_mode == "r2v" else None,  # R2V reference videos
                 # Legacy params mapped or ignored
                 camera_motion=None, 
-                subject_motion=None
+                subject_motion=None,
+                cancel_event=cancel_event
             )
+            if cancel_event.is_set():
+                raise TaskCancelledError("Task cancelled")
             
             task.video_url = os.path.relpath(output_path, "output")
+            task.content_hash = get_media_store().ingest(output_path)
+            get_media_index().record(output_path, task.content_hash)
             task.status = "completed"
+            if not task.asset_id:
+                # Low-res proxy for quick assembly previews, encoded in the background
+                get_proxy_manager().schedule(output_path, script.model_settings.storyboard_aspect_ratio)
             
             # Sync with asset if this is an asset video
             if task.asset_id:
                 self._sync_asset_video_task(script, task)
             
+        except TaskCancelledError:
+            logger.info(f"Video task {task_id} cancelled")
+            task.status = "cancelled"
+            if output_path and os.path.exists(output_path):
+                try:
+                    os.remove(output_path)
+                except OSError:
+                    pass
+            if task.asset_id:
+                self._sync_asset_video_task(script, task)
         except Exception as e:
             import traceback
             logger.exception("Failed to process video task")
@@ -1791,6 +2200,8 @@ class ComicGenPipeline:
             task.status = "failed"
             if task.asset_id:
                 self._sync_asset_video_task(script, task)
+        finally:
+            self._release_cancel_event(task_id)
             
         self._save_data()
 
@@ -1860,6 +2271,7 @@ class ComicGenPipeline:
         
         # Snapshot logic (duplicated from create_video_task for now, or could refactor)
         snapshot_url = image_url
+        input_hash = None
         try:
             if not image_url.startswith("http"):
                 src_path = os.path.join("output", image_url)
@@ -1869,9 +2281,9 @@ class ComicGenPipeline:
                     ext = os.path.splitext(image_url)[1] or ".png"
                     snapshot_filename = f"{task_id}{ext}"
                     snapshot_path = os.path.join(snapshot_dir, snapshot_filename)
-                    import shutil
-                    shutil.copy2(src_path, snapshot_path)
-                    snapshot_url = f"video_inputs/{snapshot_filename}"
+                    input_hash = get_media_store().link(src_path, snapshot_path)
+                    if input_hash:
+                        snapshot_url = f"video_inputs/{snapshot_filename}"
         except Exception:
             pass
 
@@ -1884,6 +2296,7 @@ class ComicGenPipeline:
             project_id=script_id,
             asset_id=asset_id,
             image_url=snapshot_url,
+            input_hash=input_hash,
             prompt=prompt,
             status="pending",
             duration=duration,
@@ -1925,6 +2338,8 @@ class ComicGenPipeline:
         video_task_to_delete = None
         if script.video_tasks:
             video_task_to_delete = next((v for v in script.video_tasks if v.id == video_id), None)
+        if video_task_to_delete and video_task_to_delete.status in ("pending", "processing"):
+            self.cancel_task(video_id)
         
         # Remove from asset's video_assets
         if target_asset.video_assets:
@@ -2060,6 +2475,7 @@ class ComicGenPipeline:
             raise ValueError("Script not found")
             
         target_asset = None
+        variant = None
         if asset_type == "character":
             target_asset = next((c for c in script.characters if c.id == asset_id), None)
             if target_asset:
@@ -2126,6 +2542,8 @@ class ComicGenPipeline:
                     # For now, let's assume we only select rendered variants for frames usually.
         
         self._save_data()
+        if variant:
+            self.stage_for_generation(variant.url)
         return script
 
     def delete_asset_variant(self, script_id: str, asset_id: str, asset_type: str, variant_id: str) -> Script:
@@ -0,0 +1,162 @@
+"""
+Media probing with ffprobe (or ``ffmpeg -i`` parsing when ffprobe is not bundled).
+
+Callers that probe the same files repeatedly should go through the media
+metadata index (``media_index.get_media_index()``), which caches these results
+by content hash.
+"""
+import json
+import re
+import subprocess
+from fractions import Fraction
+from typing import Any, Dict, Optional
+
+from ...utils.system_check import get_ffmpeg_path, get_ffprobe_path
+
+
+class MediaDecodeError(RuntimeError):
+    """The prober ran and rejected the file (as opposed to ffprobe missing or timing out)."""
+
+
+def _normalize_rate(rate: Optional[str]) -> Optional[str]:
+    """'24/1' -> '24', '30000/1001' -> '30000/1001', '24.00' -> '24'."""
+    if not rate or rate in ("0/0", "N/A"):
+        return None
+    try:
+        value = Fraction(rate).limit_denominator(1001)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return str(value.numerator) if value.denominator == 1 else f"{value.numerator}/{value.denominator}"
+
+
+def _probe_with_ffprobe(path: str, ffprobe_path: str) -> Dict[str, Any]:
+    result = subprocess.run(
+        [ffprobe_path, "-v", "error", "-print_format", "json", "-show_streams", "-show_format", path],
+        capture_output=True, text=True, timeout=30
+    )
+    if result.returncode != 0:
+        raise MediaDecodeError(f"ffprobe failed for {path}: {result.stderr.strip()[:200]}")
+    data = json.loads(result.stdout or "{}")
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None) or {}
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    if not video and not audio:
+        raise MediaDecodeError(f"No audio or video stream in {path}")
+
+    duration = data.get("format", {}).get("duration") or video.get("duration") or (audio or {}).get("duration")
+    return {
+        "path": path,
+        "duration": float(duration) if duration and duration != "N/A" else None,
+        "vcodec": video.get("codec_name"),
+        "profile": (video.get("profile") or "").lower() or None,
+        "pix_fmt": video.get("pix_fmt"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": _normalize_rate(video.get("r_frame_rate") or video.get("avg_frame_rate")),
+        "time_base": video.get("time_base"),
+        "acodec": audio.get("codec_name") if audio else None,
+        "sample_rate": int(audio["sample_rate"]) if audio and audio.get("sample_rate") else None,
+        "channels": audio.get("channels") if audio else None,
+    }
+
+
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):([\d.]+)")
+_VIDEO_RE = re.compile(r"Stream #\d+:\d+.*?: Video: (\w+)(?: \(([^)]*)\))?.*?, (\w+)(?:\([^)]*\))?, (\d+)x(\d+)")
+_FPS_RE = re.compile(r"([\d.]+) fps")
+_TBN_RE = re.compile(r"([\d.]+)(k?) tbn")
+_AUDIO_RE = re.compile(r"Stream #\d+:\d+.*?: Audio: (\w+).*?, (\d+) Hz, ([\w.()]+)")
+_CHANNEL_NAMES = {"mono": 1, "stereo": 2, "2.1": 3, "quad": 4, "5.0": 5, "5.1": 6, "7.1": 8}
+
+
+def _probe_with_ffmpeg(path: str, ffmpeg_path: str) -> Dict[str, Any]:
+    """Fallback probe for installs that ship ffmpeg without ffprobe: parses `ffmpeg -i` output."""
+    result = subprocess.run([ffmpeg_path, "-hide_banner", "-i", path], capture_output=True, text=True, timeout=30)
+    text = result.stderr or ""
+    video_line = next((line for line in text.splitlines() if ": Video: " in line), "")
+    audio_line = next((line for line in text.splitlines() if ": Audio: " in line), "")
+    vm = _VIDEO_RE.search(video_line)
+    am = _AUDIO_RE.search(audio_line)
+    if not vm and not am:
+        raise MediaDecodeError(f"Could not probe audio or video stream in {path}")
+
+    duration = None
+    dm = _DURATION_RE.search(text)
+    if dm:
+        duration = int(dm.group(1)) * 3600 + int(dm.group(2)) * 60 + float(dm.group(3))
+
+    fps_m = _FPS_RE.search(video_line) if vm else None
+    tbn_m = _TBN_RE.search(video_line) if vm else None
+    time_base = None
+    if tbn_m:
+        tbn = float(tbn_m.group(1)) * (1000 if tbn_m.group(2) else 1)
+        time_base = f"1/{int(round(tbn))}"
+
+    channels = None
+    if am:
+        layout = am.group(3).split("(")[0]
+        channels = _CHANNEL_NAMES.get(layout)
+        if channels is None:
+            cm = re.match(r"(\d+) channels", layout)
+            channels = int(cm.group(1)) if cm else None
+
+    return {
+        "path": path,
+        "duration": duration,
+        "vcodec": vm.group(1) if vm else None,
+        "profile": ((vm.group(2) or "").lower() or None) if vm else None,
+        "pix_fmt": vm.group(3) if vm else None,
+        "width": int(vm.group(4)) if vm else None,
+        "height": int(vm.group(5)) if vm else None,
+        "fps": _normalize_rate(fps_m.group(1)) if fps_m else None,
+        "time_base": time_base,
+        "acodec": am.group(1) if am else None,
+        "sample_rate": int(am.group(2)) if am else None,
+        "channels": channels,
+    }
+
+
+def probe_media(path: str) -> Dict[str, Any]:
+    """
+    Returns codec/stream parameters of an audio or video file (ffprobe, or ffmpeg
+    as fallback). Video fields are None for audio-only files. Raises
+    MediaDecodeError when the file itself is rejected; a missing prober or a
+    timeout raises RuntimeError / subprocess.TimeoutExpired instead.
+    """
+    ffprobe_path = get_ffprobe_path()
+    if ffprobe_path:
+        return _probe_with_ffprobe(path, ffprobe_path)
+    ffmpeg_path = get_ffmpeg_path()
+    if not ffmpeg_path:
+        raise RuntimeError("Neither ffprobe nor ffmpeg is available for probing")
+    return _probe_with_ffmpeg(path, ffmpeg_path)
+
+
+def probe_clip(path: str) -> Dict[str, Any]:
+    """Like probe_media, but requires a video stream."""
+    info = probe_media(path)
+    if not info.get("vcodec"):
+        raise RuntimeError(f"No video stream in {path}")
+    return info
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """Duration in seconds of any media file (audio or video), or None if it cannot be decoded."""
+    ffprobe_path = get_ffprobe_path()
+    try:
+        if ffprobe_path:
+            result = subprocess.run(
+                [ffprobe_path, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+                capture_output=True, text=True, timeout=30
+            )
+            value = (result.stdout or "").strip()
+            return float(value) if result.returncode == 0 and value not in ("", "N/A") else None
+        ffmpeg_path = get_ffmpeg_path()
+        if not ffmpeg_path:
+            return None
+        result = subprocess.run([ffmpeg_path, "-hide_banner", "-i", path], capture_output=True, text=True, timeout=30)
+        dm = _DURATION_RE.search(result.stderr or "")
+        if not dm:
+            return None
+        return int(dm.group(1)) * 3600 + int(dm.group(2)) * 60 + float(dm.group(3))
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
@@ -0,0 +1,228 @@
+"""
+Low-resolution proxies for fast assembly previews.
+
+Every downloaded clip gets a 360p, low-bitrate proxy in the background. All
+proxies of a project share one fixed encoding profile (frame size from the
+storyboard aspect ratio, 24 fps, AAC stereo, fixed timescale), so a preview of
+the whole cut is a stream-copy concat of the proxies and takes a second or two
+even for long storyboards. The full-quality merge stays a separate step.
+
+Proxies are keyed by the clip's content hash and frame size, and the finished
+preview by the list of proxies, so re-opening an unchanged cut is free.
+Previews are written under ``<proxy dir>/previews`` and share the proxies'
+LRU size budget.
+
+Environment:
+    LUMENX_PROXY_DIR            proxy cache directory (default: output/cache/proxies)
+    LUMENX_PROXY_CACHE_MAX_MB   size budget in MB (default: 2048)
+    LUMENX_PROXY_WORKERS        background proxy encoders (default: 2)
+"""
+import hashlib
+import os
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from .media_index import get_media_index
+from ...utils import get_logger
+from ...utils.cancellation import TaskCancelledError, raise_if_cancelled
+from ...utils.hashing import try_file_sha256
+from ...utils.result_cache import evict_lru
+from ...utils.system_check import get_ffmpeg_path
+
+logger = get_logger(__name__)
+
+DEFAULT_PROXY_DIR = os.path.join("output", "cache", "proxies")
+DEFAULT_PROXY_CACHE_MAX_MB = 2048
+PREVIEW_SUBDIR = "previews"
+PROXY_SHORT_SIDE = 360
+PROXY_FPS = 24
+PROXY_TIMESCALE = 12288
+PROXY_AUDIO_RATE = 44100
+# Bump when the proxy encoding settings change so stale proxies are not concatenated with new ones
+PROXY_VERSION = 1
+
+
+def _run_ffmpeg(cmd: List[str], timeout: int, cancel_event: Optional[threading.Event] = None):
+    """Like ``subprocess.run(check=True)``, but kills ffmpeg as soon as ``cancel_event`` is set."""
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    try:
+        while True:
+            try:
+                _, stderr = proc.communicate(timeout=0.5)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise TaskCancelledError("Preview cancelled")
+                if time.time() > deadline:
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.communicate()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=b"", stderr=stderr)
+
+
+def proxy_size(aspect_ratio: Optional[str]) -> Tuple[int, int]:
+    """Proxy frame size for an aspect ratio such as "16:9" (short side 360, even dimensions)."""
+    try:
+        ratio_w, ratio_h = (float(x) for x in (aspect_ratio or "16:9").split(":"))
+        ratio = ratio_w / ratio_h
+    except (ValueError, ZeroDivisionError):
+        ratio = 16 / 9
+    long_side = int(round(PROXY_SHORT_SIDE * max(ratio, 1 / ratio) / 2)) * 2
+    return (long_side, PROXY_SHORT_SIDE) if ratio >= 1 else (PROXY_SHORT_SIDE, long_side)
+
+
+class ProxyManager:
+    """Creates, caches and concatenates clip proxies."""
+
+    def __init__(self, root: str = None, max_bytes: int = None, workers: int = None, ffmpeg_path: str = None):
+        self.root = root or os.getenv("LUMENX_PROXY_DIR", DEFAULT_PROXY_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("LUMENX_PROXY_CACHE_MAX_MB", DEFAULT_PROXY_CACHE_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.ffmpeg_path = ffmpeg_path or get_ffmpeg_path()
+        workers = workers or int(os.getenv("LUMENX_PROXY_WORKERS", "2"))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="proxy")
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def proxy_path(self, source_hash: str, size: Tuple[int, int]) -> str:
+        return os.path.join(self.root, source_hash[:2], f"{source_hash}_{size[0]}x{size[1]}_v{PROXY_VERSION}.mp4")
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def schedule(self, clip_path: str, aspect_ratio: Optional[str]):
+        """Queues proxy creation for a freshly downloaded clip."""
+        if not self.ffmpeg_path or not clip_path or not os.path.isfile(clip_path):
+            return
+        self._executor.submit(self._ensure_logged, clip_path, aspect_ratio)
+
+    def _ensure_logged(self, clip_path: str, aspect_ratio: Optional[str]):
+        try:
+            self.ensure(clip_path, aspect_ratio)
+        except Exception as e:
+            logger.warning(f"Proxy generation failed for {clip_path}: {e}")
+
+    def ensure(self, clip_path: str, aspect_ratio: Optional[str],
+               cancel_event: Optional[threading.Event] = None) -> Tuple[str, bool]:
+        """Returns (proxy_path, created). Concurrent callers for the same clip share one encode."""
+        source_hash = try_file_sha256(clip_path)
+        if not source_hash:
+            raise RuntimeError(f"Cannot read clip {clip_path}")
+        size = proxy_size(aspect_ratio)
+        path = self.proxy_path(source_hash, size)
+        with self._key_lock(path):
+            if os.path.isfile(path):
+                os.utime(path, None)  # Bump recency for LRU
+                return path, False
+            start = time.time()
+            raise_if_cancelled(cancel_event, "Preview cancelled")
+            self._encode(clip_path, path, size, cancel_event)
+            logger.info(f"Created proxy for {os.path.basename(clip_path)} ({time.time() - start:.2f}s)")
+            return path, True
+
+    def _encode(self, clip_path: str, output_path: str, size: Tuple[int, int],
+                cancel_event: Optional[threading.Event] = None):
+        width, height = size
+        info = get_media_index().lookup(clip_path) or {}
+        cmd = [self.ffmpeg_path, "-y", "-v", "error", "-i", clip_path]
+        if info.get("acodec"):
+            cmd += ["-map", "0:v:0", "-map", "0:a:0"]
+        else:
+            # Silent track keeps the stream layout identical across proxies
+            cmd += ["-f", "lavfi", "-i", f"anullsrc=r={PROXY_AUDIO_RATE}:cl=stereo",
+                    "-map", "0:v:0", "-map", "1:a:0", "-shortest"]
+        cmd += [
+            "-vf", f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                   f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={PROXY_FPS},format=yuv420p",
+            "-c:v", "libx264", "-profile:v", "main", "-preset", "veryfast", "-crf", "30",
+            "-maxrate", "600k", "-bufsize", "1200k", "-g", str(PROXY_FPS * 2), "-threads", "1",
+            "-video_track_timescale", str(PROXY_TIMESCALE),
+            "-c:a", "aac", "-b:a", "64k", "-ar", str(PROXY_AUDIO_RATE), "-ac", "2",
+            "-movflags", "+faststart", "-f", "mp4",
+        ]
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            _run_ffmpeg(cmd + [tmp_path], 600, cancel_event)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def build_preview(self, clip_paths: List[str], aspect_ratio: Optional[str], output_dir: str = None,
+                      cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """
+        Assembles a preview from proxies with a stream-copy concat.
+
+        Missing proxies (clip downloaded before proxies existed, or evicted) are
+        created first, in parallel. Setting ``cancel_event`` kills the running
+        proxy encodes and the concat (TaskCancelledError).
+        Returns {"path", "created", "cached", "elapsed"}.
+        """
+        if not self.ffmpeg_path:
+            raise RuntimeError("FFmpeg not found")
+        start = time.time()
+        futures = [self._executor.submit(self.ensure, p, aspect_ratio, cancel_event) for p in clip_paths]
+        try:
+            while wait(futures, timeout=0.5).not_done:
+                raise_if_cancelled(cancel_event, "Preview cancelled")
+            results = [f.result() for f in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        proxies = [path for path, _ in results]
+        created = sum(1 for _, was_created in results if was_created)
+
+        output_dir = output_dir or os.path.join(self.root, PREVIEW_SUBDIR)
+        os.makedirs(output_dir, exist_ok=True)
+        digest = hashlib.sha256("\n".join(os.path.basename(p) for p in proxies).encode("utf-8")).hexdigest()[:16]
+        preview_path = os.path.join(output_dir, f"preview_{digest}.mp4")
+        cached = os.path.isfile(preview_path)
+        if cached:
+            os.utime(preview_path, None)  # Bump recency for LRU
+        else:
+            list_path = os.path.join(output_dir, f"preview_{uuid.uuid4().hex[:8]}.txt")
+            tmp_path = f"{preview_path}.{uuid.uuid4().hex}.tmp"
+            try:
+                with open(list_path, "w") as f:
+                    for path in proxies:
+                        escaped = os.path.abspath(path).replace("'", "'\\''")
+                        f.write(f"file '{escaped}'\n")
+                _run_ffmpeg([
+                    self.ffmpeg_path, "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+                    "-c", "copy", "-movflags", "+faststart", "-f", "mp4", tmp_path
+                ], 300, cancel_event)
+                os.replace(tmp_path, preview_path)
+            finally:
+                for path in (list_path, tmp_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            # Previews live under the root too, so they count against the same budget
+            evict_lru(self.root, self.max_bytes, keep={os.path.abspath(preview_path)})
+
+        elapsed = time.time() - start
+        logger.info(f"Preview of {len(clip_paths)} clips ready in {elapsed:.2f}s "
+                    f"(proxies created={created}, cached preview={cached})")
+        return {"path": preview_path, "created": created, "cached": cached, "elapsed": elapsed}
+
+
+_proxy_manager: Optional[ProxyManager] = None
+
+
+def get_proxy_manager() -> ProxyManager:
+    """Returns the process-wide proxy manager."""
+    global _proxy_manager
+    if _proxy_manager is None:
+        _proxy_manager = ProxyManager()
+    return _proxy_manager
@@ -0,0 +1,207 @@
+"""
+Incremental reparse: reconcile re-extracted entities with an existing script.
+
+A full reparse replaced every character, scene and prop with fresh uuids,
+orphaning generated variants, locks and frame references. Instead, the new
+text is diffed against ``original_text`` chunk by chunk, only the changed
+chunks are re-extracted, and the extracted entities are matched against the
+existing ones (``reconcile_entities``):
+
+- a match by name, alias or outfit variant keeps the existing entity (id,
+  variants, videos, lock); unlocked entities take the refreshed description;
+- otherwise the best name + description similarity above a threshold counts
+  as a rename;
+- unmatched extractions become new entities;
+- existing entities are only dropped when the old text mentioned their name,
+  the new text no longer does, and nothing was generated for or references
+  them. Names the LLM paraphrased (never verbatim in the text) are kept.
+"""
+import difflib
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+from ...utils import get_logger
+from .models import Character, GenerationStatus, Prop, Scene, Script
+from .novel_chunks import normalize_name, split_variant
+
+logger = get_logger(__name__)
+
+# Weighted name/description similarity needed to treat an unmatched extraction as a renamed entity
+RENAME_THRESHOLD = 0.7
+MIN_NAME_SIMILARITY = 0.5
+NAME_WEIGHT = 0.6
+
+_REFRESHED_FIELDS = {
+    "character": ("description", "age", "gender", "clothing", "visual_weight"),
+    "scene": ("description", "time_of_day", "lighting_mood", "visual_weight"),
+    "prop": ("description",),
+}
+
+
+def _similarity(a: Optional[str], b: Optional[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return difflib.SequenceMatcher(a=normalize_name(a), b=normalize_name(b), autojunk=False).ratio()
+
+
+def _aliases(item: Dict[str, Any]) -> List[str]:
+    return [a for a in (item.get("aliases") or []) if isinstance(a, str) and a.strip()]
+
+
+def _names(item: Dict[str, Any], base_aliases: Dict[str, List[str]]) -> Set[str]:
+    """
+    Normalized name and aliases of an extracted entity. An outfit variant also
+    matches under every alias of its base character ("小墨 (古装)" -> "叶墨 (古装)").
+    """
+    name = item.get("name") or ""
+    base, outfit = split_variant(name)
+    names = {normalize_name(name)}
+    for alias in _aliases(item):
+        alias_base, alias_outfit = split_variant(alias)
+        names.add(normalize_name(alias if alias_outfit or not outfit else f"{alias_base} ({outfit})"))
+    if outfit:
+        for alias in base_aliases.get(normalize_name(base), []):
+            names.add(normalize_name(f"{alias} ({outfit})"))
+    return names
+
+
+def _has_generated_media(entity) -> bool:
+    if getattr(entity, "image_url", None) or getattr(entity, "video_url", None) or getattr(entity, "video_assets", None):
+        return True
+    for unit_name in ("full_body", "three_views", "head_shot", "image_asset",
+                      "full_body_asset", "three_view_asset", "headshot_asset"):
+        unit = getattr(entity, unit_name, None)
+        if unit is not None and (getattr(unit, "image_variants", None) or getattr(unit, "video_variants", None)
+                                 or getattr(unit, "variants", None)):
+            return True
+    return bool(getattr(entity, "full_body_image_url", None) or getattr(entity, "three_view_image_url", None)
+                or getattr(entity, "headshot_image_url", None))
+
+
+def _referenced_ids(script: Script) -> Set[str]:
+    ids = set()
+    for frame in script.frames:
+        ids.update(frame.character_ids or [])
+        ids.update(frame.prop_ids or [])
+        if frame.scene_id:
+            ids.add(frame.scene_id)
+    ids.update(c.base_character_id for c in script.characters if c.base_character_id)
+    return ids
+
+
+def _mentioned(name: str, normalized_text: str) -> bool:
+    base, _ = split_variant(name)
+    return bool(base) and normalize_name(base) in normalized_text
+
+
+def _new_entity(kind: str, item: Dict[str, Any]):
+    common = dict(id=str(uuid.uuid4()), name=item.get("name", "Unknown"), description=item.get("description", ""),
+                  status=GenerationStatus.PENDING)
+    if kind == "character":
+        return Character(age=item.get("age"), gender=item.get("gender"), clothing=item.get("clothing"),
+                         visual_weight=item.get("visual_weight", 3), **common)
+    if kind == "scene":
+        return Scene(time_of_day=item.get("time_of_day"), lighting_mood=item.get("lighting_mood"),
+                     visual_weight=item.get("visual_weight", 3), **common)
+    return Prop(**common)
+
+
+def _reconcile_list(kind: str, existing: List[Any], extracted: List[Dict[str, Any]], stats: Dict[str, int],
+                    matched: Set[str]) -> List[Any]:
+    by_name = {normalize_name(e.name): e for e in existing}
+    result = list(existing)
+    base_aliases = {normalize_name(item.get("name")): _aliases(item) for item in extracted
+                    if not split_variant(item.get("name") or "")[1]}
+
+    unmatched = []
+    for item in extracted:
+        names = _names(item, base_aliases)
+        entity = next((by_name[n] for n in names if n in by_name and by_name[n].id not in matched), None)
+        if entity is None:
+            unmatched.append(item)
+            continue
+        matched.add(entity.id)
+        _refresh(kind, entity, item, stats)
+
+    for item in unmatched:
+        # Renamed entity: similar name and description, not claimed by an exact match
+        best, best_score = None, 0.0
+        for entity in existing:
+            if entity.id in matched:
+                continue
+            name_score = _similarity(entity.name, item.get("name"))
+            if name_score < MIN_NAME_SIMILARITY:
+                continue
+            score = NAME_WEIGHT * name_score + (1 - NAME_WEIGHT) * _similarity(entity.description, item.get("description"))
+            if score > best_score:
+                best, best_score = entity, score
+        if best is not None and best_score >= RENAME_THRESHOLD:
+            matched.add(best.id)
+            logger.info(f"Reparse: {kind} '{best.name}' renamed to '{item.get('name')}' ({best_score:.2f})")
+            if not best.locked:
+                best.name = item.get("name") or best.name
+            _refresh(kind, best, item, stats)
+            stats["renamed"] += 1
+        else:
+            entity = _new_entity(kind, item)
+            matched.add(entity.id)
+            result.append(entity)
+            stats["added"] += 1
+    return result
+
+
+def _refresh(kind: str, entity, item: Dict[str, Any], stats: Dict[str, int]):
+    """Updates descriptive fields of an unlocked entity; ids, variants and media are never touched."""
+    stats["kept"] += 1
+    if entity.locked:
+        return
+    changed = False
+    for field in _REFRESHED_FIELDS[kind]:
+        value = item.get(field)
+        if value not in (None, "") and getattr(entity, field, None) != value:
+            setattr(entity, field, value)
+            changed = True
+    if changed:
+        stats["updated"] += 1
+
+
+def reconcile_entities(script: Script, extracted: Dict[str, Any], new_text: str) -> Dict[str, int]:
+    """
+    Merges entities extracted from the changed chunks into ``script`` in place.
+    Returns counts of kept/updated/renamed/added/removed entities.
+    """
+    stats = {"kept": 0, "updated": 0, "renamed": 0, "added": 0, "removed": 0}
+    old_entities = {e.id: e.name for e in script.characters + script.scenes + script.props}
+    matched: Set[str] = set()
+    script.characters = _reconcile_list("character", script.characters, extracted.get("characters", []), stats, matched)
+    script.scenes = _reconcile_list("scene", script.scenes, extracted.get("scenes", []), stats, matched)
+    script.props = _reconcile_list("prop", script.props, extracted.get("props", []), stats, matched)
+
+    # Link new outfit variants to their base character
+    by_name = {normalize_name(c.name): c for c in script.characters}
+    for char in script.characters:
+        base, outfit = split_variant(char.name)
+        base_char = by_name.get(normalize_name(base)) if outfit else None
+        if base_char is not None and not char.base_character_id and base_char.id != char.id:
+            char.base_character_id = base_char.id
+
+    # Drop entities whose name was edited out of the text, unless anything depends on them
+    referenced = _referenced_ids(script)
+    old_text = normalize_name(script.original_text)
+    new_text_normalized = normalize_name(new_text)
+    for attr in ("characters", "scenes", "props"):
+        kept = []
+        for entity in getattr(script, attr):
+            if (entity.id not in matched and _mentioned(old_entities[entity.id], old_text)
+                    and not _mentioned(entity.name, new_text_normalized) and not entity.locked
+                    and entity.id not in referenced and not _has_generated_media(entity)):
+                logger.info(f"Reparse: removing '{entity.name}' (no longer in the text, nothing generated)")
+                stats["removed"] += 1
+                continue
+            kept.append(entity)
+        setattr(script, attr, kept)
+
+    script.original_text = new_text
+    script.updated_at = time.time()
+    return stats
@@ -5,6 +5,7 @@ from .models import StoryboardFrame, Character, Scene, Prop, GenerationStatus, I
 from ...models.image import WanxImageModel
 from ...utils import get_logger
 from ...utils.oss_utils import is_object_key
+from ...utils.media_store import get_media_store
 
 logger = get_logger(__name__)
 
@@ -182,6 +183,7 @@ class StoryboardGenerator:
                 variant = ImageVariant(
                     id=variant_id,
                     url=rel_path,
+                    content_hash=get_media_store().ingest(output_path),
                     prompt=prompt,
                     created_at=time.time()
                 )
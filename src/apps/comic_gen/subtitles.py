@@ -0,0 +1,201 @@
+"""
+Subtitle generation from storyboard dialogue.
+
+Cue timings come from the timeline the export already built: each frame's
+clip start/duration and the measured length of its synthesized dialogue
+audio. Nothing here probes media again. Long lines are split at sentence
+punctuation and the time is shared out by character count.
+
+Writes SRT (soft track / sidecar) and ASS (burned in by the export pass with
+the ``ass`` filter, and offered as a sidecar).
+
+Environment:
+    LUMENX_SUBTITLE_FONT   font family for ASS rendering (default: Noto Sans CJK SC)
+"""
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+from ...utils import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_FONT = "Noto Sans CJK SC"
+# Reading speed used when a frame has no dialogue audio to measure
+CJK_CHARS_PER_SECOND = 4.5
+LATIN_CHARS_PER_SECOND = 15.0
+MIN_CUE_SECONDS = 1.2
+# Keep a cue on screen briefly after the voice ends
+LINGER_SECONDS = 0.3
+MAX_LINE_CHARS_CJK = 18
+MAX_LINE_CHARS_LATIN = 42
+MAX_LINES = 2
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+_SENTENCE_END_RE = re.compile(r"(?<=[。！？!?；;…])|(?<=[.])\s+")
+
+
+Cue = Tuple[float, float, str, str]  # (start, end, text, speaker)
+
+
+def clean_dialogue(text: str) -> str:
+    """Strips emotion tags such as "[Happy]" that are only meant for TTS."""
+    return re.sub(r'\[(.*?)\]', '', text or '').strip()
+
+
+def _is_cjk(text: str) -> bool:
+    return len(_CJK_RE.findall(text)) * 2 >= len(text.replace(" ", ""))
+
+
+def _reading_seconds(text: str) -> float:
+    rate = CJK_CHARS_PER_SECOND if _is_cjk(text) else LATIN_CHARS_PER_SECOND
+    return max(len(text) / rate, MIN_CUE_SECONDS)
+
+
+def _max_cue_chars(text: str) -> int:
+    per_line = MAX_LINE_CHARS_CJK if _is_cjk(text) else MAX_LINE_CHARS_LATIN
+    return per_line * MAX_LINES
+
+
+def _split_sentences(text: str) -> List[str]:
+    """Splits text into chunks that each fit in one cue, preferring sentence boundaries."""
+    limit = _max_cue_chars(text)
+    if len(text) <= limit:
+        return [text]
+    chunks, current = [], ""
+    for sentence in (s.strip() for s in _SENTENCE_END_RE.split(text)):
+        if not sentence:
+            continue
+        if current and len(current) + len(sentence) + 1 > limit:
+            chunks.append(current)
+            current = ""
+        sep = "" if not current or _is_cjk(sentence) else " "
+        current = f"{current}{sep}{sentence}"
+        # A single over-long sentence is cut hard
+        while len(current) > limit:
+            chunks.append(current[:limit])
+            current = current[limit:].lstrip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _wrap(text: str) -> List[str]:
+    """Breaks a cue into at most MAX_LINES balanced lines."""
+    per_line = MAX_LINE_CHARS_CJK if _is_cjk(text) else MAX_LINE_CHARS_LATIN
+    if len(text) <= per_line:
+        return [text]
+    middle = len(text) // 2
+    if not _is_cjk(text):
+        spaces = [i for i, c in enumerate(text) if c == " "]
+        if spaces:
+            middle = min(spaces, key=lambda i: abs(i - middle))
+            return [text[:middle].strip(), text[middle:].strip()]
+    return [text[:middle], text[middle:]]
+
+
+def build_cues(timeline: List[Dict[str, Any]]) -> List[Cue]:
+    """
+    Cues for every frame with dialogue.
+
+    A cue starts with its frame's clip and lasts as long as the measured
+    dialogue audio (plus a short linger), or an estimated reading time when
+    the frame has no audio. It never runs past the end of the clip.
+    """
+    cues: List[Cue] = []
+    for entry in timeline:
+        frame = entry["frame"]
+        text = clean_dialogue(frame.dialogue)
+        if not text:
+            continue
+        clip_start = entry["start"]
+        clip_end = clip_start + entry["duration"]
+        dialogue = entry.get("dialogue")
+        if dialogue and dialogue.get("duration"):
+            spoken = dialogue["duration"] + LINGER_SECONDS
+        else:
+            spoken = _reading_seconds(text)
+        end = min(clip_start + spoken, clip_end)
+
+        chunks = _split_sentences(text)
+        total_chars = sum(len(c) for c in chunks)
+        cursor = clip_start
+        for chunk in chunks:
+            chunk_end = cursor + (end - clip_start) * len(chunk) / total_chars
+            cues.append((cursor, chunk_end, chunk, frame.speaker or ""))
+            cursor = chunk_end
+    return cues
+
+
+def _srt_time(seconds: float) -> str:
+    ms = int(round(max(seconds, 0) * 1000))
+    h, ms = divmod(ms, 3600000)
+    m, ms = divmod(ms, 60000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def _ass_time(seconds: float) -> str:
+    cs = int(round(max(seconds, 0) * 100))
+    h, cs = divmod(cs, 360000)
+    m, cs = divmod(cs, 6000)
+    s, cs = divmod(cs, 100)
+    return f"{h:d}:{m:02d}:{s:02d}.{cs:02d}"
+
+
+def write_srt(cues: List[Cue], output_path: str) -> str:
+    with open(output_path, "w", encoding="utf-8") as f:
+        for i, (start, end, text, _) in enumerate(cues, 1):
+            f.write(f"{i}\n{_srt_time(start)} --> {_srt_time(end)}\n" + "\n".join(_wrap(text)) + "\n\n")
+    return output_path
+
+
+def _ass_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}")
+
+
+def write_ass(cues: List[Cue], output_path: str, width: int, height: int) -> str:
+    """Writes an ASS script laid out for a width x height frame (font scales with height)."""
+    font = os.getenv("LUMENX_SUBTITLE_FONT", DEFAULT_FONT)
+    font_size = max(16, int(round(min(width, height) * 0.05)))
+    outline = max(1, font_size // 14)
+    margin_v = int(round(height * 0.05))
+    header = (
+        "[Script Info]\n"
+        "ScriptType: v4.00+\n"
+        f"PlayResX: {width}\n"
+        f"PlayResY: {height}\n"
+        "WrapStyle: 0\n"
+        "ScaledBorderAndShadow: yes\n\n"
+        "[V4+ Styles]\n"
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding\n"
+        f"Style: Default,{font},{font_size},&H00FFFFFF,&H000000FF,&H00000000,&H80000000,"
+        f"0,0,0,0,100,100,0,0,1,{outline},0,2,{margin_v},{margin_v},{margin_v},1\n\n"
+        "[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+    )
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(header)
+        for start, end, text, speaker in cues:
+            body = "\\N".join(_ass_escape(line) for line in _wrap(text))
+            f.write(f"Dialogue: 0,{_ass_time(start)},{_ass_time(end)},Default,{speaker.replace(',', ' ')},"
+                    f"0,0,0,,{body}\n")
+    return output_path
+
+
+def write_subtitles(timeline: List[Dict[str, Any]], base_path: str, width: int, height: int) -> Dict[str, str]:
+    """
+    Writes ``<base_path>.srt`` and ``<base_path>.ass`` for the timeline.
+
+    Returns {"srt": path, "ass": path}, or {} when no frame has dialogue.
+    """
+    cues = build_cues(timeline)
+    if not cues:
+        return {}
+    logger.info(f"Writing {len(cues)} subtitle cues to {base_path}.srt/.ass")
+    return {
+        "srt": write_srt(cues, f"{base_path}.srt"),
+        "ass": write_ass(cues, f"{base_path}.ass", width, height),
+    }
@@ -0,0 +1,105 @@
+import sys
+import os
+import asyncio
+import time
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+import httpx
+import pytest
+
+from src.apps.comic_gen import api
+from src.utils.executors import LoopLagMonitor
+
+# Each stubbed pipeline call blocks its thread this long (stands in for LLM/render/ffmpeg work)
+BLOCK_SECONDS = 0.5
+# Event loop stalls above this fail the test
+LAG_THRESHOLD = 0.1
+
+BLOCKING_REQUESTS = [
+    ("post", "/projects/p1/storyboard/render", {"frame_id": "f1", "prompt": "x"}),
+    ("post", "/projects/p1/storyboard/analyze", {"text": "x"}),
+    ("post", "/projects/p1/storyboard/refine_prompt", {"frame_id": "f1", "raw_prompt": "x"}),
+    ("post", "/projects/p1/frames/f1/audio", {}),
+    ("post", "/projects/p1/generate_assets", None),
+    ("post", "/projects/p1/preview", None),
+    ("post", "/projects/p1/export", {}),
+    ("post", "/projects/p1/frames/update", {"frame_id": "f1"}),
+    ("post", "/video/polish_prompt", {"draft_prompt": "x"}),
+    ("post", "/video/polish_r2v_prompt", {"draft_prompt": "x", "slots": []}),
+    ("post", "/tasks/t1/cancel", None),
+]
+
+
+def _blocking(result=None):
+    def stub(*args, **kwargs):
+        time.sleep(BLOCK_SECONDS)
+        return result
+    return stub
+
+
+def _stub_pipeline(monkeypatch):
+    """Replaces the pipeline calls with blocking stubs; monkeypatch restores the originals."""
+    # Never let a test sweep the real output/blobs
+    monkeypatch.setenv("LUMENX_MEDIA_GC", "0")
+    pipeline = api.pipeline
+    monkeypatch.setattr(pipeline, "get_script", lambda script_id: object())
+    for name in ("generate_storyboard_render", "analyze_text_to_frames", "generate_dialogue_line",
+                 "generate_assets", "update_frame"):
+        monkeypatch.setattr(pipeline, name, _blocking())
+    monkeypatch.setattr(pipeline, "refine_frame_prompt", _blocking({"prompt_cn": "", "prompt_en": ""}))
+    monkeypatch.setattr(pipeline, "build_preview", _blocking({"url": "preview/p1.mp4"}))
+    monkeypatch.setattr(pipeline, "export_project", _blocking("export/p1.mp4"))
+    monkeypatch.setattr(pipeline, "cancel_task", _blocking({"status": "cancelled"}))
+    monkeypatch.setattr(api.ScriptProcessor, "polish_video_prompt", _blocking({"prompt_cn": "", "prompt_en": ""}))
+    monkeypatch.setattr(api.ScriptProcessor, "polish_r2v_prompt", _blocking({"prompt_cn": "", "prompt_en": ""}))
+
+
+async def _fire_concurrently(monitor):
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        monitor.start()
+        await asyncio.sleep(0.2)
+        start = time.time()
+        responses = await asyncio.gather(*[
+            client.request(method, path, json=body) for method, path, body in BLOCKING_REQUESTS
+        ])
+        elapsed = time.time() - start
+        monitor.stop()
+    return responses, elapsed
+
+
+def test_monitor_detects_blocking():
+    """Sanity check: a callback that blocks the loop is reported."""
+    async def run():
+        monitor = LoopLagMonitor(interval=0.02, warn_threshold=LAG_THRESHOLD).start()
+        await asyncio.sleep(0.1)
+        time.sleep(BLOCK_SECONDS)
+        await asyncio.sleep(0.1)
+        monitor.stop()
+        return monitor
+    monitor = asyncio.run(run())
+    print(f"Deliberate block: {monitor.stats()}")
+    assert monitor.max_lag >= BLOCK_SECONDS * 0.8, monitor.stats()
+    assert monitor.stalls >= 1
+
+
+def test_endpoints_do_not_block_loop(monkeypatch):
+    """Blocking endpoints hand their work to executors, so the loop keeps ticking."""
+    _stub_pipeline(monkeypatch)
+    monitor = LoopLagMonitor(interval=0.02, warn_threshold=LAG_THRESHOLD)
+    responses, elapsed = asyncio.run(_fire_concurrently(monitor))
+    for (method, path, _), response in zip(BLOCKING_REQUESTS, responses):
+        assert response.status_code == 200, (path, response.status_code, response.text)
+    print(f"{len(responses)} blocking requests in {elapsed:.2f}s, loop: {monitor.stats()}")
+    assert monitor.max_lag < LAG_THRESHOLD, f"Event loop blocked for {monitor.max_lag * 1000:.0f}ms"
+    # Serialized on the loop they would take len * BLOCK_SECONDS
+    assert elapsed < len(BLOCKING_REQUESTS) * BLOCK_SECONDS / 2
+
+
+if __name__ == "__main__":
+    test_monitor_detects_blocking()
+    with pytest.MonkeyPatch.context() as mp:
+        test_endpoints_do_not_block_loop(mp)
+    print("Event loop test passed.")
@@ -0,0 +1,93 @@
+import sys
+import os
+import json
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from src.utils.json_stream import JsonArrayStream
+
+FRAMES = [
+    {"id": 1, "action": "他说：\"走吧}\"", "tags": ["[夜]", "{雨}"]},
+    {"id": 2, "action": "反斜杠 \\ 和 ] 结尾", "camera": {"shot": "close", "moves": [[0, 1], [2, 3]]}},
+    {"id": 3, "action": "", "dialogue": None},
+]
+DOCUMENT = json.dumps({"characters": [{"name": "叶墨"}], "frames": FRAMES}, ensure_ascii=False, indent=2)
+
+
+def _feed_all(stream, deltas):
+    out = []
+    for delta in deltas:
+        out.extend(stream.feed(delta))
+    return out
+
+
+def test_whole_document():
+    stream = JsonArrayStream("frames")
+    assert stream.feed(DOCUMENT) == FRAMES
+    assert stream.done and stream.emitted == 3
+
+
+def test_split_at_every_character():
+    stream = JsonArrayStream("frames")
+    assert _feed_all(stream, DOCUMENT) == FRAMES
+    assert stream.done
+
+
+def test_elements_are_emitted_as_soon_as_they_close():
+    stream = JsonArrayStream("frames")
+    first_end = DOCUMENT.index('"id": 2')
+    assert stream.feed(DOCUMENT[:first_end]) == FRAMES[:1]
+    assert not stream.done
+    assert stream.feed(DOCUMENT[first_end:]) == FRAMES[1:]
+
+
+def test_brackets_inside_strings_do_not_change_nesting():
+    text = '{"frames": [{"a": "}]}"}, {"b": "[[{{\\"]"}]}'
+    stream = JsonArrayStream("frames")
+    assert _feed_all(stream, text) == [{"a": "}]}"}, {"b": '[[{{"]'}]
+    assert stream.done
+
+
+def test_code_fence_and_preamble():
+    text = "好的，以下是分镜：\n```json\n" + DOCUMENT + "\n```\n希望有帮助。"
+    stream = JsonArrayStream("frames")
+    assert _feed_all(stream, [text[i:i + 7] for i in range(0, len(text), 7)]) == FRAMES
+    assert stream.done
+
+
+def test_other_arrays_before_the_key_are_ignored():
+    stream = JsonArrayStream("frames")
+    assert {"name": "叶墨"} not in _feed_all(stream, DOCUMENT)
+
+
+def test_top_level_array_without_key():
+    stream = JsonArrayStream()
+    assert _feed_all(stream, json.dumps(FRAMES, ensure_ascii=False)) == FRAMES
+
+
+def test_malformed_elements_are_skipped():
+    text = '{"frames": [{"id": 1}, {"id": 2,}, {"id": tru}, {"id": 4}]}'
+    stream = JsonArrayStream("frames")
+    assert _feed_all(stream, text) == [{"id": 1}, {"id": 4}]
+    assert stream.emitted == 2 and stream.done
+
+
+def test_nothing_after_the_closing_bracket():
+    stream = JsonArrayStream("frames")
+    stream.feed('{"frames": [{"id": 1}]')
+    assert stream.done
+    assert stream.feed(', "more": [{"id": 2}]}') == []
+
+
+def test_truncated_stream_keeps_only_complete_elements():
+    stream = JsonArrayStream("frames")
+    assert _feed_all(stream, '{"frames": [{"id": 1}, {"id": 2, "act') == [{"id": 1}]
+    assert not stream.done
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+    print("JSON stream tests passed.")
@@ -0,0 +1,134 @@
+import sys
+import os
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from src.apps.comic_gen.novel_chunks import merge_entities, split_novel, split_variant
+
+
+def _sentences(count, text="他走进了古老的遗迹。"):
+    return text * count
+
+
+def test_short_text_is_one_chunk():
+    text = "第一段。\n\n第二段。"
+    assert split_novel(text, max_chars=100) == ["第一段。\n第二段。"]
+
+
+def test_chapters_start_new_chunks():
+    text = "第一章 出发\n他出发了。\n第二章 归来\n他回来了。"
+    chunks = split_novel(text, max_chars=100)
+    assert chunks == ["第一章 出发\n他出发了。", "第二章 归来\n他回来了。"]
+
+
+def test_paragraphs_are_packed_up_to_the_limit():
+    paragraphs = [_sentences(2) for _ in range(6)]  # 20 chars each
+    chunks = split_novel("\n\n".join(paragraphs), max_chars=50)
+    assert all(len(c) <= 50 for c in chunks)
+    assert len(chunks) == 3
+    assert "".join(c.replace("\n", "") for c in chunks) == "".join(paragraphs)
+
+
+def test_oversized_paragraph_is_cut_at_sentence_ends():
+    paragraph = _sentences(10)  # 100 chars, 10 sentences
+    chunks = split_novel(paragraph, max_chars=35)
+    assert all(len(c) <= 35 for c in chunks)
+    assert all(c.endswith("。") for c in chunks)
+    assert "".join(chunks) == paragraph
+
+
+def test_sentence_longer_than_a_chunk_is_hard_cut():
+    paragraph = "啊" * 25
+    chunks = split_novel(paragraph, max_chars=10)
+    assert chunks == ["啊" * 10, "啊" * 10, "啊" * 5]
+
+
+def test_heading_stays_with_oversized_paragraph():
+    text = "第三章 夜袭\n" + _sentences(10)
+    chunks = split_novel(text, max_chars=35)
+    assert chunks[0].startswith("第三章 夜袭\n")
+    assert len(chunks[0]) > len("第三章 夜袭\n")
+    assert all(len(c) <= 35 for c in chunks)
+    assert "".join(c.replace("\n", "") for c in chunks) == text.replace("\n", "")
+
+
+def test_english_chapter_heading():
+    text = "Chapter 1\nShe left.\n\nCHAPTER II\nShe returned."
+    assert split_novel(text, max_chars=100) == ["Chapter 1\nShe left.", "CHAPTER II\nShe returned."]
+
+
+def test_heading_without_text_is_kept():
+    text = "第一章 出发\n他出发了。\n第二章 未完"
+    assert split_novel(text, max_chars=100) == ["第一章 出发\n他出发了。", "第二章 未完"]
+
+
+def test_split_variant():
+    assert split_variant("叶墨 (古装)") == ("叶墨", "古装")
+    assert split_variant("叶墨（古装）") == ("叶墨", "古装")
+    assert split_variant("叶墨") == ("叶墨", None)
+
+
+def test_merge_characters_across_aliases():
+    result = merge_entities([
+        {"characters": [{"id": "char_001", "name": "叶墨", "description": "青年", "visual_weight": 3}]},
+        {"characters": [{"id": "char_001", "name": "小墨", "aliases": ["叶墨"],
+                         "description": "身穿黑衣的青年剑客", "visual_weight": 5}]},
+    ])
+    assert len(result["characters"]) == 1
+    char = result["characters"][0]
+    assert char["name"] == "叶墨"
+    assert char["description"] == "身穿黑衣的青年剑客"  # Longest description wins
+    assert char["visual_weight"] == 5
+    assert char["id"] == "char_001"
+
+
+def test_alias_seen_later_maps_to_first_name():
+    result = merge_entities([
+        {"characters": [{"name": "叶墨", "aliases": ["小墨"]}]},
+        {"characters": [{"name": "小墨", "description": "少年"}]},
+    ])
+    assert [c["name"] for c in result["characters"]] == ["叶墨"]
+    assert result["characters"][0]["aliases"] == ["小墨"]
+
+
+def test_outfit_variants_merge_through_base_aliases():
+    result = merge_entities([
+        {"characters": [{"name": "叶墨", "aliases": ["小墨"], "description": "青年"}]},
+        {"characters": [{"name": "小墨（古装）", "description": "长袍"}]},
+        {"characters": [{"name": "叶墨 (古装)", "clothing": "青色长袍"}]},
+    ])
+    names = [c["name"] for c in result["characters"]]
+    assert names == ["叶墨", "叶墨 (古装)"]
+    assert result["characters"][1]["clothing"] == "青色长袍"
+
+
+def test_variant_without_base_gets_a_base_character():
+    result = merge_entities([
+        {"characters": [{"name": "林婉 (婚服)", "description": "少女", "gender": "女"}]},
+    ])
+    names = [c["name"] for c in result["characters"]]
+    assert names == ["林婉", "林婉 (婚服)"]
+    assert result["characters"][0]["gender"] == "女"
+    assert [c["id"] for c in result["characters"]] == ["char_001", "char_002"]
+
+
+def test_scenes_and_props_merge_by_normalized_name():
+    result = merge_entities([
+        {"scenes": [{"id": "scene_001", "name": "古 庙", "description": "破庙"}],
+         "props": [{"id": "prop_001", "name": "Sword"}]},
+        {"scenes": [{"id": "scene_001", "name": "古庙", "description": "山顶上的破旧古庙"},
+                    {"id": "scene_002", "name": "集市"}],
+         "props": [{"id": "prop_001", "name": "sword", "description": "长剑"}]},
+    ])
+    assert [s["name"] for s in result["scenes"]] == ["古 庙", "集市"]
+    assert result["scenes"][0]["description"] == "山顶上的破旧古庙"
+    assert [s["id"] for s in result["scenes"]] == ["scene_001", "scene_002"]
+    assert result["props"] == [{"name": "Sword", "description": "长剑", "id": "prop_001"}]
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+    print("Novel chunk tests passed.")
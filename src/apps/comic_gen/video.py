@@ -3,6 +3,8 @@ from typing import Dict, Any
 from .models import StoryboardFrame, GenerationStatus
 from ...models.wanx import WanxModel
 from ...utils import get_logger
+from ...utils.media_store import get_media_store
+from .media_index import get_media_index
 
 logger = get_logger(__name__)
 
@@ -50,6 +52,9 @@ class VideoGenerator:
                 img_url=image_url if not img_path else None
             )
             
+            content_hash = get_media_store().ingest(output_path)
+            get_media_index().record(output_path, content_hash)
+
             # Upload to OSS if configured
             video_url = os.path.relpath(output_path, "output")
             try:
@@ -63,7 +68,7 @@ class VideoGenerator:
             except Exception as e:
                 logger.error(f"Failed to upload motion ref to OSS: {e}")
             
-            return {"video_url": video_url}
+            return {"video_url": video_url, "content_hash": content_hash}
             
         except Exception as e:
             logger.error(f"Failed to generate I2V motion reference: {e}")
@@ -2,10 +2,10 @@
 Text-to-Speech (TTS) module using DashScope CosyVoice API.
 Converts text to speech audio for use in video lip-sync.
 """
-import os
 import logging
 from typing import Optional, Tuple
-from dashscope.audio.tts_v2 import SpeechSynthesizer
+
+from ..utils.dashscope_client import get_dashscope_client, run_sync
 
 logger = logging.getLogger(__name__)
 
@@ -36,11 +36,8 @@ class TTSProcessor:
             model: TTS model name (default: cosyvoice-v2)
             voice: Voice name (default: longxiaochun_v2)
         """
-        import dashscope
-        
-        self.api_key = api_key or os.getenv('DASHSCOPE_API_KEY')
-        if self.api_key:
-            dashscope.api_key = self.api_key
+        # None: the client reads DASHSCOPE_API_KEY on every call, so runtime key changes apply
+        self.api_key = api_key
         
         self.model = model
         self.voice = voice
@@ -73,15 +70,10 @@ class TTSProcessor:
         logger.info(f"Synthesizing text with voice '{voice}'...")
         logger.info(f"Text: {text[:100]}{'...' if len(text) > 100 else ''}")
         
-        # Create synthesizer
-        synthesizer = SpeechSynthesizer(model=self.model, voice=voice)
-        
-        # Synthesize audio
-        audio_data = synthesizer.call(text)
-        
-        # Get metrics
-        request_id = synthesizer.get_last_request_id()
-        first_package_delay = synthesizer.get_first_package_delay()
+        # Synthesize audio over the shared async client's WebSocket session
+        audio_data, first_package_delay, request_id = run_sync(
+            get_dashscope_client(self.api_key).synthesize_speech(text, model=self.model, voice=voice)
+        )
         
         # Save audio
         with open(output_path, 'wb') as f:
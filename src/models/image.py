@@ -2,12 +2,17 @@ from abc import ABC, abstractmethod
 from typing import Dict, Any, Tuple
 import os
 import time
-import requests
 from http import HTTPStatus
 import dashscope
 from dashscope import ImageSynthesis
 from ..utils import get_logger
-from ..utils.oss_utils import OSSImageUploader
+from ..utils.dashscope_client import MULTIMODAL_GENERATION_PATH, get_dashscope_client, run_sync
+from ..utils.http_client import get_http_session
+from ..utils.oss_utils import OSSImageUploader, stream_results_enabled
+from ..utils.result_cache import get_result_cache
+from ..utils.cancellation import (
+    TaskCancelledError, raise_if_cancelled, current_cancel_event
+)
 
 logger = get_logger(__name__)
 
@@ -79,6 +84,12 @@ class WanxImageModel(ImageGenModel):
         negative_prompt = kwargs.pop('negative_prompt', None)
         # model_name is already handled above, remove from kwargs if present
         kwargs.pop('model_name', None)
+        # Optional threading.Event set by the pipeline when the task is cancelled
+        cancel_event = kwargs.pop('cancel_event', None) or current_cancel_event()
+        # Skip the result cache and always call the API
+        bypass_cache = kwargs.pop('bypass_cache', False)
+        # Seed stays in kwargs so the SDK path forwards it as-is
+        seed = kwargs.get('seed')
         
         # Determine reference image limit based on model
         ref_limit = 4 if final_model_name == 'wan2.6-image' else 3
@@ -90,14 +101,31 @@ class WanxImageModel(ImageGenModel):
         logger.info(f"Prompt: {prompt}")
         logger.info(f"Model: {final_model_name}, Size: {size}, N: {n}")
 
+        # Only seeded requests are reproducible, so only those are served from cache
+        result_cache = get_result_cache()
+        cache_key = None
+        if seed is not None and not bypass_cache and result_cache.enabled:
+            cache_key = result_cache.make_key("image", {
+                "model": final_model_name,
+                "prompt": prompt,
+                "negative_prompt": negative_prompt,
+                "size": size,
+                "n": n,
+                **kwargs
+            }, all_ref_paths)
+            if result_cache.fetch(cache_key, output_path):
+                return output_path, 0.0
+
         try:
+            raise_if_cancelled(cancel_event)
             api_start_time = time.time()
             # Use HTTP API for wan2.6 models (SDK not supported yet)
             if final_model_name == 'wan2.6-t2i':
-                image_url = self._generate_wan26_http(prompt, size, n, negative_prompt)
+                image_url = self._generate_wan26_http(prompt, size, n, negative_prompt, seed=seed)
             elif final_model_name == 'wan2.6-image':
                 # wan2.6-image for I2I (requires reference images)
-                image_url = self._generate_wan26_image_http(prompt, size, n, negative_prompt, all_ref_paths)
+                image_url = self._generate_wan26_image_http(prompt, size, n, negative_prompt, all_ref_paths,
+                                                            cancel_event=cancel_event, seed=seed)
             else:
                 # Use SDK for other models
                 image_url = self._generate_sdk(prompt, final_model_name, size, n, negative_prompt, all_ref_paths,
@@ -110,24 +138,23 @@ class WanxImageModel(ImageGenModel):
             logger.info(f"API duration: {api_duration:.2f}s")
             
             # Download image
+            raise_if_cancelled(cancel_event)
             self._download_image(image_url, output_path)
+            if cache_key:
+                result_cache.store(cache_key, output_path)
             return output_path, api_duration
 
+        except TaskCancelledError:
+            logger.info(f"Image generation cancelled (model: {final_model_name})")
+            raise
         except Exception as e:
             import traceback
             logger.error(f"Error during generation: {e}")
             logger.error(traceback.format_exc())
             raise
 
-    def _generate_wan26_http(self, prompt: str, size: str, n: int, negative_prompt: str = None) -> str:
+    def _generate_wan26_http(self, prompt: str, size: str, n: int, negative_prompt: str = None, seed: int = None) -> str:
         """Generate image using Wan 2.6 T2I via HTTP API (synchronous)."""
-        url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation"
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
         payload = {
             "model": "wan2.6-t2i",
             "input": {
@@ -153,21 +180,13 @@ class WanxImageModel(ImageGenModel):
         # Add negative_prompt if provided
         if negative_prompt:
             payload["parameters"]["negative_prompt"] = negative_prompt
+        if seed is not None:
+            payload["parameters"]["seed"] = seed
         
         logger.info(f"Calling Wan 2.6 T2I HTTP API...")
         logger.info(f"Payload: {payload}")
         
-        response = requests.post(url, headers=headers, json=payload, timeout=300)  # 5 minutes for slow API responses
-        
-        logger.info(f"Response status: {response.status_code}")
-        logger.info(f"Response body: {response.text[:500]}...")
-        
-        if response.status_code != 200:
-            error_data = response.json() if response.text else {}
-            error_msg = error_data.get('message', response.text)
-            raise RuntimeError(f"Wan 2.6 API failed: {error_msg}")
-        
-        result = response.json()
+        result = run_sync(get_dashscope_client().call(MULTIMODAL_GENERATION_PATH, payload, label="Wan 2.6", timeout=300))
         
         # Extract image URL from response
         # Response format: output.choices[].message.content[].image
@@ -187,16 +206,9 @@ class WanxImageModel(ImageGenModel):
         
         return image_url
 
-    def _generate_wan26_image_http(self, prompt: str, size: str, n: int, negative_prompt: str = None, ref_image_paths: list = None) -> str:
+    def _generate_wan26_image_http(self, prompt: str, size: str, n: int, negative_prompt: str = None, ref_image_paths: list = None,
+                                   cancel_event=None, seed: int = None) -> str:
         """Generate image using Wan 2.6 Image via HTTP API (asynchronous with polling)."""
-        create_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/image-generation/generation"
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
-            "X-DashScope-Async": "enable"  # Required for async mode
-        }
-        
         # Build content array with text and reference images
         content = [{"text": prompt}]
         
@@ -210,7 +222,7 @@ class WanxImageModel(ImageGenModel):
                     # Upload local file to OSS and get signed URL for AI API
                     uploader = OSSImageUploader()
                     if uploader.is_configured:
-                        object_key = uploader.upload_file(path, sub_path="temp/ref_images")
+                        object_key = uploader.upload_input_file(path, sub_path="temp/ref_images")
                         if object_key:
                             # Generate signed URL for AI API access (30 min validity)
                             signed_url = uploader.sign_url_for_api(object_key)
@@ -259,93 +271,33 @@ class WanxImageModel(ImageGenModel):
         # Add negative_prompt if provided
         if negative_prompt:
             payload["parameters"]["negative_prompt"] = negative_prompt
+        if seed is not None:
+            payload["parameters"]["seed"] = seed
         
         logger.info(f"Calling Wan 2.6 Image HTTP API (async)...")
         logger.info(f"Payload: {payload}")
         
-        # Step 1: Create task
-        response = requests.post(create_url, headers=headers, json=payload, timeout=120)  # 2 minutes for task creation
-        
-        logger.info(f"Create task response status: {response.status_code}")
-        logger.info(f"Create task response body: {response.text[:500]}")
-        
-        if response.status_code != 200:
-            error_data = response.json() if response.text else {}
-            error_msg = error_data.get('message', response.text)
-            raise RuntimeError(f"Wan 2.6 Image task creation failed: {error_msg}")
-        
-        result = response.json()
-        task_id = result.get('output', {}).get('task_id')
-        if not task_id:
-            raise RuntimeError(f"No task_id in response: {result}")
-        
-        logger.info(f"Task created: {task_id}")
-        
-        # Step 2: Poll for task completion
-        poll_url = f"https://dashscope.aliyuncs.com/api/v1/tasks/{task_id}"
-        poll_headers = {
-            "Authorization": f"Bearer {self.api_key}"
-        }
+        # Create the task and poll it on the shared async client; a cancel also cancels the remote task
+        output = run_sync(get_dashscope_client().generate_image(
+            payload, label="Wan 2.6 Image", poll_interval=10, max_wait=600, cancel_event=cancel_event
+        ))
+
+        # Extract image URL from choices
+        choices = output.get('choices', [])
+        if not choices:
+            raise RuntimeError(f"No choices in completed task: {output}")
         
-        max_wait_time = 600  # 10 minutes max wait (I2I can take longer)
-        poll_interval = 10   # Poll every 10 seconds
-        elapsed = 0
+        first_choice = choices[0]
+        content = first_choice.get('message', {}).get('content', [])
+        if not content:
+            raise RuntimeError(f"No content in choice: {first_choice}")
         
-        while elapsed < max_wait_time:
-            time.sleep(poll_interval)
-            elapsed += poll_interval
-            
-            poll_response = requests.get(poll_url, headers=poll_headers, timeout=30)
-            
-            if poll_response.status_code != 200:
-                logger.warning(f"Poll request failed: {poll_response.status_code}")
-                continue
-            
-            poll_result = poll_response.json()
-            task_status = poll_result.get('output', {}).get('task_status')
-            
-            logger.info(f"Task {task_id} status: {task_status} (elapsed: {elapsed}s)")
-            
-            if task_status == 'SUCCEEDED':
-                # Extract image URL from choices
-                choices = poll_result.get('output', {}).get('choices', [])
-                if not choices:
-                    raise RuntimeError(f"No choices in completed task: {poll_result}")
-                
-                first_choice = choices[0]
-                content = first_choice.get('message', {}).get('content', [])
-                if not content:
-                    raise RuntimeError(f"No content in choice: {first_choice}")
-                
-                image_url = content[0].get('image')
-                if not image_url:
-                    raise RuntimeError(f"No image URL in content: {content}")
-                
-                logger.info(f"Task completed. Image URL: {image_url}")
-                return image_url
-            
-            elif task_status == 'FAILED':
-                # Log full response for debugging
-                logger.error(f"Task {task_id} failed. Full response: {poll_result}")
-                
-                # Try to extract error message from various possible fields
-                error_msg = (
-                    poll_result.get('output', {}).get('message', '') or
-                    poll_result.get('output', {}).get('code', '') or
-                    poll_result.get('message', '') or
-                    poll_result.get('code', '') or
-                    'Unknown error - check logs for full response'
-                )
-                
-                raise RuntimeError(f"Wan 2.6 Image task failed: {error_msg}")
-
-            
-            elif task_status in ['CANCELED', 'UNKNOWN']:
-                raise RuntimeError(f"Wan 2.6 Image task {task_status}: {poll_result}")
-            
-            # PENDING or RUNNING - continue polling
+        image_url = content[0].get('image')
+        if not image_url:
+            raise RuntimeError(f"No image URL in content: {content}")
         
-        raise RuntimeError(f"Wan 2.6 Image task timed out after {max_wait_time}s")
+        logger.info(f"Task completed. Image URL: {image_url}")
+        return image_url
 
     def _generate_sdk(self, prompt: str, model_name: str, size: str, n: int, negative_prompt: str, all_ref_paths: list, kwargs: dict) -> str:
         """Generate image using Dashscope SDK (for older models)."""
@@ -374,7 +326,7 @@ class WanxImageModel(ImageGenModel):
                 if os.path.exists(path):
                     # Upload to OSS and get signed URL
                     if uploader.is_configured:
-                        object_key = uploader.upload_file(path, sub_path="temp/ref_images")
+                        object_key = uploader.upload_input_file(path, sub_path="temp/ref_images")
                         if object_key:
                             signed_url = uploader.sign_url_for_api(object_key)
                             ref_image_urls.append(signed_url)
@@ -443,25 +395,20 @@ class WanxImageModel(ImageGenModel):
 
     def _download_image(self, url: str, output_path: str):
         logger.info(f"Downloading image to {output_path}...")
-        
-        # Setup retry strategy
-        from requests.adapters import HTTPAdapter
-        from requests.packages.urllib3.util.retry import Retry
-        
-        retry_strategy = Retry(
-            total=5,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "OPTIONS"]
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        http = requests.Session()
-        http.mount("https://", adapter)
-        http.mount("http://", adapter)
 
+        uploader = OSSImageUploader()
+        if uploader.is_configured and stream_results_enabled():
+            try:
+                # One pass into OSS and the local copy; upload_file then reuses the object
+                uploader.upload_from_url(url, output_path)
+                return
+            except Exception as e:
+                logger.warning(f"Streaming result to OSS failed ({e}); falling back to a local download")
+        
         temp_path = output_path + ".tmp"
         try:
-            response = http.get(url, stream=True, timeout=60, verify=False) # verify=False to avoid some SSL issues
+            # Shared pooled session (keep-alive + retries on 429/5xx)
+            response = get_http_session().get(url, stream=True, timeout=60, verify=False) # verify=False to avoid some SSL issues
             response.raise_for_status()
             
             # Ensure directory exists
@@ -471,8 +418,8 @@ class WanxImageModel(ImageGenModel):
                 for chunk in response.iter_content(chunk_size=8192):
                     f.write(chunk)
             
-            # Atomic rename
-            os.rename(temp_path, output_path)
+            # Atomic replace; never write through a media store hardlink
+            os.replace(temp_path, output_path)
             logger.info("Download complete.")
             
         except Exception as e:
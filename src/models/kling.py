@@ -1,9 +1,10 @@
 import time
-import requests
 import jwt
 import logging
 from typing import Dict, Any, Tuple
 from .base import VideoGenModel
+from ..utils.downloader import download_file
+from ..utils.http_client import get_http_session
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +56,7 @@ class KlingModel(VideoGenModel):
         # 1. Submit Task
         submit_url = f"{self.base_url}/videos/image2video" if img_url else f"{self.base_url}/videos/text2video"
         try:
-            response = requests.post(submit_url, headers=headers, json=payload)
+            response = get_http_session().post(submit_url, headers=headers, json=payload)
             response.raise_for_status()
             task_data = response.json()
             if task_data.get("code") != 0:
@@ -73,7 +74,7 @@ class KlingModel(VideoGenModel):
         
         while True:
             try:
-                response = requests.get(query_url, headers=headers)
+                response = get_http_session().get(query_url, headers=headers)
                 response.raise_for_status()
                 result_data = response.json()
                 
@@ -86,9 +87,7 @@ class KlingModel(VideoGenModel):
                 if status == "succeed":
                     video_url = result_data["data"]["task_result"]["videos"][0]["url"]
                     # Download video
-                    video_content = requests.get(video_url).content
-                    with open(output_path, "wb") as f:
-                        f.write(video_content)
+                    download_file(video_url, output_path)
                     
                     generation_time = time.time() - start_time
                     return output_path, generation_time
@@ -1,15 +1,17 @@
 import os
 import time
-import requests
-from http import HTTPStatus
-from dashscope import VideoSynthesis
-import dashscope
 from .base import VideoGenModel
 from ..utils import get_logger
 
 from typing import Tuple
 
-from ..utils.oss_utils import OSSImageUploader
+from ..utils.dashscope_client import get_dashscope_client, run_sync
+from ..utils.downloader import download_file
+from ..utils.oss_utils import OSSImageUploader, stream_results_enabled
+from ..utils.result_cache import get_result_cache
+from ..utils.cancellation import (
+    TaskCancelledError, current_cancel_event
+)
 
 logger = get_logger(__name__)
 
@@ -50,7 +52,9 @@ class WanxModel(VideoGenModel):
         duration = kwargs.get('duration') or self.params.get('duration', 5)
         negative_prompt = kwargs.get('negative_prompt') or self.params.get('negative_prompt', '')
         audio_url = kwargs.get('audio_url') or self.params.get('audio_url', '')
-        seed = kwargs.get('seed') or self.params.get('seed')
+        seed = kwargs.get('seed')
+        if seed is None:
+            seed = self.params.get('seed')
 
         # Resolution mapping - normalize to uppercase for API
         resolution = kwargs.get('resolution') or self.params.get('resolution', '720P')
@@ -66,9 +70,35 @@ class WanxModel(VideoGenModel):
         camera_motion = kwargs.get('camera_motion')
         subject_motion = kwargs.get('subject_motion')
 
+        # Optional threading.Event set by the pipeline when the task is cancelled
+        cancel_event = kwargs.get('cancel_event') or current_cancel_event()
+
         logger.info(f"Starting generation with model: {final_model_name}")
         logger.info(f"Prompt: {prompt}")
 
+        # Seeded requests are reproducible: serve repeats from the local result cache
+        result_cache = get_result_cache()
+        cache_key = None
+        if seed is not None and not kwargs.get('bypass_cache') and result_cache.enabled:
+            refs = [img_path or kwargs.get('img_url'), audio_url] + list(kwargs.get('ref_video_urls') or [])
+            cache_key = result_cache.make_key("video", {
+                "model": final_model_name,
+                "prompt": prompt,
+                "negative_prompt": negative_prompt,
+                "size": size,
+                "resolution": resolution,
+                "duration": duration,
+                "seed": seed,
+                "prompt_extend": prompt_extend,
+                "watermark": watermark,
+                "audio": kwargs.get('audio'),
+                "shot_type": kwargs.get('shot_type'),
+                "camera_motion": camera_motion,
+                "subject_motion": subject_motion
+            }, refs)
+            if result_cache.fetch(cache_key, output_path):
+                return output_path, 0.0
+
         try:
             api_start_time = time.time()
 
@@ -81,7 +111,7 @@ class WanxModel(VideoGenModel):
                     # Local file - upload to OSS and get signed URL
                     if uploader.is_configured:
                         logger.info(f"Uploading input image to OSS: {img_path}")
-                        object_key = uploader.upload_file(img_path, sub_path="temp/i2v_input")
+                        object_key = uploader.upload_input_file(img_path, sub_path="temp/i2v_input")
                         if object_key:
                             img_url = uploader.sign_url_for_api(object_key)
                             logger.info(f"Input image uploaded, signed URL: {img_url[:80]}...")
@@ -125,7 +155,8 @@ class WanxModel(VideoGenModel):
                     audio_url=audio_url,
                     watermark=watermark,
                     seed=seed,
-                    shot_type=shot_type
+                    shot_type=shot_type,
+                    cancel_event=cancel_event
                 )
             elif final_model_name == 'wan2.6-r2v':
                 # R2V generation
@@ -153,7 +184,7 @@ class WanxModel(VideoGenModel):
                         # Local file - upload to OSS
                         if uploader.is_configured:
                             logger.info(f"Uploading reference video to OSS: {local_path}")
-                            object_key = uploader.upload_file(local_path, sub_path="temp/r2v_input")
+                            object_key = uploader.upload_input_file(local_path, sub_path="temp/r2v_input")
                             if object_key:
                                 final_url = uploader.sign_url_for_api(object_key)
                                 logger.info(f"Reference video uploaded, signed URL: {final_url[:80]}...")
@@ -184,7 +215,8 @@ class WanxModel(VideoGenModel):
                     duration=duration,
                     audio=kwargs.get('audio', True), # Default to True for R2V
                     shot_type=shot_type,
-                    seed=seed
+                    seed=seed,
+                    cancel_event=cancel_event
                 )
             else:
                 # Use SDK for other models
@@ -200,7 +232,8 @@ class WanxModel(VideoGenModel):
                     watermark=watermark,
                     seed=seed,
                     camera_motion=camera_motion,
-                    subject_motion=subject_motion
+                    subject_motion=subject_motion,
+                    cancel_event=cancel_event
                 )
 
             api_end_time = time.time()
@@ -210,9 +243,14 @@ class WanxModel(VideoGenModel):
             logger.info(f"API duration: {api_duration:.2f}s")
 
             # Download video
-            self._download_video(video_url, output_path)
+            self._download_video(video_url, output_path, cancel_event=cancel_event)
+            if cache_key:
+                result_cache.store(cache_key, output_path)
             return output_path, api_duration
 
+        except TaskCancelledError:
+            logger.info(f"Generation cancelled (model: {final_model_name})")
+            raise
         except Exception as e:
             logger.error(f"Error during generation: {e}")
             raise
@@ -222,16 +260,8 @@ class WanxModel(VideoGenModel):
                                   duration: int = 5, prompt_extend: bool = True,
                                   negative_prompt: str = None, audio_url: str = None,
                                   watermark: bool = False, seed: int = None,
-                                  shot_type: str = "single") -> str:
+                                  shot_type: str = "single", cancel_event=None) -> str:
         """Generate video using Wan I2V (2.5 or 2.6) via HTTP API (asynchronous with polling)."""
-        create_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/video-generation/video-synthesis"
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
-            "X-DashScope-Async": "enable"  # Required for async mode
-        }
-        
         payload = {
             "model": model_name,  # Use passed model name (wan2.5-i2v or wan2.6-i2v)
             "input": {
@@ -254,88 +284,22 @@ class WanxModel(VideoGenModel):
         if audio_url:
             payload["input"]["audio_url"] = audio_url
             del payload["parameters"]["audio"]  # audio_url takes precedence
-        if seed:
+        if seed is not None:
             payload["parameters"]["seed"] = seed
         
         logger.info(f"Calling {model_name} HTTP API (async)...")
         logger.info(f"Payload: {payload}")
         
-        # Step 1: Create task
-        response = requests.post(create_url, headers=headers, json=payload, timeout=120)  # 2 minutes for task creation
-        
-        logger.info(f"Create task response status: {response.status_code}")
-        logger.info(f"Create task response body: {response.text[:500] if response.text else 'empty'}")
-        
-        if response.status_code != 200:
-            error_data = response.json() if response.text else {}
-            error_msg = error_data.get('message', response.text)
-            raise RuntimeError(f"{model_name} task creation failed: {error_msg}")
-        
-        result = response.json()
-        task_id = result.get('output', {}).get('task_id')
-        if not task_id:
-            raise RuntimeError(f"No task_id in response: {result}")
-        
-        logger.info(f"Task created: {task_id}")
-        
-        # Step 2: Poll for task completion
-        poll_url = f"https://dashscope.aliyuncs.com/api/v1/tasks/{task_id}"
-        poll_headers = {
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
-        max_wait_time = 900  # 15 minutes max wait (video generation takes longer)
-        poll_interval = 15   # Poll every 15 seconds
-        elapsed = 0
-        
-        while elapsed < max_wait_time:
-            time.sleep(poll_interval)
-            elapsed += poll_interval
-            
-            poll_response = requests.get(poll_url, headers=poll_headers, timeout=30)
-            
-            if poll_response.status_code != 200:
-                logger.warning(f"Poll request failed: {poll_response.status_code}")
-                continue
-            
-            poll_result = poll_response.json()
-            task_status = poll_result.get('output', {}).get('task_status')
-            
-            logger.info(f"Task {task_id} status: {task_status} (elapsed: {elapsed}s)")
-            
-            if task_status == 'SUCCEEDED':
-                video_url = poll_result.get('output', {}).get('video_url')
-                if not video_url:
-                    raise RuntimeError(f"No video_url in completed task: {poll_result}")
-                
-                logger.info(f"Task completed. Video URL: {video_url}")
-                return video_url
-            
-            elif task_status == 'FAILED':
-                error_msg = poll_result.get('output', {}).get('message', 'Unknown error')
-                code = poll_result.get('output', {}).get('code', '')
-                raise RuntimeError(f"{model_name} task failed: {code} - {error_msg}")
-            
-            elif task_status in ['CANCELED', 'UNKNOWN']:
-                raise RuntimeError(f"{model_name} task {task_status}: {poll_result}")
-            
-            # PENDING or RUNNING - continue polling
-        
-        raise RuntimeError(f"{model_name} task timed out after {max_wait_time}s")
+        # Create the task and poll it on the shared async client; a cancel also cancels the remote task
+        return run_sync(get_dashscope_client().synthesize_video(
+            payload, label=model_name, poll_interval=15, max_wait=900, cancel_event=cancel_event
+        ))
 
     def _generate_wan_r2v_http(self, prompt: str, ref_video_urls: list, model_name: str = "wan2.6-r2v",
                                   size: str = "1280*720", 
                                   duration: int = 5, audio: bool = True,
-                                  shot_type: str = "multi", seed: int = None) -> str:
+                                  shot_type: str = "multi", seed: int = None, cancel_event=None) -> str:
         """Generate video using Wan R2V via HTTP API (asynchronous with polling)."""
-        create_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/video-generation/video-synthesis"
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
-            "X-DashScope-Async": "enable"
-        }
-        
         payload = {
             "model": model_name,
             "input": {
@@ -350,162 +314,69 @@ class WanxModel(VideoGenModel):
             }
         }
         
-        if seed:
+        if seed is not None:
             payload["parameters"]["seed"] = seed
         
         logger.info(f"Calling {model_name} HTTP API (async)...")
         logger.info(f"Payload: {payload}")
         
-        # Step 1: Create task
-        response = requests.post(create_url, headers=headers, json=payload, timeout=120)
-        
-        logger.info(f"Create task response status: {response.status_code}")
-        logger.info(f"Create task response body: {response.text[:500] if response.text else 'empty'}")
-        
-        if response.status_code != 200:
-            error_data = response.json() if response.text else {}
-            error_msg = error_data.get('message', response.text)
-            raise RuntimeError(f"{model_name} task creation failed: {error_msg}")
-        
-        result = response.json()
-        task_id = result.get('output', {}).get('task_id')
-        if not task_id:
-            raise RuntimeError(f"No task_id in response: {result}")
-        
-        logger.info(f"Task created: {task_id}")
-        
-        # Step 2: Poll for task completion
-        poll_url = f"https://dashscope.aliyuncs.com/api/v1/tasks/{task_id}"
-        poll_headers = {
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
-        max_wait_time = 900  # 15 minutes max wait
-        poll_interval = 15   # Poll every 15 seconds
-        elapsed = 0
-        
-        while elapsed < max_wait_time:
-            time.sleep(poll_interval)
-            elapsed += poll_interval
-            
-            poll_response = requests.get(poll_url, headers=poll_headers, timeout=30)
-            
-            if poll_response.status_code != 200:
-                logger.warning(f"Poll request failed: {poll_response.status_code}")
-                continue
-            
-            poll_result = poll_response.json()
-            task_status = poll_result.get('output', {}).get('task_status')
-            
-            logger.info(f"Task {task_id} status: {task_status} (elapsed: {elapsed}s)")
-            
-            if task_status == 'SUCCEEDED':
-                video_url = poll_result.get('output', {}).get('video_url')
-                if not video_url:
-                    raise RuntimeError(f"No video_url in completed task: {poll_result}")
-                
-                logger.info(f"Task completed. Video URL: {video_url}")
-                return video_url
-            
-            elif task_status == 'FAILED':
-                error_msg = poll_result.get('output', {}).get('message', 'Unknown error')
-                code = poll_result.get('output', {}).get('code', '')
-                raise RuntimeError(f"{model_name} task failed: {code} - {error_msg}")
-            
-            elif task_status in ['CANCELED', 'UNKNOWN']:
-                raise RuntimeError(f"{model_name} task {task_status}: {poll_result}")
-            
-        raise RuntimeError(f"{model_name} task timed out after {max_wait_time}s")
+        # Create the task and poll it on the shared async client; a cancel also cancels the remote task
+        return run_sync(get_dashscope_client().synthesize_video(
+            payload, label=model_name, poll_interval=15, max_wait=900, cancel_event=cancel_event
+        ))
 
     def _generate_sdk(self, prompt: str, model_name: str, img_url: str = None, size: str = "1280*720",
                       duration: int = 5, prompt_extend: bool = True, negative_prompt: str = None,
                       audio_url: str = None, watermark: bool = False, seed: int = None,
-                      camera_motion: str = None, subject_motion: str = None) -> str:
-        """Generate video using Dashscope SDK (for older models)."""
-        # Prepare arguments
-        call_args = {
-            "api_key": self.api_key,
+                      camera_motion: str = None, subject_motion: str = None, cancel_event=None) -> str:
+        """Generate video for older models (the SDK's VideoSynthesis request shape) via the async client."""
+        payload = {
             "model": model_name,
-            "prompt": prompt,
-            "size": size,
-            "prompt_extend": prompt_extend,
-            "watermark": watermark,
+            "input": {"prompt": prompt},
+            "parameters": {
+                "size": size,
+                "prompt_extend": prompt_extend,
+                "watermark": watermark,
+            }
         }
         
         # Add optional arguments if they exist
         if negative_prompt:
-            call_args['negative_prompt'] = negative_prompt
-        if duration:
-            call_args['duration'] = duration
+            payload["input"]["negative_prompt"] = negative_prompt
         if audio_url:
-            call_args['audio_url'] = audio_url
-        if seed:
-            call_args['seed'] = seed
+            payload["input"]["audio_url"] = audio_url
+        if duration:
+            payload["parameters"]["duration"] = duration
+        if seed is not None:
+            payload["parameters"]["seed"] = seed
         if camera_motion:
-            call_args['camera_motion'] = camera_motion
+            payload["parameters"]["camera_motion"] = camera_motion
         if subject_motion:
-            call_args['motion_scale'] = subject_motion
+            payload["parameters"]["motion_scale"] = subject_motion
         
         if img_url:
-            call_args['img_url'] = img_url
+            payload["input"]["img_url"] = img_url
             logger.info(f"Image to Video mode. Input Image URL: {img_url}")
 
-        rsp = VideoSynthesis.async_call(**call_args)
-        
-        if rsp.status_code != HTTPStatus.OK:
-            logger.error(f"Failed to submit task: {rsp.code}, {rsp.message}")
-            raise RuntimeError(f"Task submission failed: {rsp.message}")
-        
-        task_id = rsp.output.task_id
-        logger.info(f"Task submitted. Task ID: {task_id}")
-        
-        # Wait for completion
-        rsp = VideoSynthesis.wait(rsp)
-        
-        logger.info(f"SDK response: {rsp}")
-
-        if rsp.status_code != HTTPStatus.OK:
-            logger.error(f"Task failed with status code: {rsp.status_code}, code: {rsp.code}, message: {rsp.message}")
-            raise RuntimeError(f"Task failed: {rsp.message}")
-        
-        if rsp.output.task_status != 'SUCCEEDED':
-             logger.error(f"Task finished but status is {rsp.output.task_status}. Code: {rsp.output.code}, Message: {rsp.output.message}")
-             raise RuntimeError(f"Task failed with status {rsp.output.task_status}: {rsp.output.message}")
+        return run_sync(get_dashscope_client().synthesize_video(
+            payload, label=model_name, poll_interval=5, max_wait=900, cancel_event=cancel_event
+        ))
 
-        video_url = rsp.output.video_url
-        if not video_url:
-             logger.error("Video URL is empty despite SUCCEEDED status.")
-             raise RuntimeError("Video URL is empty.")
-        
-        return video_url
-
-    def _download_video(self, url: str, path: str):
+    def _download_video(self, url: str, path: str, cancel_event=None):
         logger.info(f"Downloading video to {path}...")
-
-        from requests.adapters import HTTPAdapter
-        from requests.packages.urllib3.util.retry import Retry
-
-        session = requests.Session()
-        retry = Retry(connect=3, backoff_factor=0.5)
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
-
-        temp_path = path + ".tmp"
         try:
-            response = session.get(url, stream=True, timeout=120)  # 2 minutes for large video files
-            response.raise_for_status()
-
-            with open(temp_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
-            # Atomic rename
-            os.rename(temp_path, path)
-            logger.info("Download complete.")
-
+            uploader = OSSImageUploader()
+            if uploader.is_configured and stream_results_enabled():
+                try:
+                    # One pass into OSS and the local copy; upload_file then reuses the object
+                    uploader.upload_from_url(url, path, cancel_event=cancel_event)
+                    return
+                except TaskCancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Streaming result to OSS failed ({e}); falling back to a local download")
+            # Parallel ranged download; a retry after a network failure resumes the partial .tmp
+            download_file(url, path, cancel_event=cancel_event)
         except Exception as e:
             logger.error(f"Failed to download video: {e}")
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
             raise
@@ -7,6 +7,7 @@ import subprocess
 import logging
 from typing import Optional
 from .system_check import get_ffmpeg_path
+from .oss_media_cache import get_oss_media_cache
 
 logger = logging.getLogger(__name__)
 
@@ -41,8 +42,9 @@ class AudioExtractor:
         Extract audio from video file
         
         Args:
-            video_path: Path to input video file
+            video_path: Path to input video file (or an OSS object key, fetched through the local cache)
             output_path: Path to output audio file. If None, will use same directory as video
+                (output/audio for OSS-hosted videos)
             audio_format: Output audio format (mp3, wav, aac, etc.)
             audio_bitrate: Audio bitrate (e.g., '192k', '320k')
             
@@ -50,7 +52,14 @@ class AudioExtractor:
             str: Path to extracted audio file
         """
         if not os.path.exists(video_path):
-            raise FileNotFoundError(f"Video file not found: {video_path}")
+            local_path = get_oss_media_cache().resolve(video_path)
+            if not local_path:
+                raise FileNotFoundError(f"Video file not found: {video_path}")
+            if output_path is None:
+                video_name = os.path.splitext(os.path.basename(video_path))[0]
+                os.makedirs(os.path.join("output", "audio"), exist_ok=True)
+                output_path = os.path.join("output", "audio", f"{video_name}.{audio_format}")
+            video_path = local_path
         
         ffmpeg_path = get_ffmpeg_path()
         if not ffmpeg_path:
@@ -0,0 +1,88 @@
+"""
+Cooperative cancellation helpers shared by the pipeline and the model clients.
+
+Long-running work (provider polling, downloads) receives a ``threading.Event``.
+Setting the event makes the next wait/check raise ``TaskCancelledError`` so the
+worker thread unwinds instead of polling until the provider timeout.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from . import get_logger
+from .http_client import get_http_session
+
+logger = get_logger(__name__)
+
+
+_local = threading.local()
+
+
+class TaskCancelledError(RuntimeError):
+    """Raised inside a worker when its task has been cancelled."""
+
+
+@contextmanager
+def cancel_scope(cancel_event: Optional[threading.Event]):
+    """
+    Bind a cancel event to the current thread.
+
+    Lets deeply nested generation code (asset batches, motion refs) pick up the
+    task's event via ``current_cancel_event()`` without threading it through
+    every call signature.
+    """
+    previous = getattr(_local, "event", None)
+    _local.event = cancel_event
+    try:
+        yield cancel_event
+    finally:
+        _local.event = previous
+
+
+def current_cancel_event() -> Optional[threading.Event]:
+    """Returns the cancel event bound to this thread by ``cancel_scope``, if any."""
+    return getattr(_local, "event", None)
+
+
+def raise_if_cancelled(cancel_event: Optional[threading.Event], message: str = "Task cancelled"):
+    """Raise TaskCancelledError if the given event is set."""
+    if cancel_event is not None and cancel_event.is_set():
+        raise TaskCancelledError(message)
+
+
+def sleep_or_cancel(cancel_event: Optional[threading.Event], seconds: float, message: str = "Task cancelled"):
+    """
+    Sleep for ``seconds`` but wake up immediately when the task is cancelled.
+
+    Falls back to a plain ``time.sleep`` when no event is supplied.
+    """
+    if cancel_event is None:
+        time.sleep(seconds)
+        return
+    if cancel_event.wait(seconds):
+        raise TaskCancelledError(message)
+
+
+def cancel_dashscope_task(task_id: str, api_key: str) -> bool:
+    """
+    Best-effort cancel of a remote DashScope async task.
+
+    DashScope only accepts cancellation while the task is still PENDING; running
+    tasks will finish remotely and their result is simply discarded.
+    """
+    if not task_id:
+        return False
+    try:
+        response = get_http_session().post(
+            f"https://dashscope.aliyuncs.com/api/v1/tasks/{task_id}/cancel",
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=15
+        )
+        if response.status_code == 200:
+            logger.info(f"Cancelled remote DashScope task {task_id}")
+            return True
+        logger.info(f"Remote cancel not accepted for {task_id}: {response.status_code} {response.text[:200]}")
+    except Exception as e:
+        logger.warning(f"Failed to cancel remote DashScope task {task_id}: {e}")
+    return False
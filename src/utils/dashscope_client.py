@@ -0,0 +1,486 @@
+"""
+asyncio-native DashScope client.
+
+The DashScope SDK (``Generation.call``, ``VideoSynthesis.wait``,
+``SpeechSynthesizer.call``) and ``requests`` block a thread for the whole call,
+including minutes of task polling, so concurrency was capped by thread count.
+``AsyncDashScopeClient`` speaks the same endpoints over one ``aiohttp``
+session (already a dependency of the SDK): text generation (whole or
+streamed as server-sent events), async task
+create/poll/cancel for video synthesis and image generation, synchronous
+multimodal generation, and CosyVoice TTS over its WebSocket protocol. A single
+event loop can await thousands of these concurrently.
+
+Existing sync code keeps working through thin wrappers: ``run_sync`` runs a
+coroutine on a shared background loop (one connection pool for every worker
+thread), ``call_generation`` returns a response shaped like the SDK's
+``Generation.call`` result, and ``iterate_on_bridge`` lets a coroutine on
+another loop (FastAPI's) consume an async generator running on the shared
+loop.
+
+Environment:
+    LUMENX_DASHSCOPE_BASE_URL          REST base (default: DASHSCOPE_HTTP_BASE_URL or the public endpoint)
+    LUMENX_DASHSCOPE_WS_URL            WebSocket inference URL (default: DASHSCOPE_WEBSOCKET_BASE_URL or public)
+    LUMENX_DASHSCOPE_MAX_CONNECTIONS   concurrent connections per client (default: 256)
+    LUMENX_HTTP_RETRIES                retry budget per request (default: 3, shared with http_client)
+"""
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from . import get_logger
+from .cancellation import TaskCancelledError
+
+logger = get_logger(__name__)
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/api/v1"
+DEFAULT_WS_URL = "wss://dashscope.aliyuncs.com/api-ws/v1/inference"
+DEFAULT_MAX_CONNECTIONS = 256
+DEFAULT_RETRIES = 3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CONNECT_TIMEOUT = 10
+# Granularity of cancel checks while waiting between polls
+CANCEL_CHECK_SECONDS = 1.0
+
+TEXT_GENERATION_PATH = "/services/aigc/text-generation/generation"
+MULTIMODAL_GENERATION_PATH = "/services/aigc/multimodal-generation/generation"
+IMAGE_GENERATION_PATH = "/services/aigc/image-generation/generation"
+VIDEO_SYNTHESIS_PATH = "/services/aigc/video-generation/video-synthesis"
+
+
+class DashScopeError(RuntimeError):
+    """A DashScope request or task failed."""
+
+    def __init__(self, message: str, status_code: int = None, code: str = None, request_id: str = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.request_id = request_id
+
+
+class _AttrDict(dict):
+    """dict with attribute access, like the SDK's response objects (``output.choices[0].message``)."""
+
+    def __getattr__(self, name):
+        try:
+            return _wrap(self[name])
+        except KeyError:
+            return None
+
+    def __getitem__(self, key):
+        return _wrap(dict.__getitem__(self, key))
+
+
+def _wrap(value):
+    if isinstance(value, dict) and not isinstance(value, _AttrDict):
+        return _AttrDict(value)
+    if isinstance(value, list):
+        return [_wrap(v) for v in value]
+    return value
+
+
+class GenerationResponse:
+    """Result of a text generation call, with the fields callers read from the SDK response."""
+
+    def __init__(self, status_code: int, body: Dict[str, Any]):
+        self.status_code = status_code
+        self.request_id = body.get("request_id")
+        self.code = body.get("code", "")
+        self.message = body.get("message", "")
+        self.output = _wrap(body.get("output") or {})
+        self.usage = _wrap(body.get("usage") or {})
+
+
+def _api_key(api_key: Optional[str]) -> str:
+    api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+    if not api_key:
+        raise ValueError("DASHSCOPE_API_KEY not set.")
+    return api_key
+
+
+class AsyncDashScopeClient:
+    """
+    DashScope endpoints as coroutines over one pooled ``aiohttp`` session.
+
+    The session is created lazily on the loop the client is first used on and
+    belongs to that loop; use one client per loop (``get_dashscope_client``
+    returns the one bound to the shared background loop).
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = None, ws_url: str = None,
+                 max_connections: int = None):
+        self._api_key = api_key
+        self.base_url = (base_url or os.getenv("LUMENX_DASHSCOPE_BASE_URL")
+                         or os.getenv("DASHSCOPE_HTTP_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.ws_url = (ws_url or os.getenv("LUMENX_DASHSCOPE_WS_URL")
+                       or os.getenv("DASHSCOPE_WEBSOCKET_BASE_URL") or DEFAULT_WS_URL)
+        self.max_connections = max_connections or int(
+            os.getenv("LUMENX_DASHSCOPE_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS))
+        self.retries = int(os.getenv("LUMENX_HTTP_RETRIES", DEFAULT_RETRIES))
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def api_key(self) -> str:
+        # Read per call: the key can be changed at runtime from the settings page
+        return _api_key(self._api_key)
+
+    def _headers(self, async_task: bool = False, sse: bool = False) -> Dict[str, str]:
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        if async_task:
+            headers["X-DashScope-Async"] = "enable"
+        if sse:
+            headers["X-DashScope-SSE"] = "enable"
+            headers["Accept"] = "text/event-stream"
+        return headers
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "AsyncDashScopeClient":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def request(self, method: str, path: str, payload: Dict[str, Any] = None,
+                      async_task: bool = False, timeout: float = 60) -> Tuple[int, Dict[str, Any]]:
+        """
+        Sends one REST request and returns (status, JSON body).
+
+        Connection errors are retried for every method (nothing reached the
+        server); 429/5xx responses only for GET, so a task-creation POST is never
+        submitted twice.
+        """
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        client_timeout = aiohttp.ClientTimeout(total=timeout, connect=CONNECT_TIMEOUT)
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._get_session().request(
+                    method, url, json=payload, headers=self._headers(async_task), timeout=client_timeout
+                ) as response:
+                    text = await response.text()
+                    status = response.status
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == self.retries or (method != "GET" and not isinstance(e, aiohttp.ClientConnectorError)):
+                    raise
+                logger.info(f"DashScope {method} {path} failed ({e!r}); retrying")
+            else:
+                if status in RETRY_STATUSES and method == "GET" and attempt < self.retries:
+                    logger.info(f"DashScope {method} {path} returned {status}; retrying")
+                else:
+                    try:
+                        body = json.loads(text) if text else {}
+                    except ValueError:
+                        body = {"message": text}
+                    return status, body
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def generate_text(self, model: str, prompt: str = None, messages: List[Dict[str, Any]] = None,
+                            timeout: float = 300, **parameters) -> GenerationResponse:
+        """Text generation (``Generation.call``). Errors are reported in the response, like the SDK."""
+        inputs = {"messages": messages} if messages is not None else {"prompt": prompt}
+        status, body = await self.request(
+            "POST", TEXT_GENERATION_PATH, {"model": model, "input": inputs, "parameters": parameters},
+            timeout=timeout,
+        )
+        return GenerationResponse(status, body)
+
+    async def stream_text(self, model: str, prompt: str = None, messages: List[Dict[str, Any]] = None,
+                          timeout: float = 600, **parameters) -> AsyncIterator[str]:
+        """
+        Streamed text generation: yields content deltas as the model writes
+        them (``incremental_output``). Raises DashScopeError on a failed
+        request or an error event mid-stream.
+        """
+        inputs = {"messages": messages} if messages is not None else {"prompt": prompt}
+        payload = {"model": model, "input": inputs, "parameters": {**parameters, "incremental_output": True}}
+        client_timeout = aiohttp.ClientTimeout(total=timeout, connect=CONNECT_TIMEOUT)
+        async with self._get_session().post(
+            f"{self.base_url}{TEXT_GENERATION_PATH}", json=payload, headers=self._headers(sse=True),
+            timeout=client_timeout,
+        ) as response:
+            if response.status != 200:
+                text = await response.text()
+                try:
+                    body = json.loads(text)
+                except ValueError:
+                    body = {"message": text}
+                raise DashScopeError(f"Text generation failed: {body.get('message', body)}", response.status,
+                                     body.get("code"), body.get("request_id"))
+            event = None
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8").strip()
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                    continue
+                if not line.startswith("data:"):
+                    continue
+                body = json.loads(line[len("data:"):])
+                if event == "error" or body.get("code"):
+                    raise DashScopeError(f"Text generation failed: {body.get('message', body)}",
+                                         body.get("status_code"), body.get("code"), body.get("request_id"))
+                output = body.get("output") or {}
+                choices = output.get("choices")
+                delta = ((choices[0].get("message") or {}).get("content") if choices else output.get("text"))
+                if delta:
+                    yield delta
+
+    async def call(self, path: str, payload: Dict[str, Any], label: str = "DashScope",
+                   timeout: float = 300) -> Dict[str, Any]:
+        """Synchronous-mode endpoint (e.g. multimodal generation). Returns the body or raises DashScopeError."""
+        status, body = await self.request("POST", path, payload, timeout=timeout)
+        if status != 200:
+            raise DashScopeError(f"{label} API failed: {body.get('message', body)}", status,
+                                 body.get("code"), body.get("request_id"))
+        return body
+
+    async def create_task(self, path: str, payload: Dict[str, Any], label: str = "DashScope",
+                          timeout: float = 120) -> str:
+        """Submits an async task and returns its task_id."""
+        status, body = await self.request("POST", path, payload, async_task=True, timeout=timeout)
+        if status != 200:
+            raise DashScopeError(f"{label} task creation failed: {body.get('message', body)}", status,
+                                 body.get("code"), body.get("request_id"))
+        task_id = (body.get("output") or {}).get("task_id")
+        if not task_id:
+            raise DashScopeError(f"No task_id in response: {body}", status)
+        logger.info(f"Task created: {task_id}")
+        return task_id
+
+    async def get_task(self, task_id: str, timeout: float = 30) -> Tuple[int, Dict[str, Any]]:
+        return await self.request("GET", f"/tasks/{task_id}", timeout=timeout)
+
+    async def cancel_task(self, task_id: str) -> bool:
+        """Best-effort cancel; DashScope only accepts it while the task is still PENDING."""
+        try:
+            status, body = await self.request("POST", f"/tasks/{task_id}/cancel", timeout=15)
+        except Exception as e:
+            logger.warning(f"Failed to cancel remote DashScope task {task_id}: {e}")
+            return False
+        if status == 200:
+            logger.info(f"Cancelled remote DashScope task {task_id}")
+            return True
+        logger.info(f"Remote cancel not accepted for {task_id}: {status} {str(body)[:200]}")
+        return False
+
+    async def _sleep_or_cancel(self, seconds: float, cancel_event: Optional[threading.Event]):
+        deadline = time.monotonic() + seconds
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise TaskCancelledError("Task cancelled")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, CANCEL_CHECK_SECONDS) if cancel_event is not None else remaining)
+
+    async def wait_task(self, task_id: str, label: str = "DashScope", poll_interval: float = 15,
+                        max_wait: float = 900, cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """
+        Polls a task until it finishes and returns its ``output``.
+
+        Raises DashScopeError when the task fails or times out; when
+        ``cancel_event`` is set the remote task is cancelled and
+        TaskCancelledError raised.
+        """
+        elapsed = 0
+        while elapsed < max_wait:
+            try:
+                await self._sleep_or_cancel(poll_interval, cancel_event)
+            except TaskCancelledError:
+                await self.cancel_task(task_id)
+                raise
+            elapsed += poll_interval
+
+            status, body = await self.get_task(task_id)
+            if status != 200:
+                logger.warning(f"Poll request failed: {status}")
+                continue
+            output = body.get("output") or {}
+            task_status = output.get("task_status")
+            logger.info(f"Task {task_id} status: {task_status} (elapsed: {elapsed:g}s)")
+
+            if task_status == "SUCCEEDED":
+                return output
+            if task_status == "FAILED":
+                raise DashScopeError(f"{label} task failed: {output.get('code', '')} - "
+                                     f"{output.get('message', 'Unknown error')}", status, output.get("code"))
+            if task_status in ("CANCELED", "UNKNOWN"):
+                raise DashScopeError(f"{label} task {task_status}: {body}", status)
+            # PENDING or RUNNING - continue polling
+        raise DashScopeError(f"{label} task timed out after {max_wait}s")
+
+    async def run_task(self, path: str, payload: Dict[str, Any], label: str = "DashScope",
+                       poll_interval: float = 15, max_wait: float = 900,
+                       cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Creates an async task and waits for its ``output``."""
+        if cancel_event is not None and cancel_event.is_set():
+            raise TaskCancelledError("Task cancelled")
+        task_id = await self.create_task(path, payload, label)
+        return await self.wait_task(task_id, label, poll_interval, max_wait, cancel_event)
+
+    async def synthesize_video(self, payload: Dict[str, Any], label: str = None, poll_interval: float = 15,
+                               max_wait: float = 900, cancel_event: Optional[threading.Event] = None) -> str:
+        """Video synthesis task (``VideoSynthesis.call`` + ``wait``). Returns the result video URL."""
+        label = label or payload.get("model", "Video synthesis")
+        output = await self.run_task(VIDEO_SYNTHESIS_PATH, payload, label, poll_interval, max_wait, cancel_event)
+        video_url = output.get("video_url")
+        if not video_url:
+            raise DashScopeError(f"No video_url in completed task: {output}")
+        logger.info(f"Task completed. Video URL: {video_url}")
+        return video_url
+
+    async def generate_image(self, payload: Dict[str, Any], label: str = None, poll_interval: float = 10,
+                             max_wait: float = 600, cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Image generation task. Returns the task ``output`` (``choices`` or ``results``)."""
+        label = label or payload.get("model", "Image generation")
+        return await self.run_task(IMAGE_GENERATION_PATH, payload, label, poll_interval, max_wait, cancel_event)
+
+    async def synthesize_speech(self, text: str, model: str = "cosyvoice-v2", voice: str = "longxiaochun_v2",
+                                audio_format: str = "mp3", sample_rate: int = 22050, volume: int = 50,
+                                rate: float = 1.0, pitch: float = 1.0, timeout: float = 120) -> Tuple[bytes, float, str]:
+        """
+        CosyVoice TTS over the duplex WebSocket protocol (``SpeechSynthesizer.call``).
+
+        Returns (audio bytes, first package delay in ms, task id).
+        """
+        task_id = uuid.uuid4().hex
+        header = {"task_id": task_id, "streaming": "duplex"}
+        run_task = {
+            "header": dict(header, action="run-task"),
+            "payload": {
+                "model": model, "task_group": "audio", "task": "tts", "function": "SpeechSynthesizer",
+                "input": {},
+                "parameters": {
+                    "voice": voice, "volume": volume, "text_type": "PlainText", "sample_rate": sample_rate,
+                    "rate": rate, "format": audio_format, "pitch": pitch, "enable_ssml": True,
+                },
+            },
+        }
+        audio = bytearray()
+        first_package_delay = 0.0
+        sent_at = None
+        async with self._get_session().ws_connect(
+            self.ws_url, headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=aiohttp.ClientWSTimeout(ws_close=10), receive_timeout=timeout,
+        ) as ws:
+            await ws.send_str(json.dumps(run_task))
+            async for message in ws:
+                if message.type == aiohttp.WSMsgType.BINARY:
+                    if not audio and sent_at is not None:
+                        first_package_delay = (time.monotonic() - sent_at) * 1000
+                    audio.extend(message.data)
+                    continue
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    raise DashScopeError(f"TTS connection closed unexpectedly ({message.type.name})")
+                event = json.loads(message.data).get("header", {})
+                if event.get("event") == "task-started":
+                    sent_at = time.monotonic()
+                    await ws.send_str(json.dumps({
+                        "header": dict(header, action="continue-task"),
+                        "payload": {"model": model, "task_group": "audio", "task": "tts",
+                                    "function": "SpeechSynthesizer", "input": {"text": text}},
+                    }))
+                    await ws.send_str(json.dumps({"header": dict(header, action="finish-task"),
+                                                  "payload": {"input": {}}}))
+                elif event.get("event") == "task-finished":
+                    break
+                elif event.get("event") == "task-failed":
+                    raise DashScopeError(f"TTS failed: {event.get('error_code')} - {event.get('error_message')}",
+                                         code=event.get("error_code"), request_id=task_id)
+            else:
+                raise DashScopeError("TTS connection closed before the task finished")
+        return bytes(audio), first_package_delay, task_id
+
+
+# --- Sync bridge: one background loop shared by every worker thread ---
+
+_bridge_loop: Optional[asyncio.AbstractEventLoop] = None
+# Keyed by explicit API key (None: read DASHSCOPE_API_KEY per call)
+_bridge_clients: Dict[Optional[str], AsyncDashScopeClient] = {}
+_bridge_lock = threading.Lock()
+
+
+def _get_bridge_loop() -> asyncio.AbstractEventLoop:
+    global _bridge_loop
+    if _bridge_loop is None:
+        with _bridge_lock:
+            if _bridge_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="dashscope-loop", daemon=True).start()
+                _bridge_loop = loop
+    return _bridge_loop
+
+
+def get_dashscope_client(api_key: str = None) -> AsyncDashScopeClient:
+    """Returns the client bound to the shared background loop (use it through ``run_sync``)."""
+    client = _bridge_clients.get(api_key)
+    if client is None:
+        with _bridge_lock:
+            client = _bridge_clients.setdefault(api_key, AsyncDashScopeClient(api_key=api_key))
+    return client
+
+
+@atexit.register
+def _close_bridge_clients():
+    if _bridge_loop is None:
+        return
+    for client in list(_bridge_clients.values()):
+        try:
+            asyncio.run_coroutine_threadsafe(client.close(), _bridge_loop).result(timeout=5)
+        except Exception:
+            pass
+
+
+def run_sync(coro):
+    """Runs a coroutine on the shared background loop and blocks the calling thread for its result."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("run_sync() called from an event loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, _get_bridge_loop()).result()
+
+
+def call_generation(model: str, prompt: str = None, messages: List[Dict[str, Any]] = None,
+                    **parameters) -> GenerationResponse:
+    """Blocking text generation; drop-in for ``dashscope.Generation.call``."""
+    return run_sync(get_dashscope_client().generate_text(model, prompt=prompt, messages=messages, **parameters))
+
+
+async def iterate_on_bridge(agen: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """
+    Consumes an async generator that must run on the shared loop (it uses
+    ``get_dashscope_client()``) from a coroutine on another loop. Closing the
+    consumer early closes the generator on its own loop.
+    """
+    loop = _get_bridge_loop()
+    try:
+        while True:
+            future = asyncio.run_coroutine_threadsafe(agen.__anext__(), loop)
+            try:
+                yield await asyncio.wrap_future(future)
+            except StopAsyncIteration:
+                return
+    finally:
+        try:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(agen.aclose(), loop))
+        except RuntimeError as e:
+            # The cancelled __anext__ may still be unwinding on the shared loop
+            logger.debug(f"Could not close bridged generator: {e}")
@@ -0,0 +1,129 @@
+"""
+Bounded, named thread pools for blocking work called from async endpoints.
+
+Every ``async def`` endpoint runs on the single event loop thread, so a
+blocking call inside one (an LLM request, image/video generation with polling,
+ffmpeg, TTS, a large file copy) stalls every other request. Endpoints hand
+such calls to ``run_in(<pool>, fn, ...)`` instead. Each kind of work has its
+own pool, so a burst of slow renders cannot starve LLM calls or disk I/O.
+
+``LoopLagMonitor`` measures how late the loop wakes up from short sleeps and
+logs a warning when a callback blocked it longer than the threshold.
+
+Environment:
+    LUMENX_EXECUTOR_<NAME>_WORKERS   pool size, e.g. LUMENX_EXECUTOR_LLM_WORKERS
+    LUMENX_LOOP_LAG_WARN_MS          lag warning threshold (default: 200)
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from . import get_logger
+
+logger = get_logger(__name__)
+
+LLM = "llm"
+IMAGE = "image"
+VIDEO = "video"
+FFMPEG = "ffmpeg"
+IO = "io"
+
+DEFAULT_WORKERS = {
+    LLM: 8,
+    IMAGE: 4,
+    VIDEO: 4,
+    FFMPEG: max(2, (os.cpu_count() or 2) // 2),
+    IO: 8,
+}
+
+DEFAULT_LAG_WARN_MS = 200
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str) -> ThreadPoolExecutor:
+    """Returns the named pool, creating it on first use."""
+    if name not in DEFAULT_WORKERS:
+        raise ValueError(f"Unknown executor '{name}'. Available: {', '.join(DEFAULT_WORKERS)}")
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                workers = int(os.getenv(f"LUMENX_EXECUTOR_{name.upper()}_WORKERS", DEFAULT_WORKERS[name]))
+                executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=f"exec-{name}")
+                _executors[name] = executor
+    return executor
+
+
+async def run_in(name: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Runs a blocking callable on the named pool and awaits its result.
+
+    Context variables are copied into the worker, like ``asyncio.to_thread``.
+    """
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(name), partial(context.run, fn, *args, **kwargs))
+
+
+def shutdown_executors(wait: bool = False):
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=wait)
+        _executors.clear()
+
+
+class LoopLagMonitor:
+    """Samples event loop lag: how much later than scheduled a short sleep returns."""
+
+    def __init__(self, interval: float = 0.05, warn_threshold: float = None):
+        self.interval = interval
+        if warn_threshold is None:
+            warn_threshold = float(os.getenv("LUMENX_LOOP_LAG_WARN_MS", DEFAULT_LAG_WARN_MS)) / 1000
+        self.warn_threshold = warn_threshold
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.samples = 0
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.samples += 1
+            if lag >= self.warn_threshold:
+                self.stalls += 1
+                logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms")
+
+    def start(self) -> "LoopLagMonitor":
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def reset(self):
+        self.max_lag = self.last_lag = 0.0
+        self.samples = self.stalls = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "last_lag_ms": round(self.last_lag * 1000, 1),
+            "stalls": self.stalls,
+            "samples": self.samples,
+        }
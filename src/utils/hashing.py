@@ -0,0 +1,50 @@
+"""
+Content hashing helpers.
+
+Digests are memoised per (path, size, mtime) so repeated lookups of the same
+unchanged file (reference images re-used across renders) do not re-read it.
+"""
+import hashlib
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+HASH_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+_digest_cache: Dict[Tuple[str, int, int], str] = {}
+_digest_lock = threading.Lock()
+
+
+def file_sha256(path: str) -> str:
+    """Returns the hex sha256 digest of a file's contents."""
+    stat = os.stat(path)
+    cache_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        cached = _digest_cache.get(cache_key)
+    if cached:
+        return cached
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _digest_lock:
+        _digest_cache[cache_key] = digest
+    return digest
+
+
+def try_file_sha256(path: str) -> Optional[str]:
+    """Like file_sha256 but returns None if the file cannot be read."""
+    try:
+        return file_sha256(path)
+    except OSError:
+        return None
+
+
+def remember_file_sha256(path: str, digest: str):
+    """Seeds the memo with a digest computed elsewhere (e.g. while downloading the file)."""
+    stat = os.stat(path)
+    with _digest_lock:
+        _digest_cache[(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)] = digest
@@ -0,0 +1,92 @@
+"""
+Process-wide pooled HTTP client.
+
+Model clients create and poll remote tasks many times per generation, and each
+bare ``requests.get``/``requests.post`` opened (and TLS-handshook) a fresh
+connection. All outbound HTTP now goes through one ``requests.Session`` whose
+adapter keeps a keep-alive connection pool per host, retries transient
+failures and applies a default timeout, all configured here.
+
+Retries: connection errors are retried for every method (nothing reached the
+server); 429/5xx responses and read errors only for idempotent methods, so a
+task-creation POST is never submitted twice. ``requests`` speaks HTTP/1.1 only;
+the pooled keep-alive connections are what remove the per-call handshakes.
+
+Environment:
+    LUMENX_HTTP_POOL_HOSTS      hosts kept in the pool (default: 16)
+    LUMENX_HTTP_POOL_SIZE       connections kept per host (default: 32)
+    LUMENX_HTTP_RETRIES         retry budget per request (default: 3)
+    LUMENX_HTTP_TIMEOUT         default read timeout in seconds (default: 60)
+"""
+import os
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_POOL_HOSTS = 16
+DEFAULT_POOL_SIZE = 32
+DEFAULT_RETRIES = 3
+CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset(["HEAD", "GET", "OPTIONS", "PUT", "DELETE"])
+
+
+class _DefaultTimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default (connect, read) timeout when the caller sets none."""
+
+    def __init__(self, timeout, *args, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def _build_session() -> requests.Session:
+    retries = int(os.getenv("LUMENX_HTTP_RETRIES", DEFAULT_RETRIES))
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        # Hand the last response back so callers' raise_for_status()/status checks still see it
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = _DefaultTimeoutAdapter(
+        timeout=(CONNECT_TIMEOUT, float(os.getenv("LUMENX_HTTP_TIMEOUT", DEFAULT_READ_TIMEOUT))),
+        pool_connections=int(os.getenv("LUMENX_HTTP_POOL_HOSTS", DEFAULT_POOL_HOSTS)),
+        pool_maxsize=int(os.getenv("LUMENX_HTTP_POOL_SIZE", DEFAULT_POOL_SIZE)),
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Returns the shared pooled session. Use it instead of module-level ``requests`` calls."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
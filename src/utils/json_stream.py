@@ -0,0 +1,102 @@
+"""
+Incremental extraction of objects from a streamed JSON array.
+
+A streamed LLM reply arrives as arbitrary text fragments. ``JsonArrayStream``
+is fed those fragments and returns every element of the target array as soon
+as its closing brace has arrived, without waiting for the rest of the
+document. It only tracks nesting depth and string/escape state, so it also
+tolerates text around the JSON (Markdown code fences, a preamble).
+
+    stream = JsonArrayStream("frames")
+    for delta in deltas:
+        for frame in stream.feed(delta):
+            ...
+"""
+import json
+import re
+from typing import Any, List, Optional
+
+from . import get_logger
+
+logger = get_logger(__name__)
+
+
+class JsonArrayStream:
+    """
+    Emits the objects of the array under ``key`` (or of a top-level array when
+    ``key`` is None) one by one while the document is still being received.
+    Elements that fail to parse are logged and skipped.
+    """
+
+    def __init__(self, key: Optional[str] = None):
+        self._start_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key)) if key else re.compile(r"\[")
+        self._buffer = ""
+        self._pos = 0          # Next character of the buffer to scan
+        self._in_array = False
+        self._depth = 0        # Nesting depth inside the current element
+        self._element_start = None
+        self._in_string = False
+        self._escaped = False
+        self.done = False      # The array's closing bracket was seen
+        self.emitted = 0
+
+    def feed(self, text: str) -> List[Any]:
+        """Adds received text; returns the elements completed by it."""
+        if self.done or not text:
+            return []
+        self._buffer += text
+        if not self._in_array:
+            match = self._start_re.search(self._buffer)
+            if match is None:
+                return []
+            self._in_array = True
+            self._pos = match.end()
+
+        elements = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._element_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # Closing bracket of the array itself
+                    self.done = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    element = self._parse(buffer[self._element_start:i + 1])
+                    if element is not None:
+                        elements.append(element)
+                    self._element_start = None
+            i += 1
+
+        # Drop what is no longer needed: everything before the open element
+        keep_from = self._element_start if self._element_start is not None else i
+        self._buffer = buffer[keep_from:]
+        if self._element_start is not None:
+            self._element_start = 0
+        self._pos = i - keep_from
+        self.emitted += len(elements)
+        return elements
+
+    @staticmethod
+    def _parse(raw: str) -> Any:
+        try:
+            return json.loads(raw)
+        except ValueError as e:
+            logger.warning(f"Skipping malformed array element ({e}): {raw[:200]}")
+            return None
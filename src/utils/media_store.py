@@ -0,0 +1,174 @@
+"""
+Content-addressable media store.
+
+Every unique media file is kept once under ``output/blobs/<ab>/<sha256><ext>``.
+The human-facing paths the app already uses (``output/assets/...``,
+``output/video/...``, ``output/uploads/...``) become hardlinks to that blob, so
+existing URLs keep working while identical content shares one inode. The
+link count doubles as a refcount: a blob whose only remaining link is the
+store's own copy is garbage and is removed by ``gc()``.
+
+Files that cannot be hardlinked into the store (a different filesystem, no
+hardlink support) are left in place and not stored. A copy would double the
+I/O and, with a link count of 1, would look like garbage to ``gc()``.
+
+Because stored paths share an inode, nothing may rewrite one in place: writers
+create a temp file next to the target and ``os.replace()`` it, which detaches
+the path from the blob instead of changing every path that shares it.
+
+The server runs ``gc()`` once at startup (a FastAPI startup hook, never at
+import).
+
+Environment:
+    LUMENX_BLOB_DIR   blob directory (default: output/blobs)
+    LUMENX_MEDIA_GC   set to 0 to skip the startup gc (tests, tooling)
+"""
+import os
+import shutil
+import threading
+import uuid
+from typing import Optional, Tuple
+
+from . import get_logger
+from .hashing import file_sha256
+
+logger = get_logger(__name__)
+
+DEFAULT_BLOB_DIR = os.path.join("output", "blobs")
+
+
+def media_gc_enabled() -> bool:
+    return os.getenv("LUMENX_MEDIA_GC", "1") != "0"
+
+
+class MediaStore:
+    """sha256-addressed blob store with hardlink-based de-duplication."""
+
+    def __init__(self, root: str = None):
+        self.root = root or os.getenv("LUMENX_BLOB_DIR", DEFAULT_BLOB_DIR)
+        # Re-entrant: link() holds it across its ingest and the link to dest, so gc never runs in between
+        self._lock = threading.RLock()
+
+    def blob_path(self, digest: str, ext: str = "") -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}{ext.lower()}")
+
+    def _place(self, src: str, dest: str):
+        """Atomically puts a hardlink of src at dest. Raises OSError if src cannot be linked."""
+        tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        os.link(src, tmp)
+        os.replace(tmp, dest)
+
+    def ingest(self, path: str) -> Optional[str]:
+        """
+        Adds a file to the store and returns its sha256 digest.
+
+        If identical content already exists, ``path`` is replaced by a hardlink to
+        the existing blob, freeing the duplicate bytes. A path that cannot be
+        hardlinked to the store is left untouched; its digest is still returned.
+        """
+        if not path or not os.path.isfile(path):
+            return None
+        try:
+            digest = file_sha256(path)
+        except OSError as e:
+            logger.warning(f"Failed to ingest {path} into media store: {e}")
+            return None
+        blob = self.blob_path(digest, os.path.splitext(path)[1])
+        try:
+            with self._lock:
+                if os.path.exists(blob):
+                    if not os.path.samefile(path, blob):
+                        self._place(blob, path)
+                        logger.debug(f"De-duplicated {path} -> {digest[:12]}")
+                else:
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    self._place(path, blob)
+        except OSError as e:
+            logger.debug(f"Not storing {path} (cannot hardlink into {self.root}): {e}")
+        return digest
+
+    def link(self, src: str, dest: str) -> Optional[str]:
+        """
+        Makes ``dest`` refer to the same content as ``src``.
+
+        ``dest`` is a hardlink to the blob when the store holds it; otherwise
+        (src not hardlinkable into the store) it is an independent copy.
+        Returns the content digest, or None if dest could not be written.
+        """
+        with self._lock:
+            digest = self.ingest(src)
+            if not digest:
+                return None
+            blob = self.blob_path(digest, os.path.splitext(src)[1])
+            tmp = None
+            try:
+                os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+                try:
+                    self._place(blob, dest)
+                except OSError:
+                    tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+                    shutil.copyfile(src, tmp)
+                    os.replace(tmp, dest)
+            except OSError as e:
+                logger.warning(f"Failed to link {src} -> {dest}: {e}")
+                if tmp and os.path.exists(tmp):
+                    os.remove(tmp)
+                return None
+        return digest
+
+    def find(self, digest: str, ext: str = "") -> Optional[str]:
+        """Returns the blob path for a digest if it is present in the store."""
+        if not digest:
+            return None
+        blob = self.blob_path(digest, ext)
+        if os.path.exists(blob):
+            return blob
+        # Extension unknown: scan the shard directory
+        shard = os.path.dirname(blob)
+        if os.path.isdir(shard):
+            for name in os.listdir(shard):
+                if name.startswith(digest) and not name.endswith(".tmp"):
+                    return os.path.join(shard, name)
+        return None
+
+    def refcount(self, digest: str, ext: str = "") -> int:
+        """Number of paths outside the store referring to a blob."""
+        blob = self.find(digest, ext)
+        if not blob:
+            return 0
+        return max(os.stat(blob).st_nlink - 1, 0)
+
+    def gc(self) -> Tuple[int, int]:
+        """Removes blobs that are no longer linked from anywhere. Returns (count, bytes)."""
+        removed, freed = 0, 0
+        if not os.path.isdir(self.root):
+            return removed, freed
+        with self._lock:
+            for shard in os.listdir(self.root):
+                shard_dir = os.path.join(self.root, shard)
+                if not os.path.isdir(shard_dir):
+                    continue
+                for name in os.listdir(shard_dir):
+                    blob = os.path.join(shard_dir, name)
+                    try:
+                        st = os.stat(blob)
+                        if st.st_nlink <= 1:
+                            os.remove(blob)
+                            removed += 1
+                            freed += st.st_size
+                    except OSError:
+                        continue
+        if removed:
+            logger.info(f"Media store GC removed {removed} blobs ({freed / (1024 * 1024):.1f}MB)")
+        return removed, freed
+
+
+_media_store: Optional[MediaStore] = None
+
+
+def get_media_store() -> MediaStore:
+    """Returns the process-wide media store."""
+    global _media_store
+    if _media_store is None:
+        _media_store = MediaStore()
+    return _media_store
@@ -0,0 +1,225 @@
+"""
+Read-through local cache of OSS-hosted media.
+
+With OSS configured, stored media URLs can be object keys rather than files
+under ``output/``. ffmpeg work (merge, export, audio extraction) needs local
+paths, so ``resolve`` returns the local file when there is one and otherwise
+downloads the object into ``output/cache/oss``. Cached copies are named by
+object key and ETag, so an overwritten object is fetched again, and the
+directory is evicted least-recently-used once it exceeds its size budget.
+Entries resolved inside ``hold()`` are pinned until the block exits, so a
+merge or export never loses an input to another job's eviction.
+``resolve_many`` fetches several objects in parallel with bounded concurrency,
+reporting progress and stopping when its cancel event is set.
+
+Environment:
+    LUMENX_OSS_CACHE_DIR       cache directory (default: output/cache/oss)
+    LUMENX_OSS_CACHE_MAX_MB    size budget in MB (default: 4096)
+    LUMENX_OSS_CACHE_WORKERS   concurrent downloads (default: 4)
+"""
+import contextvars
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from . import get_logger
+from .cancellation import TaskCancelledError, raise_if_cancelled
+from .oss_utils import OSSImageUploader, is_object_key
+from .result_cache import evict_lru
+
+logger = get_logger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join("output", "cache", "oss")
+DEFAULT_MAX_MB = 4096
+DEFAULT_WORKERS = 4
+# How long a HEAD result (object key -> ETag) is trusted before asking OSS again
+ETAG_TRUST_SECONDS = 300
+
+# Entries pinned by the innermost OSSMediaCache.hold() of the current context
+_current_hold: contextvars.ContextVar = contextvars.ContextVar("oss_media_cache_hold", default=None)
+
+
+class OSSMediaCache:
+    """LRU disk cache of OSS objects keyed by object key + ETag."""
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None, workers: int = None):
+        self.cache_dir = cache_dir or os.getenv("LUMENX_OSS_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("LUMENX_OSS_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.workers = workers or int(os.getenv("LUMENX_OSS_CACHE_WORKERS", DEFAULT_WORKERS))
+        self._etags: Dict[str, Tuple[str, float]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._pins: Dict[str, int] = {}
+        self._pins_lock = threading.Lock()
+
+    def _entry_path(self, object_key: str, etag: str) -> str:
+        key_hash = hashlib.sha256(object_key.encode("utf-8")).hexdigest()
+        ext = os.path.splitext(object_key)[1].lower()
+        return os.path.join(self.cache_dir, key_hash[:2], f"{key_hash}_{etag}{ext}")
+
+    def _key_lock(self, object_key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(object_key, threading.Lock())
+
+    def _etag(self, bucket, object_key: str) -> str:
+        cached = self._etags.get(object_key)
+        if cached and time.time() - cached[1] < ETAG_TRUST_SECONDS:
+            return cached[0]
+        etag = bucket.head_object(object_key).etag.strip('"').lower()
+        self._etags[object_key] = (etag, time.time())
+        return etag
+
+    def is_remote(self, ref: Optional[str]) -> bool:
+        """Whether resolving ``ref`` needs OSS (an object key with no local file)."""
+        return bool(ref) and is_object_key(ref) and not os.path.isfile(os.path.join("output", ref))
+
+    def resolve(self, ref: Optional[str], cancel_event: Optional[threading.Event] = None) -> Optional[str]:
+        """
+        Absolute local path for a stored media reference (path relative to
+        ``output/``, local path or OSS object key), downloading OSS objects on a
+        cache miss. Returns None when the media cannot be found; raises
+        TaskCancelledError when ``cancel_event`` is set during a download.
+        """
+        path, fetched = self._resolve(ref, cancel_event, _current_hold.get())
+        if fetched:
+            self._evict(keep=[path])
+        return path
+
+    def _resolve(self, ref: Optional[str], cancel_event: Optional[threading.Event],
+                 held: Optional[Set[str]]) -> Tuple[Optional[str], bool]:
+        """(local path, whether it was downloaded now); never evicts."""
+        if not ref or ref.startswith(("http://", "https://")):
+            return None, False
+        for candidate in (os.path.join("output", ref), ref):
+            if os.path.isfile(candidate):
+                return os.path.abspath(candidate), False
+        if not is_object_key(ref):
+            return None, False
+        uploader = OSSImageUploader()
+        if not uploader.is_configured:
+            return None, False
+        try:
+            return self._fetch(uploader.bucket, ref, cancel_event, held)
+        except TaskCancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"OSS cache: could not fetch {ref}: {e}")
+            return None, False
+
+    def _fetch(self, bucket, object_key: str, cancel_event: Optional[threading.Event],
+               held: Optional[Set[str]]) -> Tuple[str, bool]:
+        raise_if_cancelled(cancel_event, "Download cancelled")
+        with self._key_lock(object_key):
+            etag = self._etag(bucket, object_key)
+            path = os.path.abspath(self._entry_path(object_key, etag))
+            # Pin before the file is in place, so a concurrent eviction cannot race the consumer
+            self._pin(path, held)
+            if os.path.isfile(path):
+                os.utime(path, None)  # Bump recency for LRU
+                return path, False
+
+            start = time.time()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            try:
+                # The progress callback runs between reads, so a cancel aborts mid-download
+                result = bucket.get_object_to_file(
+                    object_key, tmp_path,
+                    progress_callback=lambda *_: raise_if_cancelled(cancel_event, "Download cancelled"))
+                fetched_etag = (getattr(result, "etag", None) or etag).strip('"').lower()
+                if fetched_etag != etag:
+                    # Object was replaced between HEAD and GET; file it under what we actually got
+                    self._etags[object_key] = (fetched_etag, time.time())
+                    path = os.path.abspath(self._entry_path(object_key, fetched_etag))
+                    self._pin(path, held)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            logger.info(f"OSS cache: fetched {object_key} ({size_mb:.1f}MB, {time.time() - start:.2f}s)")
+        return path, True
+
+    def resolve_many(self, refs: List[Optional[str]], cancel_event: Optional[threading.Event] = None,
+                     on_progress: Callable[[int, int], None] = None) -> List[Optional[str]]:
+        """
+        ``resolve`` for several references, downloading misses in parallel. Order
+        is preserved. ``on_progress(done, total)`` is called as remote objects
+        finish; a set ``cancel_event`` stops pending and running downloads.
+        The cache is evicted once afterwards, never below the returned files.
+        """
+        remote = [r for r in refs if self.is_remote(r)]
+        held = _current_hold.get()
+        done = [0]
+        done_lock = threading.Lock()
+
+        def resolve_one(ref):
+            path, fetched = self._resolve(ref, cancel_event, held)
+            if on_progress and fetched:
+                with done_lock:
+                    done[0] += 1
+                    on_progress(done[0], len(remote))
+            return path
+
+        if len(remote) <= 1:
+            paths = [resolve_one(r) for r in refs]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(remote)), thread_name_prefix="oss-cache") as pool:
+                paths = list(pool.map(resolve_one, refs))
+        if remote:
+            self._evict(keep=[p for p in paths if p])
+        return paths
+
+    # --- Pinning: entries in use by a running job are never evicted ---
+
+    @contextmanager
+    def hold(self):
+        """
+        Pins every cache entry resolved inside the block (including by
+        ``resolve_many`` workers) until the block exits, so eviction triggered
+        by other jobs cannot delete inputs a running ffmpeg job still reads.
+        """
+        held: Set[str] = set()
+        token = _current_hold.set(held)
+        try:
+            yield
+        finally:
+            _current_hold.reset(token)
+            with self._pins_lock:
+                for path in held:
+                    self._pins[path] -= 1
+                    if not self._pins[path]:
+                        del self._pins[path]
+            if held:
+                self._evict()
+
+    def _pin(self, path: str, held: Optional[Set[str]]):
+        if held is None:
+            return
+        with self._pins_lock:
+            if path not in held:
+                held.add(path)
+                self._pins[path] = self._pins.get(path, 0) + 1
+
+    def _evict(self, keep: List[str] = ()):
+        with self._pins_lock:
+            protected = set(self._pins)
+        protected.update(os.path.abspath(p) for p in keep)
+        evict_lru(self.cache_dir, self.max_bytes, keep=protected)
+
+_oss_media_cache: Optional[OSSMediaCache] = None
+
+
+def get_oss_media_cache() -> OSSMediaCache:
+    """Returns the process-wide OSS media cache."""
+    global _oss_media_cache
+    if _oss_media_cache is None:
+        _oss_media_cache = OSSMediaCache()
+    return _oss_media_cache
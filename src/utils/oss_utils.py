@@ -1,9 +1,15 @@
 import os
 import oss2
 import hashlib
+import json
+import threading
 import time
-from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Dict, Any
+from oss2.models import PartInfo
 from . import get_logger
+from .downloader import tee_download
+from .hashing import try_file_sha256
 
 logger = get_logger(__name__)
 
@@ -12,6 +18,26 @@ DEFAULT_OSS_BASE_PATH = "lumenx"
 SIGN_URL_EXPIRES_DISPLAY = 7200  # 2 hours for frontend display
 SIGN_URL_EXPIRES_API = 1800      # 30 minutes for AI API calls
 
+# Content hash -> Object Key index for model input uploads
+UPLOAD_INDEX_FILE = os.path.join("output", "oss_upload_index.json")
+UPLOAD_INDEX_TRUST_SECONDS = 6 * 3600  # Re-verify existence (HEAD) after 6 hours
+
+# Files at least this large go through oss2's resumable (checkpointed, parallel multipart) upload
+RESUMABLE_UPLOAD_THRESHOLD = 10 * 1024 * 1024
+RESUMABLE_PART_SIZE = 4 * 1024 * 1024
+RESUMABLE_UPLOAD_THREADS = 4
+RESUMABLE_CHECKPOINT_DIR = os.path.join("output", "cache", "oss_upload_checkpoints")
+
+# Streaming result uploads (remote URL -> OSS multipart, teed to the local copy)
+STREAM_PART_SIZE = 8 * 1024 * 1024
+STREAM_PARTS_IN_FLIGHT = 2
+RESULT_SUB_PATH = "results"
+
+
+def stream_results_enabled() -> bool:
+    """Whether model results are piped from their URL into OSS while downloading (LUMENX_OSS_STREAM_RESULTS, default on)."""
+    return os.getenv("LUMENX_OSS_STREAM_RESULTS", "1") != "0"
+
 
 def is_oss_configured() -> bool:
     """Check if OSS is properly configured."""
@@ -77,6 +103,54 @@ def is_local_path(value: str) -> bool:
     return value.startswith(("assets/", "storyboard/", "video/", "audio/", "export/", "uploads/", "output/"))
 
 
+class UploadIndex:
+    """
+    Persistent map from file content hash to the OSS Object Key it was uploaded to.
+
+    Lets repeated renders reuse an already-uploaded reference image or video and
+    only re-sign the URL instead of uploading the same bytes again.
+    """
+
+    def __init__(self, path: str = UPLOAD_INDEX_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save upload index: {e}")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._load().get(key)
+            return dict(entry) if entry else None
+
+    def put(self, key: str, object_key: str):
+        with self._lock:
+            self._load()[key] = {"object_key": object_key, "verified_at": time.time()}
+            self._save()
+
+    def drop(self, key: str):
+        with self._lock:
+            if self._load().pop(key, None) is not None:
+                self._save()
+
+
 class OSSImageUploader:
     """
     OSS Uploader supporting Private OSS + Dynamic Signing strategy.
@@ -95,6 +169,8 @@ class OSSImageUploader:
             cls._instance = super().__new__(cls)
             cls._instance._initialized = False
             cls._instance._url_cache = {}  # (object_key, expires) -> (signed_url, timestamp)
+            cls._instance._upload_index = UploadIndex()
+            cls._instance._streamed = {}  # abs local path -> (object_key, size, mtime_ns)
         return cls._instance
     
     def __init__(self):
@@ -175,15 +251,38 @@ class OSSImageUploader:
         if not os.path.exists(local_path):
             logger.error(f"File not found: {local_path}")
             return None
+
+        filename = custom_filename or os.path.basename(local_path)
+        object_key = self._build_object_key(sub_path, filename)
+
+        streamed = self._streamed_object_key(local_path)
+        if streamed == object_key:
+            return object_key
+        if streamed:
+            try:
+                # Server-side copy into the caller's layout; the local file is not read again
+                self.bucket.copy_object(self.bucket_name, streamed, object_key)
+                logger.info(f"Copied streamed result in OSS: {streamed} -> {object_key}")
+                return object_key
+            except Exception as e:
+                logger.warning(f"OSS copy of {streamed} failed, uploading {local_path} instead: {e}")
         
         try:
-            filename = custom_filename or os.path.basename(local_path)
-            object_key = self._build_object_key(sub_path, filename)
-            
             logger.info(f"Uploading to OSS: {local_path} -> {object_key}")
             
-            with open(local_path, 'rb') as f:
-                result = self.bucket.put_object(object_key, f)
+            if os.path.getsize(local_path) >= RESUMABLE_UPLOAD_THRESHOLD:
+                # Parallel multipart with on-disk checkpoints: a retried upload skips finished parts
+                result = oss2.resumable_upload(
+                    self.bucket, object_key, local_path,
+                    store=oss2.ResumableStore(root=os.path.abspath(os.path.dirname(RESUMABLE_CHECKPOINT_DIR)),
+                                              dir=os.path.basename(RESUMABLE_CHECKPOINT_DIR)),
+                    multipart_threshold=RESUMABLE_UPLOAD_THRESHOLD,
+                    part_size=RESUMABLE_PART_SIZE,
+                    num_threads=RESUMABLE_UPLOAD_THREADS
+                )
+            else:
+                with open(local_path, 'rb') as f:
+                    result = self.bucket.put_object(object_key, f)
             
             if result.status == 200:
                 logger.info(f"Upload success: {object_key}")
@@ -196,6 +295,124 @@ class OSSImageUploader:
             logger.error(f"OSS upload error: {e}")
             return None
     
+    def upload_input_file(self, local_path: str, sub_path: str = "temp") -> Optional[str]:
+        """
+        Upload a model input (reference image/video), reusing a previous upload of the same content.
+
+        Objects are named by content hash, and the hash -> Object Key mapping is kept
+        in a persistent index, so a repeat call only costs a signature (plus an
+        occasional existence check) instead of a full upload.
+        """
+        if not self.bucket:
+            logger.warning("OSS not configured, cannot upload file.")
+            return None
+
+        digest = try_file_sha256(local_path)
+        if not digest:
+            return self.upload_file(local_path, sub_path)
+
+        index_key = f"{self.bucket_name}/{self.base_path}/{digest}"
+        entry = self._upload_index.get(index_key)
+        if entry:
+            object_key = entry["object_key"]
+            fresh = time.time() - entry.get("verified_at", 0) < UPLOAD_INDEX_TRUST_SECONDS
+            if fresh or self.object_exists(object_key):
+                if not fresh:
+                    self._upload_index.put(index_key, object_key)
+                logger.info(f"Reusing uploaded input for {os.path.basename(local_path)}: {object_key}")
+                return object_key
+            self._upload_index.drop(index_key)
+
+        ext = os.path.splitext(local_path)[1].lower()
+        object_key = self.upload_file(local_path, sub_path, custom_filename=f"{digest}{ext}")
+        if object_key:
+            self._upload_index.put(index_key, object_key)
+        return object_key
+
+    def _streamed_object_key(self, local_path: str) -> Optional[str]:
+        """Object key of a local copy written by upload_from_url, if the file is unchanged since."""
+        entry = self._streamed.get(os.path.abspath(local_path))
+        if not entry:
+            return None
+        try:
+            stat = os.stat(local_path)
+        except OSError:
+            return None
+        return entry[0] if (stat.st_size, stat.st_mtime_ns) == entry[1:] else None
+
+    def upload_from_url(self, url: str, local_copy_path: str, sub_path: str = RESULT_SUB_PATH,
+                        cancel_event=None) -> Optional[str]:
+        """
+        Streams a remote file (e.g. a DashScope result URL) into OSS and into
+        ``local_copy_path`` in one pass, and returns the Object Key.
+
+        The body is cut into multipart-upload parts in flight; parts upload on a
+        small pool while the next one downloads. ``tee_download`` hashes and
+        length/MD5-checks the same bytes, and the upload is only completed once
+        that check passed (otherwise it is aborted). A later ``upload_file`` of
+        the unchanged local copy reuses this object (server-side copy when it
+        asks for another key), and the content hash is registered so
+        ``upload_input_file`` reuses it too.
+        """
+        if not self.bucket:
+            logger.warning("OSS not configured, cannot upload file.")
+            return None
+
+        object_key = self._build_object_key(sub_path, os.path.basename(local_copy_path))
+        buffer = bytearray()
+        upload_id = None
+        parts, futures = [], []
+        start = time.time()
+
+        def upload_part(number: int, data: bytes):
+            result = self.bucket.upload_part(object_key, upload_id, number, data)
+            return PartInfo(number, result.etag)
+
+        pool = ThreadPoolExecutor(max_workers=STREAM_PARTS_IN_FLIGHT, thread_name_prefix="oss-stream")
+
+        def sink(chunk: bytes):
+            nonlocal upload_id
+            buffer.extend(chunk)
+            if len(buffer) < STREAM_PART_SIZE:
+                return
+            if upload_id is None:
+                upload_id = self.bucket.init_multipart_upload(object_key).upload_id
+            # Bound memory: wait for the oldest part before queueing more
+            if len(futures) - len(parts) >= STREAM_PARTS_IN_FLIGHT:
+                parts.append(futures[len(parts)].result())
+            futures.append(pool.submit(upload_part, len(futures) + 1, bytes(buffer)))
+            buffer.clear()
+
+        try:
+            info = tee_download(url, local_copy_path, sink, cancel_event=cancel_event)
+            if upload_id is None:
+                # Small result: one plain PUT
+                self.bucket.put_object(object_key, bytes(buffer))
+            else:
+                if buffer:
+                    futures.append(pool.submit(upload_part, len(futures) + 1, bytes(buffer)))
+                parts.extend(f.result() for f in futures[len(parts):])
+                self.bucket.complete_multipart_upload(object_key, upload_id, parts)
+        except BaseException:
+            pool.shutdown(wait=True)
+            if upload_id is not None:
+                try:
+                    self.bucket.abort_multipart_upload(object_key, upload_id)
+                except Exception as e:
+                    logger.warning(f"Failed to abort multipart upload {object_key}: {e}")
+            raise
+        pool.shutdown(wait=True)
+
+        stat = os.stat(local_copy_path)
+        self._streamed[os.path.abspath(local_copy_path)] = (object_key, stat.st_size, stat.st_mtime_ns)
+        self._upload_index.put(f"{self.bucket_name}/{self.base_path}/{info['sha256']}", object_key)
+
+        elapsed = max(time.time() - start, 1e-6)
+        size = info["bytes"]
+        logger.info(f"Streamed {size / (1024 * 1024):.1f}MB to OSS {object_key} in {elapsed:.2f}s "
+                    f"({size * 8 / elapsed / 1e6:.1f} Mbit/s, {max(len(parts), 1)} part(s))")
+        return object_key
+
     def generate_signed_url(self, object_key: str, expires: int = SIGN_URL_EXPIRES_DISPLAY) -> str:
         """
         Generate a signed URL for accessing a private OSS object.
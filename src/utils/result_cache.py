@@ -0,0 +1,174 @@
+"""
+Content-addressed cache for generation results.
+
+A DashScope request with a fixed seed is reproducible, so its output can be
+served from disk the next time the exact same request (model, prompt, size,
+seed, reference image contents, ...) is issued. Entries live under
+``output/cache/results`` and are evicted least-recently-used once the cache
+exceeds its size budget.
+
+Environment:
+    LUMENX_RESULT_CACHE          set to "0" to disable the cache
+    LUMENX_RESULT_CACHE_DIR      cache directory (default: output/cache/results)
+    LUMENX_RESULT_CACHE_MAX_MB   size budget in MB (default: 2048)
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from . import get_logger
+from .hashing import try_file_sha256
+
+logger = get_logger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join("output", "cache", "results")
+DEFAULT_MAX_MB = 2048
+
+
+def _normalize_ref(ref: str) -> str:
+    """
+    Turns a reference (local path, OSS object key or URL) into a stable token.
+
+    Local files are identified by content, signed URLs by their path without the
+    expiring query string, and object keys by the key itself.
+    """
+    if not ref:
+        return ""
+    if ref.startswith(("http://", "https://")):
+        parts = urlsplit(ref)
+        return f"url:{parts.netloc}{parts.path}"
+    for candidate in (ref, os.path.join("output", ref)):
+        if os.path.isfile(candidate):
+            digest = try_file_sha256(candidate)
+            if digest:
+                return f"sha256:{digest}"
+    return f"key:{ref}"
+
+
+class GenerationResultCache:
+    """Size-bounded LRU of generated media files, keyed by request fingerprint."""
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None, enabled: bool = None):
+        self.cache_dir = cache_dir or os.getenv("LUMENX_RESULT_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("LUMENX_RESULT_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        if enabled is None:
+            enabled = os.getenv("LUMENX_RESULT_CACHE", "1") != "0"
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def make_key(self, kind: str, params: Dict[str, Any], refs: List[str] = None) -> str:
+        """
+        Builds the cache key from normalized request params and reference contents.
+
+        References are positional (R2V "character1/character2", image references
+        by index), so they are keyed in the order given, empty slots included.
+        """
+        fingerprint = {
+            "kind": kind,
+            "params": {k: v for k, v in sorted(params.items()) if v is not None},
+            "refs": [_normalize_ref(r) for r in (refs or [])],
+        }
+        blob = json.dumps(fingerprint, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}{ext}")
+
+    def fetch(self, key: str, output_path: str) -> bool:
+        """Copies a cached result to output_path. Returns True on a hit."""
+        if not self.enabled or not key:
+            return False
+        entry = self._entry_path(key, os.path.splitext(output_path)[1])
+        if not os.path.isfile(entry):
+            return False
+        # output_path may be a media store hardlink: replace it, never write through it
+        tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            shutil.copyfile(entry, tmp_path)
+            os.replace(tmp_path, output_path)
+            os.utime(entry, None)  # Bump recency for LRU
+            logger.info(f"Result cache hit: {key[:12]} -> {output_path}")
+            return True
+        except OSError as e:
+            logger.warning(f"Result cache read failed for {key[:12]}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def store(self, key: str, source_path: str):
+        """Adds a freshly generated file to the cache, then enforces the size budget."""
+        if not self.enabled or not key or not os.path.isfile(source_path):
+            return
+        entry = self._entry_path(key, os.path.splitext(source_path)[1])
+        tmp_path = f"{entry}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, entry)
+        except OSError as e:
+            logger.warning(f"Result cache write failed for {key[:12]}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        """Deletes least-recently-used entries until the cache fits its budget."""
+        with self._lock:
+            evict_lru(self.cache_dir, self.max_bytes)
+
+
+def evict_lru(root: str, max_bytes: int, keep: Iterable[str] = ()) -> int:
+    """
+    Deletes the least-recently-used files under ``root`` (by mtime) until the
+    directory fits in ``max_bytes``, never deleting the absolute paths in
+    ``keep``. Returns the remaining size in bytes.
+    """
+    keep = set(keep)
+    entries = []
+    total = 0
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    if total <= max_bytes:
+        return total
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if keep and os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            continue
+    logger.info(f"Evicted {root} down to {total / (1024 * 1024):.1f}MB")
+    return total
+
+
+_result_cache: Optional[GenerationResultCache] = None
+
+
+def get_result_cache() -> GenerationResultCache:
+    """Returns the process-wide result cache."""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = GenerationResultCache()
+    return _result_cache
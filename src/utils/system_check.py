@@ -47,6 +47,27 @@ def get_ffmpeg_path() -> str:
     return None
 
 
+def get_ffprobe_path() -> str:
+    """
+    Get path to ffprobe binary.
+    
+    Looks next to the resolved ffmpeg binary first (bundles ship both together),
+    then falls back to system PATH.
+    
+    Returns:
+        Path to ffprobe executable, or None if not found
+    """
+    ffprobe_name = 'ffprobe.exe' if platform.system() == 'Windows' else 'ffprobe'
+    
+    ffmpeg_path = get_ffmpeg_path()
+    if ffmpeg_path:
+        sibling = os.path.join(os.path.dirname(ffmpeg_path), ffprobe_name)
+        if os.path.exists(sibling) and os.access(sibling, os.X_OK):
+            return sibling
+    
+    return shutil.which("ffprobe")
+
+
 def check_ffmpeg() -> Tuple[bool, str]:
     """
     Check if ffmpeg is available and get version info.